@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import asyncio
+import math
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+from fastapi import HTTPException
+
+from mini_cursor.core.config import (
+    Colors, MAX_CONCURRENT_TURNS, MAX_QUEUED_TURNS, MAX_TURNS_PER_WORKSPACE, TURN_QUEUE_TIMEOUT,
+)
+
+# 估算Retry-After时使用的初始平均轮次耗时（秒），之后按实际耗时滑动平均
+INITIAL_TURN_SECONDS = 10.0
+# 平均轮次耗时的平滑系数
+TURN_SECONDS_ALPHA = 0.2
+
+
+class TurnTicket:
+    """一次被准入的对话轮次，结束时必须调用release()（可重复调用）"""
+
+    def __init__(self, controller: "AdmissionController", workspace: Optional[str],
+                 session_lock: Optional[asyncio.Lock] = None):
+        self.controller = controller
+        self.workspace = workspace
+        self.session_lock = session_lock
+        self.started = time.monotonic()
+        self.released = False
+
+    def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """/chat对话轮次的准入控制
+
+    - 同一会话同时只能有一个轮次，会话中已有轮次在执行或排队时返回429；
+    - 同时执行的轮次不超过max_concurrent，其余请求按先后顺序排队；
+    - 排队数超过max_queued或排队超过queue_timeout时返回503；
+    - 请求指定了工作区时，同一工作区进行中（执行+排队）的轮次超过max_per_workspace时返回429。
+      未指定工作区的请求（例如Web界面）不受此限制。
+    拒绝的响应带有根据平均轮次耗时估算的Retry-After头。
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_TURNS, max_queued: int = MAX_QUEUED_TURNS,
+                 max_per_workspace: int = MAX_TURNS_PER_WORKSPACE, queue_timeout: float = TURN_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.max_per_workspace = max_per_workspace
+        self.queue_timeout = queue_timeout
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.active = 0
+        self.queued = 0
+        self.workspace_turns: Dict[str, int] = defaultdict(int)
+        self.avg_turn_seconds = INITIAL_TURN_SECONDS
+        # 指标
+        self.admitted = 0
+        self.rejected_queue_full = 0
+        self.rejected_workspace = 0
+        self.rejected_session_busy = 0
+        self.queue_timeouts = 0
+        self.total_queue_wait = 0.0
+        self.max_queue_wait = 0.0
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # 延迟创建，确保绑定到服务运行时的事件循环
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    def retry_after(self) -> int:
+        """估算排队中的轮次全部开始执行所需的秒数"""
+        waves = (self.queued + 1) / max(self.max_concurrent, 1)
+        return max(1, math.ceil(self.avg_turn_seconds * waves))
+
+    def _reject(self, status_code: int, message: str) -> HTTPException:
+        retry_after = self.retry_after()
+        print(f"{Colors.YELLOW}Rejecting chat turn ({status_code}): {message}, retry after {retry_after}s{Colors.ENDC}")
+        return HTTPException(
+            status_code=status_code,
+            detail={"status": "error", "message": message, "retry_after": retry_after},
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    async def acquire(self, workspace: Optional[str] = None, session_lock: Optional[asyncio.Lock] = None) -> TurnTicket:
+        """等待执行名额
+
+        Args:
+            workspace: 请求指定的工作区，None表示不受单个工作区的限制
+            session_lock: 会话锁，准入时获得，轮次结束（ticket.release）时释放
+
+        Raises:
+            HTTPException: 429（会话中已有轮次/工作区超限）或503（队列已满/排队超时）
+        """
+        if session_lock is not None and session_lock.locked():
+            self.rejected_session_busy += 1
+            raise self._reject(429, "A turn is already running in this session")
+        if workspace is not None and self.workspace_turns[workspace] >= self.max_per_workspace:
+            self.rejected_workspace += 1
+            raise self._reject(429, f"Too many concurrent turns for workspace {workspace}")
+        if self.semaphore.locked() and self.queued >= self.max_queued:
+            self.rejected_queue_full += 1
+            raise self._reject(503, "Server is busy, chat queue is full")
+
+        # 会话锁未被持有，获取时不会等待；排队期间同一会话的后续请求因此立即收到429
+        if session_lock is not None:
+            await session_lock.acquire()
+        if workspace is not None:
+            self.workspace_turns[workspace] += 1
+        self.queued += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self.semaphore.acquire(), timeout=self.queue_timeout)
+        except BaseException as e:
+            self._leave(workspace, session_lock)
+            if isinstance(e, asyncio.TimeoutError):
+                self.queue_timeouts += 1
+                raise self._reject(503, f"Timed out after {self.queue_timeout}s waiting for a chat slot")
+            raise
+        finally:
+            self.queued -= 1
+
+        wait = time.monotonic() - start
+        self.total_queue_wait += wait
+        self.max_queue_wait = max(self.max_queue_wait, wait)
+        self.admitted += 1
+        self.active += 1
+        return TurnTicket(self, workspace, session_lock)
+
+    def _release(self, ticket: TurnTicket) -> None:
+        duration = time.monotonic() - ticket.started
+        self.avg_turn_seconds += TURN_SECONDS_ALPHA * (duration - self.avg_turn_seconds)
+        self.active -= 1
+        self._leave(ticket.workspace, ticket.session_lock)
+        self.semaphore.release()
+
+    def _leave(self, workspace: Optional[str], session_lock: Optional[asyncio.Lock]) -> None:
+        if session_lock is not None:
+            session_lock.release()
+        if workspace is None:
+            return
+        self.workspace_turns[workspace] -= 1
+        if self.workspace_turns[workspace] <= 0:
+            del self.workspace_turns[workspace]
+
+    def snapshot(self) -> Dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+            "max_per_workspace": self.max_per_workspace,
+            "admitted": self.admitted,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_workspace": self.rejected_workspace,
+            "rejected_session_busy": self.rejected_session_busy,
+            "queue_timeouts": self.queue_timeouts,
+            "avg_queue_wait": self.total_queue_wait / self.admitted if self.admitted else 0.0,
+            "max_queue_wait": self.max_queue_wait,
+            "avg_turn_seconds": self.avg_turn_seconds,
+        }
+
+
+admission_controller = AdmissionController()
@@ -5,11 +5,15 @@ import platform
 import traceback
 from pathlib import Path
 
+from fastapi import Request
+
 from mini_cursor.core.mcp_client import MCPClient
+from mini_cursor.api.session_manager import SessionManager, ChatSession
 from mini_cursor.core.server_manager import ServerManager
+from mini_cursor.core.tool_broker import BrokerServerManager
+from mini_cursor.core.config import get_tool_broker_socket
 from mini_cursor.core.tool_manager import ToolManager
-from mini_cursor.core.message_manager import MessageManager
-from mini_cursor.core.database import get_db_manager
+from mini_cursor.core.database import get_db_manager, get_async_db_manager, get_write_behind_queue
 
 # 获取操作系统版本
 os_version = platform.platform()
@@ -20,7 +24,9 @@ shell_path = os.environ.get('SHELL', '未知')
 # 服务器和管理器缓存
 server_manager_cache = {}
 tool_manager_cache = {}
-client_cache = {}
+# 会话管理器：每个浏览器会话拥有独立的客户端状态
+session_manager = SessionManager()
+SESSION_HEADER = "X-Session-ID"
 # 错误状态缓存
 configuration_errors = {}
 
@@ -34,8 +40,9 @@ async def get_managers():
     pid = os.getpid()
     
     if pid not in server_manager_cache:
-        # 创建服务器管理器和工具管理器
-        server_manager = ServerManager()
+        # 创建服务器管理器和工具管理器；启用工具代理时，MCP会话由主机上唯一的代理进程持有
+        broker_socket = get_tool_broker_socket()
+        server_manager = BrokerServerManager(broker_socket) if broker_socket else ServerManager()
         tool_manager = ToolManager()
         
         try:
@@ -62,43 +69,40 @@ async def get_managers():
     
     return server_manager_cache[pid], tool_manager_cache[pid]
 
-async def get_client():
-    """获取或创建 MCP 客户端实例"""
-    # 使用进程 ID 作为缓存键，确保每个进程使用独立的客户端实例
+async def get_session(request: Request) -> ChatSession:
+    """获取当前请求所属的会话
+    
+    会话ID来自请求头 X-Session-ID 或查询参数 session_id，未提供时使用默认会话。
+    所有会话共享当前进程的服务器管理器和工具管理器。
+    """
     pid = os.getpid()
+    session_id = request.headers.get(SESSION_HEADER) or request.query_params.get("session_id")
     
-    if pid not in client_cache:
-        # 获取服务器管理器和工具管理器
-        server_manager, tool_manager = await get_managers()
-        
-        # 创建消息管理器
-        message_manager = MessageManager()
-        
-        # 创建客户端实例
-        client = MCPClient()
-        client.server_manager = server_manager
-        client.tool_manager = tool_manager
-        client.message_manager = message_manager
-        
-        try:
-            if pid in configuration_errors:
-                configuration_errors[pid].pop('openai_api', None)
-        except Exception as e:
-            # 捕获所有异常，但仍然返回部分功能的客户端
-            error_msg = f"OpenAI客户端初始化失败: {str(e)}"
-            traceback_str = traceback.format_exc()
-            if pid not in configuration_errors:
-                configuration_errors[pid] = {}
-            configuration_errors[pid]['openai_api'] = {
-                'error': error_msg,
-                'traceback': traceback_str
-            }
-            print(f"警告: {error_msg}")
-        
-        # 无论初始化是否成功，都缓存客户端
-        client_cache[pid] = client
+    # 获取服务器管理器和工具管理器
+    server_manager, tool_manager = await get_managers()
     
-    return client_cache[pid]
+    try:
+        session = session_manager.get_session(session_id, server_manager, tool_manager)
+        if pid in configuration_errors:
+            configuration_errors[pid].pop('openai_api', None)
+    except Exception as e:
+        error_msg = f"OpenAI客户端初始化失败: {str(e)}"
+        traceback_str = traceback.format_exc()
+        if pid not in configuration_errors:
+            configuration_errors[pid] = {}
+        configuration_errors[pid]['openai_api'] = {
+            'error': error_msg,
+            'traceback': traceback_str
+        }
+        print(f"警告: {error_msg}")
+        raise
+    
+    return session
+
+async def get_client(request: Request) -> MCPClient:
+    """获取当前会话的 MCP 客户端实例"""
+    session = await get_session(request)
+    return session.client
 
 def get_configuration_errors():
     """获取当前进程的配置错误"""
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+
+import asyncio
+import json
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from mini_cursor.core.config import Colors, SSE_QUEUE_MAX_EVENTS, SSE_QUEUE_MAX_BYTES, SSE_OVERFLOW_POLICY
+
+# 可以合并的增量事件类型：同类型的连续增量会被拼接成一个更大的SSE帧
+COALESCIBLE_EVENTS = {"assistant_message", "thinking"}
+
+# 缓冲区满时的处理策略
+OVERFLOW_POLICIES = ("coalesce", "drop_thinking", "cancel")
+
+
+class ChannelOverflowError(Exception):
+    """客户端读取过慢，缓冲区溢出（cancel策略）"""
+
+
+class ChannelMetrics:
+    """所有事件通道的汇总指标"""
+
+    def __init__(self):
+        self.active_channels = 0
+        self.queue_depth = 0
+        self.peak_queue_depth = 0
+        self.events_in = 0
+        self.events_out = 0
+        self.coalesced_events = 0
+        self.dropped_thinking = 0
+        self.cancelled_turns = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        return dict(vars(self))
+
+
+channel_metrics = ChannelMetrics()
+
+
+def _payload_size(data: Any) -> int:
+    """事件内容的大小（字符数），控制事件按JSON序列化后的长度估算"""
+    if isinstance(data, str):
+        return len(data)
+    return len(json.dumps(data, ensure_ascii=False, default=str))
+
+
+class _Event:
+    __slots__ = ("type", "data", "parts", "size")
+
+    def __init__(self, event_type: str, data: Any, size: int):
+        self.type = event_type
+        self.data = data
+        self.size = size
+        # 可合并的增量先放入列表，输出时再拼接
+        self.parts = [data] if event_type in COALESCIBLE_EVENTS and isinstance(data, str) else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = "".join(self.parts) if self.parts is not None else self.data
+        return {"type": self.type, "data": data}
+
+
+class EventChannel:
+    """从process_query到SSE响应生成器的有界事件通道
+
+    生产者通过put()按顺序写入事件（同步调用，不创建任务），通过close()写入结束标记；
+    消费者使用 async for 读取事件，收到结束标记后迭代结束，无需轮询任务状态。
+
+    缓冲区中的事件数达到max_size时按policy处理，避免读取缓慢的客户端让内存无限增长：
+    - coalesce: 将新的message/thinking增量合并到队尾的同类型事件中
+    - drop_thinking: 丢弃新的thinking增量，message增量按coalesce处理
+    - cancel: 关闭通道并调用on_overflow（通常用于取消本轮对话）
+    工具调用等控制事件从不丢弃或合并，在coalesce/drop_thinking策略下可以超出max_size追加，
+    但和增量一样计入事件数和数据量。合并不会减少数据量，因此缓冲的数据量超过max_bytes时
+    （drop_thinking策略下的thinking增量仍然丢弃）无论哪种策略都按cancel处理。
+
+    coalesce_window大于0时，同类型的连续message/thinking增量会在该时间窗口内合并为一个事件，
+    减少SSE帧数量；遇到其他类型的事件会立即结束合并，保持事件顺序不变。
+    """
+
+    def __init__(self, coalesce_window: float = 0.0, max_size: int = SSE_QUEUE_MAX_EVENTS,
+                 policy: str = SSE_OVERFLOW_POLICY, on_overflow: Optional[Callable[[], None]] = None,
+                 max_bytes: int = SSE_QUEUE_MAX_BYTES):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown SSE overflow policy: {policy}")
+        self.coalesce_window = coalesce_window
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.on_overflow = on_overflow
+        self.error: Optional[BaseException] = None
+        self._buffer: deque = deque()
+        self._buffered_bytes = 0
+        self._ready = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._closed = False
+        self._finished = False
+        channel_metrics.active_channels += 1
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def put(self, event_type: str, data: Any) -> None:
+        """写入一个事件（可以从其他线程调用）"""
+        if self._in_loop_thread():
+            self._put(event_type, data)
+        else:
+            self._loop.call_soon_threadsafe(self._put, event_type, data)
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        """写入结束标记；error不为空时消费者可以通过channel.error获取"""
+        if self._in_loop_thread():
+            self._close(error)
+        else:
+            self._loop.call_soon_threadsafe(self._close, error)
+
+    def _in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _put(self, event_type: str, data: Any) -> None:
+        if self._closed:
+            return
+        channel_metrics.events_in += 1
+        buffer = self._buffer
+        is_delta = event_type in COALESCIBLE_EVENTS and isinstance(data, str)
+        size = _payload_size(data)
+        over_bytes = self._buffered_bytes + size > self.max_bytes
+        if over_bytes or len(buffer) >= self.max_size:
+            if self.policy == "drop_thinking" and event_type == "thinking" and is_delta:
+                channel_metrics.dropped_thinking += 1
+                return
+            if self.policy == "cancel" or over_bytes:
+                self._overflow()
+                return
+            tail = buffer[-1] if buffer else None
+            if is_delta and tail is not None and tail.type == event_type and tail.parts is not None:
+                tail.parts.append(data)
+                tail.size += size
+                self._buffered_bytes += size
+                channel_metrics.coalesced_events += 1
+                return
+        buffer.append(_Event(event_type, data, size))
+        self._buffered_bytes += size
+        channel_metrics.queue_depth += 1
+        if channel_metrics.queue_depth > channel_metrics.peak_queue_depth:
+            channel_metrics.peak_queue_depth = channel_metrics.queue_depth
+        self._ready.set()
+
+    def _overflow(self) -> None:
+        """缓冲区溢出：关闭通道并通知生产者取消本轮对话"""
+        print(f"{Colors.YELLOW}SSE buffer overflow ({len(self._buffer)} events, {self._buffered_bytes} chars), "
+              f"cancelling turn{Colors.ENDC}")
+        channel_metrics.cancelled_turns += 1
+        self._close(ChannelOverflowError("Client is reading too slowly, turn cancelled"))
+        if self.on_overflow is not None:
+            self.on_overflow()
+
+    def _close(self, error: Optional[BaseException]) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self.error = error
+        self._ready.set()
+
+    def _pop(self) -> _Event:
+        channel_metrics.queue_depth -= 1
+        channel_metrics.events_out += 1
+        event = self._buffer.popleft()
+        self._buffered_bytes -= event.size
+        return event
+
+    def _finish(self) -> None:
+        """迭代结束：释放剩余的缓冲并更新指标（只执行一次）"""
+        if self._finished:
+            return
+        self._finished = True
+        channel_metrics.queue_depth -= len(self._buffer)
+        self._buffer.clear()
+        self._buffered_bytes = 0
+        channel_metrics.active_channels -= 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Dict[str, Any]:
+        while not self._buffer:
+            if self._closed:
+                self._finish()
+                raise StopAsyncIteration
+            self._ready.clear()
+            await self._ready.wait()
+
+        event = self._pop()
+        if self.coalesce_window > 0 and event.parts is not None:
+            await self._coalesce(event)
+        return event.to_dict()
+
+    async def _coalesce(self, first: _Event) -> None:
+        """等待一个时间窗口，然后合并缓冲区中同类型的连续增量"""
+        await asyncio.sleep(self.coalesce_window)
+        buffer = self._buffer
+        while buffer and buffer[0].type == first.type and buffer[0].parts is not None:
+            first.parts.extend(self._pop().parts)
+            channel_metrics.coalesced_events += 1
+
+    async def aclose(self) -> None:
+        """消费者提前退出（例如客户端断开）时调用"""
+        self._close(None)
+        self._finish()
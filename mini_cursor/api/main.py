@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import asyncio
 import os
 import sys
 from contextlib import asynccontextmanager
@@ -9,10 +10,13 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 import pathlib
 
-from mini_cursor.core.config import Colors, OPENAI_BASE_URL, OPENAI_MODEL, TOOL_CALL_TIMEOUT, VERBOSE_LOGGING
-from mini_cursor.api.dependencies import static_dir, client_cache, server_manager_cache, tool_manager_cache
+from mini_cursor.core.config import (
+    Colors, OPENAI_BASE_URL, OPENAI_MODEL, TOOL_CALL_TIMEOUT, VERBOSE_LOGGING,
+    TOOL_BROKER_ENV, get_tool_broker_socket, default_tool_broker_socket,
+)
+from mini_cursor.api.dependencies import static_dir, session_manager, server_manager_cache, tool_manager_cache
 from mini_cursor.api.routers import root, tools, chat, config, conversations
-from mini_cursor.core.database import get_db_manager
+from mini_cursor.core.database import get_async_db_manager, close_async_db_manager, close_write_behind_queue
 
 # 定义生命周期管理器
 @asynccontextmanager
@@ -22,22 +26,34 @@ async def lifespan(app: FastAPI):
     
     # 初始化SQLite数据库（如果不存在）
     print("正在检查SQLite数据库...")
-    db = get_db_manager()
+    db = get_async_db_manager()
     print("数据库检查完成")
+    # 在后台为尚未索引的历史消息补建全文索引
+    reindex_task = asyncio.create_task(db.reindex_search())
     
     yield  # 应用在此处运行
     
     # yield 之后的代码会在应用关闭时执行
     # 清理资源
-    for pid, client in client_cache.items():
-        await client.close()
+    await session_manager.close_all()
     
     for pid, server_manager in server_manager_cache.items():
         await server_manager.close()
     
-    client_cache.clear()
     server_manager_cache.clear()
     tool_manager_cache.clear()
+    
+    reindex_task.cancel()
+    try:
+        await reindex_task
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        print(f"全文索引补建失败: {e}")
+    
+    # 先写入写后队列中剩余的对话，再等待未完成的写操作并关闭数据库连接
+    await close_write_behind_queue()
+    await close_async_db_manager()
 
 # 创建 FastAPI 应用
 app = FastAPI(
@@ -74,12 +90,20 @@ if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 7727))
     host = os.environ.get("HOST", "0.0.0.0")
+    workers = int(os.environ.get("WORKERS", 1))
+    
+    # 多worker时共享一个工具代理，避免每个worker各自启动一套MCP服务器子进程
+    if workers > 1 and not get_tool_broker_socket():
+        os.environ[TOOL_BROKER_ENV] = default_tool_broker_socket()
     
     print(f"{Colors.BOLD}{Colors.CYAN}Mini Cursor API Server{Colors.ENDC}")
     print(f"{Colors.CYAN}Python version: {sys.version}{Colors.ENDC}")
     print(f"{Colors.CYAN}OpenAI API Base URL: {OPENAI_BASE_URL}{Colors.ENDC}")
     print(f"{Colors.CYAN}Using model: {OPENAI_MODEL}{Colors.ENDC}")
     print(f"{Colors.CYAN}Tool call timeout: {TOOL_CALL_TIMEOUT}s{Colors.ENDC}")
+    print(f"{Colors.CYAN}Workers: {workers}{Colors.ENDC}")
+    if get_tool_broker_socket():
+        print(f"{Colors.CYAN}Tool broker socket: {get_tool_broker_socket()}{Colors.ENDC}")
     print(f"{Colors.CYAN}Listening on: http://{host}:{port}{Colors.ENDC}")
     
-    uvicorn.run("mini_cursor.api.main:app", host=host, port=port, reload=False) 
\ No newline at end of file
+    uvicorn.run("mini_cursor.api.main:app", host=host, port=port, reload=False, workers=workers) 
\ No newline at end of file
@@ -35,6 +35,11 @@ class ConversationResponse(BaseModel):
     summary: Optional[str] = None
     turns: int
 
+class ConversationPage(BaseModel):
+    """对话列表的一页，next_cursor为空表示没有更多"""
+    items: List[ConversationResponse]
+    next_cursor: Optional[str] = None
+
 class LoadConversationRequest(BaseModel):
     conversation_id: str
 
@@ -49,6 +49,9 @@ async def update_openai_config(request: OpenAIConfigRequest, client: MCPClient =
 
         for key, value in env_content.items():
             set_key(env_file_path, key, value)
+        
+        # 立即刷新配置快照，并在凭证变化时重建OpenAI客户端
+        client.update_config()
     
         return {
             "status": "ok",
@@ -94,9 +97,12 @@ async def update_mcp_config(request: MCPConfigRequest, client: MCPClient = Depen
         with open(config_path, "w", encoding="utf-8") as f:
             json.dump(request.config, f, indent=4, ensure_ascii=False)
         
-        # 重新连接MCP服务器
-        await client.server_manager.close()
-        await client.server_manager.connect_to_servers(client.tool_manager)
+        # 重新连接MCP服务器（使用工具代理时由代理进程重新加载配置）
+        if hasattr(client.server_manager, 'reconnect_servers'):
+            await client.server_manager.reconnect_servers(client.tool_manager)
+        else:
+            await client.server_manager.close()
+            await client.server_manager.connect_to_servers(client.tool_manager)
         
         return {
             "status": "ok",
@@ -1,41 +1,100 @@
 #!/usr/bin/env python3
 
-from fastapi import APIRouter, Depends, Query
-from typing import List
+import json
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, Optional
 
 from mini_cursor.core.mcp_client import MCPClient
-from mini_cursor.api.dependencies import get_client, get_db_manager
-from mini_cursor.api.models import ConversationResponse, LoadConversationRequest
+from mini_cursor.api.dependencies import get_client, get_async_db_manager, get_write_behind_queue
+from mini_cursor.api.models import ConversationPage, LoadConversationRequest
+from mini_cursor.core.config import DETAIL_STREAM_BATCH_SIZE
 
 router = APIRouter(
     prefix="/conversations",
     tags=["conversations"],
 )
 
-@router.get("", response_model=List[ConversationResponse])
-async def get_conversations(limit: int = Query(10, ge=1, le=50)):
+async def _get_conversations_page(limit: int, cursor: Optional[str]) -> Dict[str, Any]:
+    db = get_async_db_manager()
+    try:
+        return await db.get_conversations_page(limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+@router.get("", response_model=ConversationPage)
+async def get_conversations(limit: int = Query(10, ge=1, le=50), cursor: Optional[str] = None):
     """
     获取最近的对话历史列表
     
     Args:
-        limit: 返回的最大对话数量，默认10条，最大50条
+        limit: 每页的最大对话数量，默认10条，最大50条
+        cursor: 上一页返回的next_cursor，不传时返回最新的一页
+    """
+    return await _get_conversations_page(limit, cursor)
+
+@router.get("/all", response_model=ConversationPage)
+async def get_all_conversations(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
     """
-    db = get_db_manager()
-    conversations = db.get_recent_conversations(limit)
+    按页浏览全部历史对话
     
-    return conversations
+    按更新时间倒序排列，包含对话ID、时间、摘要等信息；
+    使用返回的next_cursor请求下一页，next_cursor为空表示已经到底
+    
+    Args:
+        limit: 每页的最大对话数量，默认50条，最大200条
+        cursor: 上一页返回的next_cursor
+    """
+    return await _get_conversations_page(limit, cursor)
 
-@router.get("/all", response_model=List[ConversationResponse])
-async def get_all_conversations():
+@router.get("/search")
+async def search_conversations(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
     """
-    获取全部历史对话列表，不分页
+    在历史对话中全文搜索
     
-    返回所有历史对话记录，按更新时间倒序排列，包含对话ID、时间、摘要等信息
+    搜索用户和助手的消息内容以及工具名称和参数，多个以空格分隔的关键词需同时出现，
+    结果按相关度排序，每条命中包含对话ID、标题、消息序号和带【】标记的摘要
+    
+    Args:
+        q: 搜索关键词
+        limit: 返回的最大命中数，默认20条，最大100条
+    """
+    try:
+        db = get_async_db_manager()
+        results = await db.search_conversations(q, limit)
+        return {
+            "status": "ok",
+            "results": results
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"搜索对话时出错: {str(e)}"
+        }
+
+@router.post("/search/reindex")
+async def reindex_conversations(full: bool = False):
     """
-    db = get_db_manager()
-    conversations = db.get_all_conversations()
+    补建全文索引
+    
+    默认只索引尚未索引的消息；full为true时清空后重建全部索引。分批提交，不阻塞正在进行的对话
     
-    return conversations
+    Args:
+        full: 是否完整重建
+    """
+    try:
+        db = get_async_db_manager()
+        await db.reindex_search(full=full)
+        return {
+            "status": "ok",
+            "message": "全文索引已更新"
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"更新全文索引时出错: {str(e)}"
+        }
 
 @router.get("/{conversation_id}")
 async def get_conversation(conversation_id: str):
@@ -45,8 +104,10 @@ async def get_conversation(conversation_id: str):
     Args:
         conversation_id: 对话ID
     """
-    db = get_db_manager()
-    conversation = db.get_conversation(conversation_id)
+    # 先等待该对话在写后队列中的写入，保证能读到刚结束的轮次
+    await get_write_behind_queue().wait_for(conversation_id)
+    db = get_async_db_manager()
+    conversation = await db.get_conversation(conversation_id)
     
     if not conversation:
         return {
@@ -68,57 +129,31 @@ async def load_conversation(request: LoadConversationRequest, client: MCPClient
         conversation_id: 要加载的对话ID
     """
     try:
-        db = get_db_manager()
-        conversation = db.get_conversation(request.conversation_id)
+        await get_write_behind_queue().wait_for(request.conversation_id)
+        db = get_async_db_manager()
+        info = await db.get_conversation_info(request.conversation_id)
         
-        if not conversation:
+        if not info:
             return {
                 "status": "error",
                 "message": f"找不到ID为 {request.conversation_id} 的对话记录"
             }
         
-        # 清空当前会话历史
-        client.message_manager.clear_message_history()
+        # 使用保存的原始消息（包含tool_calls和工具结果），一次性载入，恢复后模型不会重复调用已执行过的工具；
+        # 升级前保存的轮次没有原始消息，由数据库用用户和助手的文本补齐
+        chat_messages = await db.get_chat_messages(request.conversation_id)
+        
+        client.message_manager.load_history(chat_messages, info.get("system_prompt"))
         
         # 设置当前对话ID
         client.current_conversation_id = request.conversation_id
         
-        # 从数据库中的JSON加载对话历史
-        if 'content' in conversation:
-            content = conversation['content']
-            
-            # 设置系统提示
-            if content.get('system_prompt'):
-                # 添加系统消息
-                system_message = {
-                    "role": "system", 
-                    "content": content.get('system_prompt')
-                }
-                client.message_manager.message_history = [system_message]
-            
-            # 加载消息历史
-            for msg in content.get('messages', []):
-                if msg.get('sender') == 'user':
-                    # 添加用户消息
-                    client.message_manager.add_user_message(
-                        msg.get('content', ''),
-                        None  # 不更新系统提示
-                    )
-                elif msg.get('sender') == 'assistant':
-                    # 添加助手消息
-                    client.message_manager.add_assistant_message(
-                        llm_response=msg
-                    )
-                elif msg.get('sender') == 'tool':
-                    # 跳过工具消息，它们会在下一轮对话中重新生成
-                    pass
-        
         return {
             "status": "ok",
             "message": "历史对话已加载",
             "conversation_id": request.conversation_id,
-            "title": conversation.get('title', ''),
-            "turns": conversation.get('turns', 0)
+            "title": info.get('title', ''),
+            "turns": info.get('turns', 0)
         }
         
     except Exception as e:
@@ -136,8 +171,10 @@ async def delete_conversation(conversation_id: str, client: MCPClient = Depends(
         conversation_id: 要删除的对话ID
     """
     try:
-        db = get_db_manager()
-        result = db.delete_conversation(conversation_id)
+        # 待写入的轮次会重新创建对话，删除前先等待它们完成
+        await get_write_behind_queue().wait_for(conversation_id)
+        db = get_async_db_manager()
+        result = await db.delete_conversation(conversation_id)
         
         # 如果删除的是当前对话，清空当前会话状态
         if client.current_conversation_id == conversation_id:
@@ -154,58 +191,88 @@ async def delete_conversation(conversation_id: str, client: MCPClient = Depends(
             "message": f"删除对话时出错: {str(e)}"
         }
 
+def _detail_message(msg: Dict[str, Any], include_tool_results: bool) -> Dict[str, Any]:
+    """将消息转换为前端友好的格式"""
+    message_data = {
+        "type": msg.get("sender", "unknown"),
+        "seq": msg.get("seq"),
+        "timestamp": msg.get("timestamp", "")
+    }
+    
+    # 根据消息类型处理不同字段
+    if msg.get("sender") in ("user", "assistant"):
+        message_data["content"] = msg.get("content", "")
+    elif msg.get("sender") == "tool":
+        message_data["tool_name"] = msg.get("tool_name", "")
+        message_data["tool_args"] = msg.get("tool_args", "")
+        message_data["is_error"] = msg.get("is_error", False)
+        message_data["tool_result_size"] = msg.get("tool_result_size", 0)
+        if include_tool_results:
+            message_data["tool_result"] = msg.get("tool_result", "")
+    
+    return message_data
+
+def _detail_header(info: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": info["id"],
+        "title": info["title"],
+        "created_at": info["created_at"],
+        "updated_at": info["updated_at"],
+        "summary": info.get("summary", ""),
+        "turns": info["turns"],
+        "system_prompt": info.get("system_prompt", ""),
+        "last_seq": info["last_seq"]
+    }
+
 @router.get("/detail/{conversation_id}")
-async def get_conversation_detail(conversation_id: str):
+async def get_conversation_detail(
+    conversation_id: str,
+    after_seq: Optional[int] = Query(None, ge=0),
+    before_seq: Optional[int] = Query(None, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    tail: bool = False,
+    include_tool_results: bool = True
+):
     """
     获取特定对话的完整记录
     
-    返回对话的所有轮次内容，包括用户输入、AI回复、工具调用等详细信息，
-    以便前端还原完整对话过程
+    返回对话的轮次内容，包括用户输入、AI回复、工具调用等详细信息，
+    以便前端还原完整对话过程。不传范围参数时返回全部消息
     
     Args:
         conversation_id: 对话ID
+        after_seq: 只返回序号大于该值的消息（向后翻页）
+        before_seq: 只返回序号小于该值的最新limit条消息（向前翻页）
+        limit: 最多返回的消息数
+        tail: 返回最新的limit条消息，用于先显示最近的轮次
+        include_tool_results: 是否返回工具结果内容，为false时只返回tool_result_size，
+            需要时通过 /conversations/detail/{conversation_id}/tool_result/{seq} 获取
     """
     try:
-        db = get_db_manager()
-        conversation = db.get_conversation(conversation_id)
+        await get_write_behind_queue().wait_for(conversation_id)
+        db = get_async_db_manager()
+        info = await db.get_conversation_info(conversation_id)
         
-        if not conversation:
+        if not info:
             return {
                 "status": "error",
                 "message": f"找不到ID为 {conversation_id} 的对话记录"
             }
         
-        # 提取对话基本信息
-        conversation_detail = {
-            "id": conversation["id"],
-            "title": conversation["title"],
-            "created_at": conversation["created_at"],
-            "updated_at": conversation["updated_at"],
-            "summary": conversation.get("summary", ""),
-            "turns": conversation["turns"],
-            "system_prompt": conversation["content"].get("system_prompt", ""),
-            "messages": []
-        }
+        # 多取一条用于判断该方向上是否还有更多消息
+        messages = await db.get_messages(
+            conversation_id, after_seq, before_seq,
+            limit + 1 if limit is not None else None,
+            from_end=tail, include_tool_results=include_tool_results
+        )
+        has_more = limit is not None and len(messages) > limit
+        if has_more:
+            # 倒序翻页时多出的一条是最早的消息
+            messages = messages[1:] if (tail or before_seq is not None) else messages[:-1]
         
-        # 整理消息记录，将其转换为前端友好的格式
-        if "content" in conversation and "messages" in conversation["content"]:
-            for msg in conversation["content"]["messages"]:
-                message_data = {
-                    "type": msg.get("sender", "unknown"),
-                    "timestamp": msg.get("timestamp", "")
-                }
-                
-                # 根据消息类型处理不同字段
-                if msg.get("sender") == "user":
-                    message_data["content"] = msg.get("content", "")
-                elif msg.get("sender") == "assistant":
-                    message_data["content"] = msg.get("content", "")
-                elif msg.get("sender") == "tool":
-                    message_data["tool_name"] = msg.get("tool_name", "")
-                    message_data["tool_args"] = msg.get("tool_args", "")
-                    message_data["tool_result"] = msg.get("tool_result", "")
-                
-                conversation_detail["messages"].append(message_data)
+        conversation_detail = _detail_header(info)
+        conversation_detail["messages"] = [_detail_message(msg, include_tool_results) for msg in messages]
+        conversation_detail["has_more"] = has_more
         
         return {
             "status": "ok",
@@ -217,6 +284,78 @@ async def get_conversation_detail(conversation_id: str):
             "message": f"获取对话详情时出错: {str(e)}"
         }
 
+@router.get("/detail/{conversation_id}/stream")
+async def stream_conversation_detail(
+    conversation_id: str,
+    after_seq: int = Query(0, ge=0),
+    include_tool_results: bool = True
+):
+    """
+    以NDJSON流式返回对话记录
+    
+    第一行是type为conversation的对话元数据，之后每行一条消息（type为user/assistant/tool）。
+    服务端按批读取消息，前端可以边接收边渲染，不需要一次解析整个对话
+    
+    Args:
+        conversation_id: 对话ID
+        after_seq: 只返回序号大于该值的消息
+        include_tool_results: 是否返回工具结果内容
+    """
+    await get_write_behind_queue().wait_for(conversation_id)
+    db = get_async_db_manager()
+    info = await db.get_conversation_info(conversation_id)
+    
+    if not info:
+        return {
+            "status": "error",
+            "message": f"找不到ID为 {conversation_id} 的对话记录"
+        }
+    
+    async def generate():
+        yield json.dumps({"type": "conversation", **_detail_header(info)}, ensure_ascii=False) + "\n"
+        last_seq = after_seq
+        while True:
+            messages = await db.get_messages(
+                conversation_id, after_seq=last_seq, limit=DETAIL_STREAM_BATCH_SIZE,
+                include_tool_results=include_tool_results
+            )
+            for msg in messages:
+                yield json.dumps(_detail_message(msg, include_tool_results), ensure_ascii=False) + "\n"
+            if len(messages) < DETAIL_STREAM_BATCH_SIZE:
+                break
+            last_seq = messages[-1]["seq"]
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@router.get("/detail/{conversation_id}/tool_result/{seq}")
+async def get_tool_result(conversation_id: str, seq: int):
+    """
+    获取单条工具消息的结果，配合 include_tool_results=false 按需加载
+    
+    Args:
+        conversation_id: 对话ID
+        seq: 工具消息的序号
+    """
+    try:
+        db = get_async_db_manager()
+        tool_result = await db.get_tool_result(conversation_id, seq)
+        
+        if tool_result is None:
+            return {
+                "status": "error",
+                "message": f"找不到对话 {conversation_id} 中序号为 {seq} 的工具结果"
+            }
+        
+        return {
+            "status": "ok",
+            "tool_result": tool_result
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"获取工具结果时出错: {str(e)}"
+        }
+
 @router.post("/clear")
 async def clear_conversation(client: MCPClient = Depends(get_client)):
     """
@@ -229,8 +368,8 @@ async def clear_conversation(client: MCPClient = Depends(get_client)):
         client.message_manager.clear_message_history()
         
         # 创建新的会话ID
-        db = get_db_manager()
-        new_conversation_id = db.create_conversation()
+        db = get_async_db_manager()
+        new_conversation_id = await db.create_conversation()
         
         # 更新客户端的当前会话ID
         client.current_conversation_id = new_conversation_id
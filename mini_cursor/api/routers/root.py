@@ -3,14 +3,17 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
 
-from mini_cursor.core.config import OPENAI_MODEL, OPENAI_BASE_URL, TOOL_CALL_TIMEOUT
+from mini_cursor.core.config import get_config, TOOL_CALL_TIMEOUT
 from mini_cursor.api.dependencies import static_dir, get_configuration_errors
+from mini_cursor.api.event_channel import channel_metrics
+from mini_cursor.api.admission import admission_controller
 
 router = APIRouter()
 
 @router.get("/", response_class=HTMLResponse)
 async def root():
     """根路径，提供API信息和演示页面链接"""
+    OPENAI_MODEL = get_config().model
     return f"""
     <html>
         <head>
@@ -77,12 +80,13 @@ async def api_info():
     """API信息端点"""
     config_errors = get_configuration_errors()
     has_errors = bool(config_errors)
+    conf = get_config()
     
     response = {
         "status": "warning" if has_errors else "ok",
         "name": "Mini Cursor API",
-        "model": OPENAI_MODEL,
-        "base_url": OPENAI_BASE_URL,
+        "model": conf.model,
+        "base_url": conf.base_url,
         "tool_call_timeout": TOOL_CALL_TIMEOUT
     }
     
@@ -90,4 +94,14 @@ async def api_info():
         response["configuration_errors"] = config_errors
         response["message"] = "检测到配置错误，请访问配置页面修复问题，或检查终端日志获取详情"
         
-    return response 
\ No newline at end of file
+    return response
+
+
+@router.get("/metrics")
+async def metrics():
+    """运行指标：SSE事件缓冲的队列深度和丢弃计数，以及/chat准入控制的排队情况"""
+    return {
+        "status": "ok",
+        "sse": channel_metrics.snapshot(),
+        "admission": admission_controller.snapshot()
+    }
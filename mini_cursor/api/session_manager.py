@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, Set
+
+from mini_cursor.core.config import Colors, MAX_SESSIONS, SESSION_IDLE_TIMEOUT
+from mini_cursor.core.mcp_client import MCPClient
+
+# 请求未携带会话ID时使用的默认会话
+DEFAULT_SESSION_ID = "default"
+
+
+@dataclass
+class ChatSession:
+    """单个浏览器会话的客户端状态"""
+    session_id: str
+    client: MCPClient
+    # 同一会话内的对话轮次串行执行，避免消息历史交错
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    last_used: float = field(default_factory=time.monotonic)
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+
+class SessionManager:
+    """按会话隔离的MCPClient管理器
+
+    每个会话拥有独立的MessageManager、当前对话ID和更新监听器，
+    所有会话共享同一个ServerManager和ToolManager（即同一组MCP服务器连接）。
+    超过最大会话数时按LRU回收，空闲超时的会话在访问时被清理；正在处理请求的会话不会被回收。
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        # 被回收会话的关闭任务，保留引用避免被垃圾回收，close_all时等待完成
+        self._closing: Set[asyncio.Task] = set()
+
+    def get_session(self, session_id: Optional[str], server_manager, tool_manager) -> ChatSession:
+        """获取或创建会话，并将其标记为最近使用"""
+        session_id = session_id or DEFAULT_SESSION_ID
+        session = self.sessions.get(session_id)
+        if session is None:
+            client = MCPClient(server_manager=server_manager, tool_manager=tool_manager)
+            session = ChatSession(session_id=session_id, client=client)
+            self.sessions[session_id] = session
+        else:
+            self.sessions.move_to_end(session_id)
+        session.last_used = time.monotonic()
+
+        self._evict(keep=session_id)
+        return session
+
+    def _evict(self, keep: str) -> None:
+        """回收空闲超时的会话，以及超出数量上限的最久未使用会话"""
+        now = time.monotonic()
+        expired = [
+            session_id for session_id, session in self.sessions.items()
+            if session_id != keep and not session.busy and now - session.last_used > self.idle_timeout
+        ]
+        for session_id in expired:
+            self._close_session(self.sessions.pop(session_id))
+
+        if len(self.sessions) <= self.max_sessions:
+            return
+        for session_id in list(self.sessions.keys()):
+            if len(self.sessions) <= self.max_sessions:
+                break
+            session = self.sessions[session_id]
+            if session_id == keep or session.busy:
+                continue
+            self._close_session(self.sessions.pop(session_id))
+
+    def _close_session(self, session: ChatSession) -> None:
+        # 会话客户端不拥有共享的管理器，关闭时只会释放自身的OpenAI客户端
+        print(f"{Colors.YELLOW}Evicting idle session: {session.session_id}{Colors.ENDC}")
+        task = asyncio.ensure_future(session.client.close())
+        self._closing.add(task)
+        task.add_done_callback(self._on_closed)
+
+    def _on_closed(self, task: asyncio.Task) -> None:
+        self._closing.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"{Colors.RED}Error closing session client: {task.exception()}{Colors.ENDC}")
+
+    async def close_all(self) -> None:
+        """关闭所有会话，并等待已回收会话的关闭任务完成"""
+        sessions = list(self.sessions.values())
+        self.sessions.clear()
+        for session in sessions:
+            await session.client.close()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
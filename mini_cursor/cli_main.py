@@ -134,6 +134,47 @@ def web():
         server_process.wait(timeout=5)  # 给服务器一些关闭时间
         console.print("[bold green]Web服务器已停止[/bold green]")
 
+@cli.group()
+def db():
+    """对话数据库维护"""
+    pass
+
+@db.command()
+@click.option("--max-age-days", type=int, default=None, help="归档超过该天数未更新的对话（默认读取 DB_RETENTION_DAYS，0 表示不限制）")
+@click.option("--max-size-mb", type=int, default=None, help="数据库超过该大小时从最旧的对话开始归档（默认读取 DB_MAX_SIZE_MB，0 表示不限制）")
+@click.option("--archive-dir", type=click.Path(file_okay=False), default=None, help="归档目录（默认为数据库所在目录下的 archive）")
+@click.option("--dry-run", is_flag=True, help="只统计将被归档的对话，不做修改")
+@click.option("--no-vacuum", is_flag=True, help="归档后不释放数据库空闲页")
+def maintain(max_age_days, max_size_mb, archive_dir, dry_run, no_vacuum):
+    """归档冷对话、批量删除并压缩数据库文件"""
+    from mini_cursor.core.database import get_db_manager, close_db_manager
+    from mini_cursor.core.database.retention import RetentionManager, RetentionPolicy
+    console = Console()
+    defaults = RetentionPolicy()
+    policy = RetentionPolicy(
+        max_age_days=defaults.max_age_days if max_age_days is None else max_age_days,
+        max_size_mb=defaults.max_size_mb if max_size_mb is None else max_size_mb,
+        archive_dir=archive_dir or defaults.archive_dir,
+    )
+    try:
+        report = RetentionManager(get_db_manager(), policy).run(dry_run=dry_run, vacuum=not no_vacuum)
+    finally:
+        close_db_manager()
+
+    def size_mb(stats):
+        return f"{stats['file_bytes'] / 1024 / 1024:.2f} MB (使用 {stats['live_bytes'] / 1024 / 1024:.2f} MB)"
+
+    table = Table(show_header=True, header_style="bold magenta")
+    table.add_column("项目", style="cyan", no_wrap=True)
+    table.add_column("结果", style="white")
+    table.add_row("将归档的对话" if dry_run else "已归档对话", str(report.archived))
+    for path in report.archive_files:
+        table.add_row("归档文件", path)
+    table.add_row("释放页数", str(report.freed_pages))
+    table.add_row("维护前", size_mb(report.size_before))
+    table.add_row("维护后", size_mb(report.size_after))
+    console.print(table)
+
 @cli.command()
 def help():
     """显示所有可用命令及简要说明"""
@@ -148,6 +189,7 @@ def help():
         ("init", "初始化生成 mcp_config.json"),
         ("web", "启动Web界面并在浏览器中打开"),
         ("completion", "生成自动补全脚本 (bash/zsh/fish)"),
+        ("db maintain", "归档冷对话并压缩对话数据库"),
         ("help", "显示所有可用命令及简要说明")
     ]
     console.print("[bold green]mini-cursor 命令一览[/bold green]")
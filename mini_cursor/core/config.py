@@ -1,5 +1,8 @@
+import hashlib
 import os
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # 添加颜色输出支持
@@ -28,32 +31,169 @@ OPENAI_MODEL = None
 
 # 设置超时时间（秒）
 TOOL_CALL_TIMEOUT = 15
+# 同一轮中的多个工具调用是否并发执行
+CONCURRENT_TOOL_CALLS = True
+# 全局最大并发工具调用数
+MAX_CONCURRENT_TOOL_CALLS = 8
+# 单个MCP服务器的最大并发工具调用数
+MAX_CONCURRENT_TOOL_CALLS_PER_SERVER = 4
+# 只读工具，同一轮中连续的只读调用可以并发执行；其他工具只有通过MCP注解声明readOnlyHint=True时才视为只读
+READ_ONLY_TOOLS = {"read_file", "list_dir", "search_files", "grep_search", "web_search", "diagnostics"}
+# 总是串行执行的工具（即使声明为只读），按原始顺序执行，且作为并发批次之间的屏障；
+# 不是只读的工具同样串行执行
+SERIAL_TOOLS = {"edit_file", "terminal_command", "reapply"}
+# 上下文窗口的token预算：按模型名前缀匹配（不区分大小写），未匹配时使用默认值
+# 可通过环境变量 MAX_CONTEXT_TOKENS 覆盖
+DEFAULT_CONTEXT_TOKEN_BUDGET = 32000
+CONTEXT_TOKEN_BUDGETS = {
+    "gpt-4o": 96000,
+    "gpt-4.1": 96000,
+    "o1": 96000,
+    "o3": 96000,
+    "deepseek": 48000,
+    "qwen": 24000,
+    "glm": 24000,
+}
+# Web API会话设置：每个会话拥有独立的消息历史和监听器，共享MCP服务器连接
+MAX_SESSIONS = 100
+# 会话空闲超时（秒），超时后会被回收
+SESSION_IDLE_TIMEOUT = 1800
+# 工具执行代理：设置环境变量 MINI_CURSOR_TOOL_BROKER 为unix socket路径后，
+# 同一主机上的所有API worker共享一个持有MCP会话的代理进程
+TOOL_BROKER_ENV = "MINI_CURSOR_TOOL_BROKER"
+# 所有worker断开后，代理进程的空闲退出时间（秒）
+TOOL_BROKER_IDLE_TIMEOUT = 60
+# SSE增量合并窗口（秒）：大于0时，窗口内连续的message/thinking增量合并为一个SSE帧；0表示逐个发送
+SSE_COALESCE_WINDOW = float(os.environ.get("SSE_COALESCE_WINDOW", "0"))
+# 每个SSE流最多缓冲的事件数，超出后按溢出策略处理，避免读取缓慢的客户端占用过多内存
+SSE_QUEUE_MAX_EVENTS = int(os.environ.get("SSE_QUEUE_MAX_EVENTS", "1000"))
+# 每个SSE流最多缓冲的数据量（按事件内容的字符数计），合并增量不会减少数据量，超出后无论哪种策略都取消本轮对话
+SSE_QUEUE_MAX_BYTES = int(os.environ.get("SSE_QUEUE_MAX_BYTES", str(8 * 1024 * 1024)))
+# 溢出策略：coalesce（合并增量）、drop_thinking（丢弃思考过程增量）、cancel（取消本轮对话）
+SSE_OVERFLOW_POLICY = os.environ.get("SSE_OVERFLOW_POLICY", "coalesce")
+# /chat准入控制：最大同时执行的对话轮次、最大排队数、单个工作区的最大进行中轮次、最长排队时间（秒）
+MAX_CONCURRENT_TURNS = int(os.environ.get("MAX_CONCURRENT_TURNS", "8"))
+MAX_QUEUED_TURNS = int(os.environ.get("MAX_QUEUED_TURNS", "32"))
+MAX_TURNS_PER_WORKSPACE = int(os.environ.get("MAX_TURNS_PER_WORKSPACE", "2"))
+TURN_QUEUE_TIMEOUT = float(os.environ.get("TURN_QUEUE_TIMEOUT", "30"))
+# SQLite日志模式和同步级别：WAL + NORMAL 每次提交无需fsync，只在检查点时同步
+DB_JOURNAL_MODE = "WAL"
+DB_SYNCHRONOUS = "NORMAL"
+# 数据库只读连接池大小（写操作始终在单独的写线程中串行执行）
+DB_READ_POOL_SIZE = 4
+# 对话持久化写后队列的最大待写入轮次数，队列满时新的轮次等待空位
+DB_WRITE_QUEUE_SIZE = int(os.environ.get("DB_WRITE_QUEUE_SIZE", "256"))
+# 工具结果达到该字节数时按内容哈希去重并压缩保存到blobs表
+TOOL_RESULT_BLOB_THRESHOLD = 4096
+# 对话保留策略（mini-cursor db maintain）：超过天数未更新的对话归档后从数据库删除，0表示不限制
+DB_RETENTION_DAYS = int(os.environ.get("DB_RETENTION_DAYS", "0"))
+# 数据库实际使用空间上限（MB），超出时从最旧的对话开始归档，0表示不限制
+DB_MAX_SIZE_MB = int(os.environ.get("DB_MAX_SIZE_MB", "0"))
+# 归档目录，默认为数据库文件所在目录下的archive
+DB_ARCHIVE_DIR = os.environ.get("DB_ARCHIVE_DIR") or None
+# 流式返回对话记录时每批从数据库读取的消息数
+DETAIL_STREAM_BATCH_SIZE = 200
+# 全文索引补建时每批索引的消息数，批次之间可以穿插正常的写入
+SEARCH_REINDEX_BATCH_SIZE = 500
 # 设置是否显示详细日志
 VERBOSE_LOGGING = False
 # MCP配置文件
 MCP_CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), "core", "mcp_config.json") 
 
-# 初始化函数，用于首次加载或重新加载配置
-def init_config():
-    global OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL
-    current_dir = Path(__file__).resolve()  # 当前文件的绝对路径
-    # 向上查找包含mini_cursor目录的父目录
-    project_root = current_dir.parent.parent.parent  # 这应该是mini-cursor目录
-    env_file_path = project_root / "mini_cursor" / ".env"
-    load_dotenv(dotenv_path=env_file_path, override=True)
-    print(f"已加载环境变量从: {env_file_path}")
-    
+# .env 文件路径（位于 mini_cursor 包目录下）
+ENV_FILE_PATH = Path(__file__).resolve().parent.parent / ".env"
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """OpenAI配置的不可变快照，只有在.env文件变化或显式重新加载时才会替换"""
+    api_key: Optional[str]
+    base_url: Optional[str]
+    model: Optional[str]
+    env_mtime_ns: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        return {
+            "OPENAI_API_KEY": self.api_key,
+            "OPENAI_BASE_URL": self.base_url,
+            "OPENAI_MODEL": self.model
+        }
+
+
+_config_snapshot: Optional[ConfigSnapshot] = None
+
+
+def _get_env_mtime_ns() -> Optional[int]:
+    try:
+        return os.stat(ENV_FILE_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _load_config_snapshot(env_mtime_ns: Optional[int]) -> ConfigSnapshot:
+    """解析.env文件并生成新的配置快照"""
+    global OPENAI_API_KEY, OPENAI_BASE_URL, OPENAI_MODEL, _config_snapshot
+    load_dotenv(dotenv_path=ENV_FILE_PATH, override=True)
+    print(f"已加载环境变量从: {ENV_FILE_PATH}")
     
     # 从环境变量加载配置
     OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
     OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
     OPENAI_MODEL = os.environ.get("OPENAI_MODEL")
     
-    return {
-        "OPENAI_API_KEY": OPENAI_API_KEY,
-        "OPENAI_BASE_URL": OPENAI_BASE_URL,
-        "OPENAI_MODEL": OPENAI_MODEL
-    }
+    _config_snapshot = ConfigSnapshot(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        model=OPENAI_MODEL,
+        env_mtime_ns=env_mtime_ns
+    )
+    return _config_snapshot
+
+
+def get_tool_broker_socket() -> Optional[str]:
+    """获取工具执行代理的socket路径，未启用时返回None"""
+    return os.environ.get(TOOL_BROKER_ENV) or None
+
+
+def default_tool_broker_socket() -> str:
+    """默认的代理socket路径（按用户和MCP配置文件区分，不同安装不会共用一个代理）"""
+    config_hash = hashlib.sha1(os.path.abspath(MCP_CONFIG_FILE).encode("utf-8")).hexdigest()[:12]
+    return os.path.join("/tmp", f"mini-cursor-tools-{os.getuid()}-{config_hash}.sock")
+
+
+def get_context_token_budget(model: Optional[str]) -> int:
+    """获取模型的上下文token预算"""
+    override = os.environ.get("MAX_CONTEXT_TOKENS")
+    if override and override.isdigit():
+        return int(override)
+    model_name = (model or "").lower()
+    # 优先匹配最长的前缀
+    for prefix in sorted(CONTEXT_TOKEN_BUDGETS, key=len, reverse=True):
+        if model_name.startswith(prefix):
+            return CONTEXT_TOKEN_BUDGETS[prefix]
+    return DEFAULT_CONTEXT_TOKEN_BUDGET
+
+
+def get_config() -> ConfigSnapshot:
+    """获取当前配置快照
+    
+    只做一次stat检查：.env文件的mtime未变化时直接返回缓存的快照，
+    不会重新解析文件或修改os.environ。
+    """
+    env_mtime_ns = _get_env_mtime_ns()
+    if _config_snapshot is None or _config_snapshot.env_mtime_ns != env_mtime_ns:
+        return _load_config_snapshot(env_mtime_ns)
+    return _config_snapshot
+
+
+def reload_config() -> ConfigSnapshot:
+    """强制重新加载.env文件（例如通过 /update-openai-config 更新配置之后）"""
+    return _load_config_snapshot(_get_env_mtime_ns())
+
+
+# 初始化函数，用于首次加载或重新加载配置
+def init_config():
+    return reload_config().to_dict()
 
 # 初始化配置
-init_config() 
\ No newline at end of file
+init_config()
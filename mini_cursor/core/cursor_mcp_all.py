@@ -3,7 +3,17 @@ import re
 import logging
 import json
 import asyncio
+import hashlib
+import heapq
+import itertools
+import mmap
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, Any, List, Tuple, TypedDict, Optional, Union, Literal, Set
+from collections import OrderedDict
+from array import array
 from dataclasses import dataclass, field
 import traceback
 import requests
@@ -27,29 +37,226 @@ class EditResult(TypedDict, total=False):
     original_lines: int
     modified_lines: int
 
-@dataclass
+# 文件内容缓存的内存上限（MB）
+FILE_CACHE_MAX_BYTES = int(os.environ.get("MINI_CURSOR_FILE_CACHE_MB", "64")) * 1024 * 1024
+# 非文本文件的缓存条目只记录文件签名，按固定大小计入内存上限
+NON_TEXT_ENTRY_BYTES = 256
+
+FileSignature = Tuple[int, int, int]
+
+def file_signature(st: os.stat_result) -> FileSignature:
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+# 不超过该大小的文件在内存中保存原始字节，更大的文件只保存行偏移，按需从磁盘读取请求的范围
+FILE_INLINE_MAX_BYTES = 1024 * 1024
+# 为大文件建立行偏移索引时每次读取的字节数
+LINE_INDEX_CHUNK_BYTES = 8 * 1024 * 1024
+
+_LINE_BREAK = re.compile(rb"\r\n?|\n")
+
+def _append_line_starts(offsets: array, chunk: bytes, base: int) -> None:
+    """将chunk中每个换行符（\n、\r\n或单独的\r）之后的位置（文件内的绝对偏移）追加到offsets"""
+    if b"\r" not in chunk:
+        line_lengths = map((1).__add__, map(len, chunk.split(b"\n")[:-1]))
+        offsets.extend(itertools.islice(itertools.accumulate(line_lengths, initial=base), 1, None))
+        return
+    offsets.extend(base + match.end() for match in _LINE_BREAK.finditer(chunk))
+
+def _decode_lines(data: bytes) -> str:
+    """解码并按文本模式统一换行符"""
+    return data.decode('utf-8', errors='replace').replace("\r\n", "\n").replace("\r", "\n")
+
+class FileText:
+    """
+    文件内容的紧凑表示：原始字节加上array保存的行起始偏移
+
+    行偏移索引只在加载时建立一次，读取任意行范围只需切片并解码这些行，
+    不再为每一行保存一个str对象。大文件不在内存中保存内容，只按偏移从磁盘读取请求的字节范围。
+    与文本模式的readlines()一致，\\n、\\r\\n和单独的\\r都是换行符，读取时统一转换为\\n。
+    """
+
+    __slots__ = ("path", "data", "offsets")
+
+    def __init__(self, path: str, data: Optional[bytes], offsets: array):
+        self.path = path
+        self.data = data
+        # offsets[i]为第i行的起始偏移，最后一项为文件大小，行数为len(offsets) - 1
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, file_path: str, inline_max_bytes: int = FILE_INLINE_MAX_BYTES) -> "FileText":
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            offsets = array('I' if size < 2 ** 32 else 'Q', [0])
+            if size <= inline_max_bytes:
+                data = f.read()
+                size = len(data)
+                _append_line_starts(offsets, data, 0)
+            else:
+                data = None
+                size = 0
+                while True:
+                    chunk = f.read(LINE_INDEX_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    # 不在\r\n中间切分，否则会被当作两个换行符
+                    if chunk.endswith(b"\r"):
+                        chunk += f.read(1)
+                    _append_line_starts(offsets, chunk, size)
+                    size += len(chunk)
+        # 文件以换行符结尾时最后一个行起始偏移就等于文件大小
+        if offsets[-1] != size:
+            offsets.append(size)
+        return cls(file_path, data, offsets)
+
+    @property
+    def nbytes(self) -> int:
+        """在内存中占用的字节数（近似值）"""
+        data_bytes = len(self.data) if self.data is not None else 0
+        return data_bytes + self.offsets.itemsize * len(self.offsets) + 128
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def read_bytes(self, start: int, end: int) -> bytes:
+        """读取第start行（含）到第end行（不含）的原始字节，行号从0开始"""
+        start = max(0, min(start, len(self)))
+        end = max(start, min(end, len(self)))
+        begin, finish = self.offsets[start], self.offsets[end]
+        if self.data is not None:
+            return self.data[begin:finish]
+        with open(self.path, 'rb') as f:
+            f.seek(begin)
+            return f.read(finish - begin)
+
+    def read_lines(self, start: int, end: int) -> str:
+        """读取第start行（含）到第end行（不含）并解码为一个字符串"""
+        return _decode_lines(self.read_bytes(start, end))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, end, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, end, step)]
+            data = self.read_bytes(start, end)
+            base = self.offsets[start]
+            return [
+                _decode_lines(data[self.offsets[i] - base:self.offsets[i + 1] - base])
+                for i in range(start, end)
+            ]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("line index out of range")
+        return self.read_lines(index, index + 1)
+
+    def __iter__(self):
+        # 大文件按块读取，不会一次性载入整个文件
+        for start in range(0, len(self), 10000):
+            yield from self[start:start + 10000]
+
 class FileCache:
-    dir_listing_cache: Dict[str, Tuple[float, List[str]]] = field(default_factory=dict)
-    file_content_cache: Dict[str, Tuple[float, List[str]]] = field(default_factory=dict)
-    non_text_files: Set[str] = field(default_factory=set)
-    cache_ttl: int = 300
+    """
+    按字节数限制内存的LRU文件缓存
+
+    条目以(mtime_ns, size, inode)校验，文件被修改或替换后自动失效；非文本文件也作为条目
+    （内容为None）参与LRU淘汰，不会无限增长。超过上限时从最久未使用的条目开始淘汰。
+    """
+
+    def __init__(self, max_bytes: int = FILE_CACHE_MAX_BYTES, cache_ttl: int = 300):
+        self.dir_listing_cache: Dict[str, Tuple[float, List[str]]] = {}
+        self.cache_ttl = cache_ttl
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        # 路径 -> (文件签名, 文件内容或None, 占用字节数)
+        self._entries: "OrderedDict[str, Tuple[FileSignature, Optional[FileText], int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _entry_size(text: Optional[FileText]) -> int:
+        if text is None:
+            return NON_TEXT_ENTRY_BYTES
+        return text.nbytes
+
+    def lookup(self, file_path: str, signature: FileSignature) -> Tuple[bool, Optional[FileText]]:
+        """返回(是否命中, 文件内容)，签名不一致的条目会被移除"""
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None:
+                if entry[0] == signature:
+                    self._entries.move_to_end(file_path)
+                    self.hits += 1
+                    return True, entry[1]
+                self._remove(file_path)
+                self.invalidations += 1
+            self.misses += 1
+            return False, None
+
+    def store(self, file_path: str, signature: FileSignature, text: Optional[FileText]) -> None:
+        """缓存文件内容（非文本文件传入None），超过上限时淘汰最久未使用的条目"""
+        size = self._entry_size(text)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(file_path)
+            self._entries[file_path] = (signature, text, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, file_path: str) -> None:
+        entry = self._entries.pop(file_path, None)
+        if entry is not None:
+            self.current_bytes -= entry[2]
+
+    def invalidate(self, file_path: str) -> None:
+        with self._lock:
+            if file_path in self._entries:
+                self._remove(file_path)
+                self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "non_text_entries": sum(1 for entry in self._entries.values() if entry[1] is None),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "dir_listings": len(self.dir_listing_cache),
+            }
 
 @dataclass
 class AppContext:
     file_cache: FileCache = field(default_factory=FileCache)
+    # 工作区根目录 -> 持久化trigram索引
+    indexes: Dict[str, Optional["TrigramIndex"]] = field(default_factory=dict)
 
 # --- Utility functions (unchanged) ---
+def is_binary_chunk(chunk: bytes) -> bool:
+    if b'\x00' in chunk:
+        return True
+    try:
+        chunk.decode('utf-8')
+        return False
+    except UnicodeDecodeError:
+        return True
+
 def is_binary_file(file_path: str) -> bool:
     try:
         with open(file_path, 'rb') as f:
-            chunk = f.read(1024)
-            if b'\x00' in chunk:
-                return True
-            try:
-                chunk.decode('utf-8')
-                return False
-            except UnicodeDecodeError:
-                return True
+            return is_binary_chunk(f.read(1024))
     except (IOError, PermissionError):
         return True
 
@@ -108,81 +315,653 @@ def apply_edits(original_content: str, segments: List[str], placeholder_pattern:
         result.append(original_content[last_pos:])
     return "".join(result)
 
+# --- Workspace traversal ---
+# 默认排除的版本库、依赖、虚拟环境、缓存和构建输出目录，语法同.gitignore，可以在.gitignore中用!重新包含
+DEFAULT_IGNORE_PATTERNS = [
+    ".git/", ".hg/", ".svn/",
+    "node_modules/", "bower_components/",
+    ".venv/", "venv/", "__pycache__/", "*.pyc", "*.egg-info/",
+    ".tox/", ".nox/", ".mypy_cache/", ".pytest_cache/", ".ruff_cache/",
+    "build/", "dist/", "target/", ".next/", ".gradle/",
+    ".idea/", ".DS_Store",
+]
+IGNORE_FILE_NAMES = (".gitignore", ".ignore")
+
+def _translate_ignore_pattern(pattern: str) -> str:
+    """将.gitignore中的通配符（*、?、**、[...]）转换为正则表达式"""
+    regex = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if pattern.startswith("**/", i):
+            regex.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            regex.append(".*")
+            i += 2
+            continue
+        if char == "*":
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", i + 2)
+            if end < 0:
+                regex.append(re.escape(char))
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            regex.append(re.escape(pattern[i]))
+        else:
+            regex.append(re.escape(char))
+        i += 1
+    return "".join(regex)
+
+class IgnoreRules:
+    """一个目录中的忽略规则，路径相对于该目录、以/分隔"""
+
+    def __init__(self, patterns: List[str]):
+        self.rules: List[Tuple[re.Pattern, bool, bool]] = []
+        for line in patterns:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negate = line.startswith("!")
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            # 包含/的规则相对于规则所在目录，否则匹配任意层级的文件名
+            anchored = "/" in line
+            body = _translate_ignore_pattern(line.lstrip("/"))
+            regex = "^" + body + "$" if anchored else "^(?:.*/)?" + body + "$"
+            self.rules.append((re.compile(regex), negate, dir_only))
+        # 没有!规则时顺序无关，合并为一个正则（分别用于目录和文件）
+        self._combined: Optional[Dict[bool, re.Pattern]] = None
+        if self.rules and not any(negate for _, negate, _ in self.rules):
+            self._combined = {
+                is_dir: re.compile("|".join(f"(?:{regex.pattern})" for regex, _, dir_only in self.rules
+                                            if is_dir or not dir_only) or "(?!)")
+                for is_dir in (True, False)
+            }
+
+    @classmethod
+    def from_directory(cls, directory: str, file_names: Set[str],
+                       ignore_file_names: Tuple[str, ...] = IGNORE_FILE_NAMES) -> Optional["IgnoreRules"]:
+        """读取目录中的忽略文件，file_names为目录中已有的文件名（避免额外的stat），没有规则时返回None"""
+        patterns = []
+        for name in ignore_file_names:
+            if name in file_names:
+                try:
+                    with open(os.path.join(directory, name), 'r', encoding='utf-8', errors='replace') as f:
+                        patterns.extend(f.readlines())
+                except OSError:
+                    continue
+        rules = cls(patterns)
+        return rules if rules.rules else None
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """返回True表示忽略，False表示被!规则重新包含，None表示没有规则匹配"""
+        if self._combined is not None:
+            return True if self._combined[is_dir].match(rel_path) else None
+        result = None
+        for regex, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+def iter_workspace_entries(root: str, exclude_dirs: Optional[Set[str]] = None,
+                           dir_mtimes: Optional[Dict[str, int]] = None):
+    """
+    遍历工作区中未被忽略的文件，逐个产出os.DirEntry
+
+    依次应用默认排除规则、.git/info/exclude以及各级目录中的.gitignore/.ignore，
+    后面的规则优先。被忽略的目录和虚拟环境（包含pyvenv.cfg的目录）在进入之前就被剪除；
+    使用os.scandir，判断文件类型不需要额外的stat，也不跟随目录的符号链接。
+
+    Args:
+        root: 工作区根目录
+        exclude_dirs: 额外跳过的目录（绝对路径），例如索引目录
+        dir_mtimes: 传入字典时记录每个遍历到的目录在读取之前的mtime_ns（绝对路径 -> mtime_ns）
+    """
+    root = os.path.abspath(root)
+    base_rules = [IgnoreRules(DEFAULT_IGNORE_PATTERNS)]
+    git_exclude = IgnoreRules.from_directory(os.path.join(root, ".git", "info"), {"exclude"}, ("exclude",))
+    if git_exclude is not None:
+        base_rules.append(git_exclude)
+    # 栈中每一项：(目录绝对路径, 目录相对于root的路径, 该目录及上级目录的规则[(规则所在目录的相对路径, 规则)])
+    stack = [(root, "", [("", rules) for rules in base_rules])]
+    while stack:
+        directory, rel_dir, inherited = stack.pop()
+        try:
+            if dir_mtimes is not None:
+                dir_mtimes[directory] = os.stat(directory).st_mtime_ns
+            with os.scandir(directory) as iterator:
+                entries = list(iterator)
+        except OSError:
+            continue
+        names = {entry.name for entry in entries}
+        if rel_dir and "pyvenv.cfg" in names:
+            if dir_mtimes is not None:
+                del dir_mtimes[directory]
+            continue
+        rules = inherited
+        own_rules = IgnoreRules.from_directory(directory, names)
+        if own_rules is not None:
+            rules = inherited + [(rel_dir, own_rules)]
+        subdirectories = []
+        for entry in sorted(entries, key=lambda entry: entry.name):
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            ignored = False
+            for base, rule_set in rules:
+                matched = rule_set.match(rel_path[len(base) + 1:] if base else rel_path, is_dir)
+                if matched is not None:
+                    ignored = matched
+            if ignored:
+                continue
+            if is_dir:
+                if exclude_dirs and entry.path in exclude_dirs:
+                    continue
+                subdirectories.append((entry.path, rel_path, rules))
+            elif entry.is_file():
+                yield entry
+        # 逆序入栈，按名称顺序深度优先遍历
+        stack.extend(reversed(subdirectories))
+
+def iter_workspace_files(root: str, exclude_dirs: Optional[Set[str]] = None):
+    """遍历工作区中未被忽略的文件，逐个产出文件路径"""
+    for entry in iter_workspace_entries(root, exclude_dirs):
+        yield entry.path
+
 def get_file_paths(directory_path: str, file_cache: FileCache, max_files: int = 10000) -> List[str]:
-    import time
     now = time.time()
     if directory_path in file_cache.dir_listing_cache:
         cache_time, file_paths = file_cache.dir_listing_cache[directory_path]
         if now - cache_time < file_cache.cache_ttl:
             return file_paths
-    file_paths = []
-    file_count = 0
-    for root, _, files in os.walk(directory_path):
-        for file_name in files:
-            file_path = os.path.join(root, file_name)
-            file_paths.append(file_path)
-            file_count += 1
-            if file_count >= max_files:
-                logger.warning(f"Reached maximum file count ({max_files}), stopping directory traversal")
-                break
-        if file_count >= max_files:
-            break
+    file_paths = list(itertools.islice(iter_workspace_files(directory_path), max_files))
+    if len(file_paths) >= max_files:
+        logger.warning(f"Reached maximum file count ({max_files}), stopping directory traversal")
     file_cache.dir_listing_cache[directory_path] = (now, file_paths)
     return file_paths
 
-def get_file_content(file_path: str, file_cache: FileCache) -> Optional[List[str]]:
-    import time
-    now = time.time()
-    if file_path in file_cache.non_text_files:
+def get_file_content(file_path: str, file_cache: FileCache) -> Optional[FileText]:
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        file_cache.invalidate(file_path)
         return None
-    if file_path in file_cache.file_content_cache:
-        cache_time, lines = file_cache.file_content_cache[file_path]
-        try:
-            mtime = os.path.getmtime(file_path)
-            if mtime <= cache_time:
-                return lines
-        except (OSError, IOError):
-            return lines if now - cache_time < file_cache.cache_ttl else None
+    signature = file_signature(st)
+    found, text = file_cache.lookup(file_path, signature)
+    if found:
+        return text
     if is_binary_file(file_path):
-        file_cache.non_text_files.add(file_path)
+        file_cache.store(file_path, signature, None)
         return None
     try:
-        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
-            lines = f.readlines()
-            file_cache.file_content_cache[file_path] = (now, lines)
-            return lines
-    except (UnicodeDecodeError, PermissionError, IsADirectoryError, IOError):
-        file_cache.non_text_files.add(file_path)
+        text = FileText.load(file_path)
+    except (PermissionError, IsADirectoryError, IOError):
+        file_cache.store(file_path, signature, None)
         return None
+    file_cache.store(file_path, signature, text)
+    return text
 
-def calculate_match_score(text: str, patterns: List[re.Pattern], boost_all_keywords: bool = True) -> float:
-    match_counts = [len(pattern.findall(text)) for pattern in patterns]
+def score_match_counts(match_counts: List[int], boost_all_keywords: bool = True) -> float:
     score = sum(match_counts)
-    if boost_all_keywords and all(count > 0 for count in match_counts) and len(patterns) > 1:
+    if boost_all_keywords and all(count > 0 for count in match_counts) and len(match_counts) > 1:
         score *= 2
     return score
 
-def search_file_content(directory_path: str, keywords: List[str], top_k: int, file_cache: FileCache) -> List[SearchResult]:
-    results = []
+def calculate_match_score(text: str, patterns: List[re.Pattern], boost_all_keywords: bool = True) -> float:
+    match_counts = [len(pattern.findall(text)) for pattern in patterns]
+    return score_match_counts(match_counts, boost_all_keywords)
+
+# --- Parallel content search ---
+# 候选文件达到该数量时才分发到进程池，少量文件在当前进程搜索，避免进程间通信的开销
+GREP_PARALLEL_MIN_FILES = 256
+GREP_MAX_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+# 超过该秒数后停止扫描剩余文件，返回已找到的结果
+GREP_TIME_BUDGET = 10
+# 返回的单行内容的最大字符数（压缩过的代码可能是一整行）
+GREP_MAX_LINE_CHARS = 500
+
+def _fold_case_bytes(char: str) -> bytes:
+    """单个字符的字节正则；re.IGNORECASE对字节正则只折叠ASCII，非ASCII字符展开为大小写变体"""
+    variants = sorted({variant for variant in (char, char.lower(), char.upper()) if len(variant) == 1})
+    if char.isascii() or len(variants) == 1:
+        return re.escape(char.encode('utf-8'))
+    return b"(?:" + b"|".join(re.escape(variant.encode('utf-8')) for variant in variants) + b")"
+
+def compile_keywords(keywords: List[str]) -> re.Pattern:
+    """
+    将所有关键词编译为一个不区分大小写的字节正则，只用于找出包含任一关键词的行
+
+    交替分组按最左优先匹配，重叠或互为前缀的关键词会漏计，因此命中的行解码后再用
+    compile_keyword_patterns逐个关键词计分，得分与calculate_match_score一致。
+    """
+    return re.compile(b"|".join(b"".join(_fold_case_bytes(char) for char in keyword) for keyword in keywords),
+                      re.IGNORECASE)
+
+def compile_keyword_patterns(keywords: List[str]) -> List[re.Pattern]:
+    return [re.compile(re.escape(keyword), re.IGNORECASE) for keyword in keywords]
+
+def _push_top_k(heap: List[tuple], entry: tuple, top_k: int) -> None:
+    if len(heap) < top_k:
+        heapq.heappush(heap, entry)
+    elif entry > heap[0]:
+        heapq.heapreplace(heap, entry)
+
+def _grep_buffer(data, pattern: re.Pattern, keyword_patterns: List[re.Pattern], file_path: str, file_index: int,
+                 top_k: int, heap: List[tuple]) -> None:
+    """用一个正则找出包含关键词的行，逐行计分并放入top-k堆"""
+    line_number = 1
+    counted_to = 0
+    match = pattern.search(data)
+    while match is not None:
+        position = match.start()
+        line_start = data.rfind(b"\n", 0, position) + 1
+        line_end = data.find(b"\n", position)
+        if line_end < 0:
+            line_end = len(data)
+        # 只统计两行命中之间的换行符，整份文件最多被复制一遍
+        line_number += data[counted_to:line_start].count(b"\n")
+        counted_to = line_start
+        line = bytes(data[line_start:line_end]).decode('utf-8', errors='replace')
+        key = (calculate_match_score(line, keyword_patterns), -file_index, -line_number)
+        _push_top_k(heap, key + (file_path, line.strip()[:GREP_MAX_LINE_CHARS]), top_k)
+        # 同一行的其余命中已经计入得分
+        match = pattern.search(data, line_end + 1)
+
+def grep_files(file_paths: List[str], keywords: List[str], top_k: int, first_index: int,
+               deadline: float) -> Tuple[List[tuple], bool]:
+    """
+    在一组文件中搜索关键词，返回得分最高的top_k行和是否因超时提前结束（进程池的工作函数）
+
+    文件通过mmap读取，用一个正则跳到包含关键词的行，只有这些行会被解码和计分。
+    堆中的元素为(得分, -文件序号, -行号, 文件路径, 行内容)，得分相同时靠前的文件和行优先。
+    """
+    pattern = compile_keywords(keywords)
+    keyword_patterns = compile_keyword_patterns(keywords)
+    heap: List[tuple] = []
+    for offset, file_path in enumerate(file_paths):
+        if time.time() > deadline:
+            return heap, True
+        try:
+            with open(file_path, 'rb') as f:
+                if is_binary_chunk(f.read(1024)) or os.fstat(f.fileno()).st_size == 0:
+                    continue
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    _grep_buffer(data, pattern, keyword_patterns, file_path, first_index + offset, top_k, heap)
+        except (OSError, ValueError):
+            continue
+    return heap, False
+
+_grep_executor: Optional[ProcessPoolExecutor] = None
+
+def get_grep_executor() -> ProcessPoolExecutor:
+    global _grep_executor
+    if _grep_executor is None:
+        _grep_executor = ProcessPoolExecutor(max_workers=GREP_MAX_WORKERS)
+    return _grep_executor
+
+def parallel_grep(file_paths: List[str], keywords: List[str], top_k: int,
+                  time_budget: float = GREP_TIME_BUDGET) -> Tuple[List[SearchResult], bool]:
+    """
+    将文件分片到进程池中并行搜索，合并各分片的top-k
+
+    Returns:
+        (按得分排序的结果, 是否因超时而不完整)
+    """
+    global _grep_executor
+    deadline = time.time() + time_budget
+    heaps: List[List[tuple]] = []
+    truncated = False
+    if len(file_paths) < GREP_PARALLEL_MIN_FILES or GREP_MAX_WORKERS == 1:
+        heap, truncated = grep_files(file_paths, keywords, top_k, 0, deadline)
+        heaps.append(heap)
+    else:
+        # 每个进程分到多个较小的分片，文件大小不均时也能保持负载均衡
+        chunk_size = -(-len(file_paths) // (GREP_MAX_WORKERS * 4))
+        try:
+            executor = get_grep_executor()
+            futures = [
+                executor.submit(grep_files, file_paths[start:start + chunk_size], keywords, top_k, start, deadline)
+                for start in range(0, len(file_paths), chunk_size)
+            ]
+            for future in futures:
+                heap, chunk_truncated = future.result()
+                heaps.append(heap)
+                truncated = truncated or chunk_truncated
+        except Exception as e:
+            logger.warning(f"Parallel search failed, searching in-process: {e}")
+            _grep_executor = None
+            heap, truncated = grep_files(file_paths, keywords, top_k, 0, deadline)
+            heaps = [heap]
+    entries = heapq.nlargest(top_k, itertools.chain.from_iterable(heaps))
+    results = [{
+        "file_path": file_path,
+        "line_number": -negative_line,
+        "line_content": line,
+        "match_score": score
+    } for score, _, negative_line, file_path, line in entries]
+    return results, truncated
+
+def get_search_candidates(directory_path: str, keywords: List[str], file_cache: FileCache,
+                          index: Optional["TrigramIndex"] = None) -> List[str]:
+    # 有索引时只扫描目录下可能包含关键词的文件，索引首次建立完成之前遍历目录
+    if index is not None:
+        file_paths = index.candidate_files(keywords, directory_path)
+        if file_paths is not None:
+            return file_paths
+    return get_file_paths(directory_path, file_cache)
+
+def search_file_content(directory_path: str, keywords: List[str], top_k: int, file_cache: FileCache,
+                        index: Optional["TrigramIndex"] = None) -> List[SearchResult]:
     if not os.path.exists(directory_path) or not os.path.isdir(directory_path):
         return []
-    patterns = [re.compile(re.escape(kw), re.IGNORECASE) for kw in keywords]
-    file_paths = get_file_paths(directory_path, file_cache)
-    for file_path in file_paths:
-        lines = get_file_content(file_path, file_cache)
-        if lines is None:
-            continue
-        for line_number, line in enumerate(lines, 1):
-            if any(pattern.search(line) for pattern in patterns):
-                score = calculate_match_score(line, patterns)
-                results.append({
-                    "file_path": file_path,
-                    "line_number": line_number,
-                    "line_content": line.strip(),
-                    "match_score": score
-                })
-    results = sorted(results, key=lambda x: x["match_score"], reverse=True)
-    return results[:top_k]
+    file_paths = get_search_candidates(directory_path, keywords, file_cache, index)
+    results, _ = parallel_grep(file_paths, keywords, top_k)
+    return results
+
+# --- Workspace trigram index ---
+# 索引文件保存在工作区之外，每个工作区根目录一个SQLite数据库
+INDEX_DIR = os.environ.get("MINI_CURSOR_INDEX_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "mini-cursor", "index")
+# 超过该大小的文本文件只索引路径，内容搜索时总是作为候选文件
+INDEX_MAX_FILE_BYTES = 1024 * 1024
+# 距上次扫描超过该秒数时，查询前增量刷新索引（捕获在原位置修改、不改变目录mtime的外部写入）
+INDEX_REFRESH_INTERVAL = 30
+# 索引过期时查询等待后台刷新的最长秒数，超时后先用旧索引回答，工具调用不会因刷新而超时
+INDEX_REFRESH_WAIT = 2.0
+# 每批索引的文件数，批次之间释放锁，查询不需要等待整个刷新完成
+INDEX_BATCH_SIZE = 500
+
+def _fts_phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+class TrigramIndex:
+    """
+    工作区路径和文件内容的持久化trigram索引
+
+    基于SQLite FTS5的trigram分词，子串查询只需查找索引，不再遍历目录和逐行扫描文件。
+    文件按(mtime_ns, size)增量索引。每次查询前检查上次扫描时记录的目录mtime，
+    有文件被新建、删除或重命名（包括terminal_command、git和编辑器的写入）、超过刷新间隔
+    或被标记为过期时，在后台线程中增量刷新，查询最多等待INDEX_REFRESH_WAIT秒，
+    之后先用旧索引回答。首次建立索引完成之前查询返回None，调用方退回到遍历目录。
+    少于3个字符的查询无法使用trigram，退回到扫描files表。
+    """
+
+    def __init__(self, root: str, index_dir: str = INDEX_DIR):
+        self.root = os.path.abspath(root)
+        os.makedirs(index_dir, exist_ok=True)
+        self.index_dir = os.path.abspath(index_dir)
+        digest = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:16]
+        self.db_path = os.path.join(self.index_dir, f"{digest}.db")
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.RLock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self._last_refresh = 0.0
+        self._marked_stale_at = 0.0
+        # 上次扫描时各目录的mtime_ns，查询前用于判断是否有文件被新建、删除或重命名
+        self._dir_mtimes: Dict[str, int] = {}
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, kind TEXT NOT NULL)"
+            )
+            # 旧版本SQLite不支持trigram时这里会抛出OperationalError，由调用方退回到遍历目录
+            self.conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(path, content, tokenize='trigram')")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS index_state (id INTEGER PRIMARY KEY CHECK (id = 1), root TEXT NOT NULL, refreshed_at REAL NOT NULL)"
+            )
+        self.built = self.conn.execute("SELECT 1 FROM index_state").fetchone() is not None
+
+    def _read_for_index(self, file_path: str, size: int) -> Tuple[str, Optional[str]]:
+        """返回文件类型（text/binary/large）和要索引的内容"""
+        try:
+            with open(file_path, 'rb') as f:
+                if size > INDEX_MAX_FILE_BYTES:
+                    return ("binary" if is_binary_chunk(f.read(1024)) else "large"), None
+                data = f.read()
+        except (IOError, PermissionError):
+            return "binary", None
+        if is_binary_chunk(data[:1024]):
+            return "binary", None
+        return "text", data.decode('utf-8', errors='replace')
+
+    def _index_batch(self, batch: List[Tuple[str, Optional[int], os.stat_result]]) -> None:
+        """索引一批文件：(相对路径, 已有的files.id或None, stat结果)"""
+        if not batch:
+            return
+        # 在锁外读取文件，写入时才持有锁
+        rows = [(rel_path, file_id, st) + self._read_for_index(os.path.join(self.root, rel_path), st.st_size)
+                for rel_path, file_id, st in batch]
+        with self._lock, self.conn:
+            for rel_path, file_id, st, kind, content in rows:
+                if file_id is None:
+                    file_id = self.conn.execute(
+                        "INSERT INTO files (path, mtime_ns, size, kind) VALUES (?, ?, ?, ?)",
+                        (rel_path, st.st_mtime_ns, st.st_size, kind)
+                    ).lastrowid
+                else:
+                    self.conn.execute(
+                        "UPDATE files SET mtime_ns = ?, size = ?, kind = ? WHERE id = ?",
+                        (st.st_mtime_ns, st.st_size, kind, file_id)
+                    )
+                    self.conn.execute("DELETE FROM files_fts WHERE rowid = ?", (file_id,))
+                self.conn.execute(
+                    "INSERT INTO files_fts (rowid, path, content) VALUES (?, ?, ?)",
+                    (file_id, rel_path, content or "")
+                )
+
+    def _remove(self, file_ids: List[int]) -> None:
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM files_fts WHERE rowid = ?", [(file_id,) for file_id in file_ids])
+            self.conn.executemany("DELETE FROM files WHERE id = ?", [(file_id,) for file_id in file_ids])
+
+    def refresh(self) -> None:
+        """扫描工作区，索引新增或修改的文件，删除已不存在的文件"""
+        with self._refresh_lock:
+            with self._lock:
+                known = {path: (file_id, mtime_ns, size) for file_id, path, mtime_ns, size
+                         in self.conn.execute("SELECT id, path, mtime_ns, size FROM files")}
+            started = time.time()
+            dir_mtimes: Dict[str, int] = {}
+            changed = []
+            for entry in iter_workspace_entries(self.root, exclude_dirs={self.index_dir}, dir_mtimes=dir_mtimes):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                rel_path = os.path.relpath(entry.path, self.root)
+                entry = known.pop(rel_path, None)
+                if entry is None or entry[1] != st.st_mtime_ns or entry[2] != st.st_size:
+                    changed.append((rel_path, entry[0] if entry else None, st))
+                    if len(changed) >= INDEX_BATCH_SIZE:
+                        self._index_batch(changed)
+                        changed = []
+            self._index_batch(changed)
+            if known:
+                self._remove([file_id for file_id, _, _ in known.values()])
+            self._dir_mtimes = dir_mtimes
+            # 扫描期间被标记为过期时，扫描可能没有看到这些修改，下一次查询时再刷新
+            self._last_refresh = started if self._marked_stale_at < started else 0.0
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO index_state (id, root, refreshed_at) VALUES (1, ?, ?)",
+                    (self.root, started)
+                )
+            self.built = True
+
+    def _directories_changed(self) -> bool:
+        """上次扫描之后是否有目录被修改或删除（只stat目录，不遍历文件）"""
+        for directory, mtime_ns in self._dir_mtimes.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime_ns:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def is_stale(self) -> bool:
+        return (not self.built or time.time() - self._last_refresh >= INDEX_REFRESH_INTERVAL
+                or self._directories_changed())
+
+    def ensure_fresh(self, wait: Optional[float] = None) -> bool:
+        """
+        查询前检查索引是否过期，过期时在后台增量刷新（只重新索引变化的文件），最多等待wait秒
+
+        返回索引能否用于查询：首次建立索引完成之前返回False。
+        """
+        if self.is_stale():
+            self._start_refresh().join(INDEX_REFRESH_WAIT if wait is None else wait)
+        return self.built
+
+    def _start_refresh(self) -> threading.Thread:
+        """启动后台刷新线程，已有刷新在进行时返回该线程"""
+        with self._lock:
+            if self._refresh_thread is None or not self._refresh_thread.is_alive():
+                self._refresh_thread = threading.Thread(target=self._refresh_in_background,
+                                                        name=f"index-refresh:{self.root}", daemon=True)
+                self._refresh_thread.start()
+            return self._refresh_thread
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Refreshing workspace index for {self.root} failed: {e}")
+
+    def mark_stale(self) -> None:
+        """下一次查询前重新扫描工作区（例如执行终端命令之后）"""
+        self._marked_stale_at = time.time()
+        self._last_refresh = 0.0
+
+    def update_file(self, file_path: str) -> None:
+        """立即重新索引单个文件（例如edit_file之后），工作区之外的文件会被忽略"""
+        rel_path = os.path.relpath(os.path.abspath(file_path), self.root)
+        if rel_path.startswith(os.pardir):
+            return
+        with self._lock:
+            row = self.conn.execute("SELECT id FROM files WHERE path = ?", (rel_path,)).fetchone()
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            if row:
+                self._remove([row[0]])
+            return
+        self._index_batch([(rel_path, row[0] if row else None, st)])
+
+    def search_paths(self, query: str, limit: int = 10) -> Optional[List[str]]:
+        """按子串匹配相对路径（不区分大小写），路径越短越靠前；索引尚未建立时返回None"""
+        if not self.ensure_fresh():
+            return None
+        with self._lock:
+            if len(query) >= 3:
+                rows = self.conn.execute(
+                    "SELECT path FROM files_fts WHERE files_fts MATCH ? ORDER BY length(path), path LIMIT ?",
+                    (f"path : {_fts_phrase(query)}", limit)
+                ).fetchall()
+            else:
+                rows = self.conn.execute(
+                    "SELECT path FROM files WHERE instr(lower(path), ?) > 0 ORDER BY length(path), path LIMIT ?",
+                    (query.lower(), limit)
+                ).fetchall()
+        return [path for (path,) in rows]
+
+    def candidate_files(self, keywords: List[str], directory: Optional[str] = None) -> Optional[List[str]]:
+        """
+        返回可能包含任一关键词的文件的绝对路径，索引尚未建立时返回None
+
+        只索引了路径的大文件总是作为候选；有少于3个字符的关键词时返回所有文本文件。
+        指定directory时只返回该目录下的文件。
+        """
+        if not self.ensure_fresh():
+            return None
+        with self._lock:
+            if keywords and all(len(keyword) >= 3 for keyword in keywords):
+                expression = "content : (" + " OR ".join(_fts_phrase(keyword) for keyword in keywords) + ")"
+                rows = self.conn.execute(
+                    "SELECT path FROM files_fts WHERE files_fts MATCH ? "
+                    "UNION ALL SELECT path FROM files WHERE kind = 'large'",
+                    (expression,)
+                ).fetchall()
+            else:
+                rows = self.conn.execute("SELECT path FROM files WHERE kind != 'binary'").fetchall()
+        paths = [path for (path,) in rows]
+        if directory is not None:
+            rel_dir = os.path.relpath(os.path.abspath(directory), self.root)
+            if rel_dir != os.curdir:
+                prefix = rel_dir + os.sep
+                paths = [path for path in paths if path.startswith(prefix)]
+        return [os.path.join(self.root, path) for path in paths]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds = dict(self.conn.execute("SELECT kind, count(*) FROM files GROUP BY kind").fetchall())
+        return {
+            "root": self.root,
+            "db_path": self.db_path,
+            "db_bytes": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+            "files": kinds,
+            "last_refresh": self._last_refresh,
+            "directories": len(self._dir_mtimes),
+        }
+
+def get_workspace_index(root: str) -> Optional[TrigramIndex]:
+    """获取工作区的trigram索引，SQLite不支持FTS5 trigram或索引目录不可写时返回None"""
+    root = os.path.abspath(root)
+    if root not in app_context.indexes:
+        try:
+            app_context.indexes[root] = TrigramIndex(root)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"Workspace index unavailable for {root}, falling back to directory scans: {e}")
+            app_context.indexes[root] = None
+    return app_context.indexes[root]
+
+def find_workspace_index(directory_path: str) -> Optional[TrigramIndex]:
+    """
+    获取包含directory_path的工作区索引：已有索引中根目录最深的一个，否则在当前工作区内时使用
+    当前工作区的索引；其他目录返回None（直接遍历目录），避免为每个搜索目录各建一个索引
+    """
+    directory_path = os.path.abspath(directory_path)
+    roots = [root for root, index in app_context.indexes.items()
+             if index is not None and _is_within(directory_path, root)]
+    if roots:
+        return app_context.indexes[max(roots, key=len)]
+    if _is_within(directory_path, os.getcwd()):
+        return get_workspace_index(os.getcwd())
+    return None
+
+def _is_within(path: str, root: str) -> bool:
+    root = os.path.abspath(root)
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+def update_workspace_indexes(file_path: str) -> None:
+    for index in app_context.indexes.values():
+        if index is not None:
+            index.update_file(file_path)
+
+def mark_workspace_indexes_stale() -> None:
+    for index in app_context.indexes.values():
+        if index is not None:
+            index.mark_stale()
 
 # --- MCP Server Setup ---
 app_context = AppContext()
@@ -204,9 +983,11 @@ async def tool_read_file(args: dict) -> str:
     try:
         if not os.path.exists(target_file):
             return f"Error: File '{target_file}' does not exist."
-        with open(target_file, 'r', encoding='utf-8', errors='replace') as f:
-            all_lines = f.readlines()
-        total_lines = len(all_lines)
+        file_text = get_file_content(target_file, app_context.file_cache)
+        if file_text is None:
+            # 非UTF-8编码等未缓存的文件，按替换字符读取
+            file_text = FileText.load(target_file)
+        total_lines = len(file_text)
         if should_read_entire_file:
             start = 0
             end = total_lines
@@ -214,7 +995,6 @@ async def tool_read_file(args: dict) -> str:
             # 转换为Python下标
             start = max(0, start_line - 1)
             end = min(end_line, total_lines)
-        lines_to_read = all_lines[start:end]
         response_parts = [
             f"File: {target_file}",
             f"Total lines: {total_lines}",
@@ -225,7 +1005,8 @@ async def tool_read_file(args: dict) -> str:
             response_parts.append(f"Reading lines {start+1} to {end} (inclusive)\n")
         if start > 0 and not should_read_entire_file:
             response_parts.append(f"[... {start} lines before this ...]")
-        content = "".join(lines_to_read)
+        # 只读取并解码请求的行
+        content = file_text.read_lines(start, end)
         response_parts.append(content)
         if end < total_lines and not should_read_entire_file:
             remaining_lines = total_lines - end
@@ -254,6 +1035,8 @@ async def tool_edit_file(args: dict) -> str:
         new_content = apply_edits(original_content, segments, placeholder_pattern)
         with open(target_file, 'w', encoding='utf-8') as f:
             f.write(new_content)
+        app_context.file_cache.invalidate(target_file)
+        update_workspace_indexes(target_file)
         # 缓存本次 edit 操作参数
         last_edit_cache[target_file] = {
             "target_file": target_file,
@@ -264,22 +1047,28 @@ async def tool_edit_file(args: dict) -> str:
     except Exception as e:
         return f"Error editing file: {str(e)}\n{traceback.format_exc()}"
 
+def walk_search_paths(root_dir: str, query: str, limit: int = 10) -> List[str]:
+    matches = []
+    for file_path in iter_workspace_files(root_dir):
+        rel_path = os.path.relpath(file_path, root_dir)
+        if query.lower() in rel_path.lower():
+            matches.append(rel_path)
+            if len(matches) >= limit:
+                break
+    return matches
+
 async def tool_search_files(args: dict) -> str:
     query = args["query"]
     explanation = args["explanation"]
     try:
-        # 在当前工作区递归查找所有文件
-        matches = []
+        # 优先使用工作区索引，不可用时递归遍历工作区
         root_dir = os.getcwd()
-        for dirpath, _, filenames in os.walk(root_dir):
-            for filename in filenames:
-                rel_path = os.path.relpath(os.path.join(dirpath, filename), root_dir)
-                if query.lower() in rel_path.lower():
-                    matches.append(rel_path)
-                    if len(matches) >= 10:
-                        break
-            if len(matches) >= 10:
-                break
+        index = get_workspace_index(root_dir)
+        matches = None
+        if index is not None:
+            matches = await asyncio.to_thread(index.search_paths, query, 10)
+        if matches is None:
+            matches = await asyncio.to_thread(walk_search_paths, root_dir, query, 10)
         if not matches:
             return f"No files found matching query '{query}'.\nExplanation: {explanation}"
         result = [f"Fuzzy file search results for '{query}': (showing up to 10 results)", f"Explanation: {explanation}"]
@@ -289,6 +1078,34 @@ async def tool_search_files(args: dict) -> str:
     except Exception as e:
         return f"Error searching files: {str(e)}\n{traceback.format_exc()}"
 
+async def tool_grep_search(args: dict) -> str:
+    keywords = args.get("keywords")
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    keywords = [keyword for keyword in keywords or [] if keyword]
+    if not keywords:
+        return "Error: Missing required parameter: keywords"
+    explanation = args.get("explanation", "")
+    top_k = max(1, int(args.get("top_k", 20)))
+    directory_path = os.path.abspath(args.get("directory_path") or os.getcwd())
+    if not os.path.isdir(directory_path):
+        return f"Error: Directory '{directory_path}' does not exist."
+    try:
+        index = find_workspace_index(directory_path)
+        file_paths = await asyncio.to_thread(get_search_candidates, directory_path, keywords, app_context.file_cache, index)
+        results, truncated = await asyncio.to_thread(parallel_grep, file_paths, keywords, top_k)
+        if not results:
+            return f"No matches found for {keywords}.\nExplanation: {explanation}"
+        result = [f"Content search results for {keywords}: (showing up to {top_k} results)", f"Explanation: {explanation}"]
+        for item in results:
+            rel_path = os.path.relpath(item["file_path"], directory_path)
+            result.append(f"{rel_path}:{item['line_number']}: {item['line_content']}")
+        if truncated:
+            result.append(f"(Search stopped after {GREP_TIME_BUDGET} seconds, results may be incomplete)")
+        return "\n".join(result)
+    except Exception as e:
+        return f"Error searching file contents: {str(e)}\n{traceback.format_exc()}"
+
 async def tool_terminal_command(args: dict) -> str:
     command = args["command"]
     is_background = args["is_background"]
@@ -313,6 +1130,8 @@ async def tool_terminal_command(args: dict) -> str:
                 stderr=asyncio.subprocess.PIPE
             )
             await proc.communicate()
+            # 命令可能修改工作区中的文件，下一次搜索前重新扫描
+            mark_workspace_indexes_stale()
             return f"Command started in background: {command}"
         else:
             proc = await asyncio.create_subprocess_shell(
@@ -321,6 +1140,7 @@ async def tool_terminal_command(args: dict) -> str:
                 stderr=asyncio.subprocess.PIPE
             )
             stdout, stderr = await proc.communicate()
+            mark_workspace_indexes_stale()
             output = stdout.decode('utf-8', errors='replace')
             error = stderr.decode('utf-8', errors='replace')
             if proc.returncode != 0:
@@ -402,6 +1222,14 @@ async def tool_web_search(args: dict) -> str:
     except Exception as e:
         return json.dumps({"error": f"Unexpected error: {str(e)}"}, ensure_ascii=False, indent=2)
 
+async def tool_diagnostics(args: dict) -> str:
+    diagnostics = {
+        "file_cache": app_context.file_cache.stats(),
+        "workspace_indexes": [index.stats() for index in app_context.indexes.values() if index is not None],
+        "grep": {"max_workers": GREP_MAX_WORKERS, "pool_started": _grep_executor is not None},
+    }
+    return json.dumps(diagnostics, ensure_ascii=False, indent=2)
+
 # --- MCP Handlers ---
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
@@ -422,6 +1250,8 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
             result = await tool_edit_file(arguments or {})
         elif name == "search_files":
             result = await tool_search_files(arguments or {})
+        elif name == "grep_search":
+            result = await tool_grep_search(arguments or {})
         elif name == "terminal_command":
             result = await tool_terminal_command(arguments or {})
         elif name == "reapply":
@@ -430,6 +1260,8 @@ async def handle_call_tool(name: str, arguments: dict[str, Any] | None) -> list[
             result = await tool_list_dir(arguments or {})
         elif name == "web_search":
             result = await tool_web_search(arguments or {})
+        elif name == "diagnostics":
+            result = await tool_diagnostics(arguments or {})
         else:
             result = f"Unknown tool: {name}"
         return [types.TextContent(type="text", text=result)]
@@ -1,3 +1,9 @@
-from mini_cursor.core.database.db_manager import DatabaseManager, get_db_manager
+from mini_cursor.core.database.db_manager import DatabaseManager, get_db_manager, close_db_manager
+from mini_cursor.core.database.async_db import AsyncDatabaseManager, get_async_db_manager, close_async_db_manager
+from mini_cursor.core.database.write_behind import WriteBehindQueue, get_write_behind_queue, close_write_behind_queue
 
-__all__ = ["DatabaseManager", "get_db_manager"] 
\ No newline at end of file
+__all__ = [
+    "DatabaseManager", "get_db_manager", "close_db_manager",
+    "AsyncDatabaseManager", "get_async_db_manager", "close_async_db_manager",
+    "WriteBehindQueue", "get_write_behind_queue", "close_write_behind_queue",
+] 
\ No newline at end of file
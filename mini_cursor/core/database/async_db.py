@@ -0,0 +1,136 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional
+
+from mini_cursor.core.config import DB_READ_POOL_SIZE, SEARCH_REINDEX_BATCH_SIZE
+from mini_cursor.core.database.db_manager import DatabaseManager, get_db_manager, close_db_manager
+
+
+class AsyncDatabaseManager:
+    """
+    DatabaseManager的异步封装，数据库操作不会阻塞事件循环
+
+    所有写操作在唯一的写线程中按提交顺序串行执行；读操作在只读连接池（每个线程一个连接）中并发执行。
+    这样浏览历史记录和保存对话都不会卡住正在进行的SSE流。
+    """
+
+    def __init__(self, db: Optional[DatabaseManager] = None, read_pool_size: int = DB_READ_POOL_SIZE):
+        self.db = db or get_db_manager()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=read_pool_size, thread_name_prefix="db-reader")
+
+    async def _write(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(func, *args, **kwargs))
+
+    async def _read(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(func, *args, **kwargs))
+
+    # --- 写操作 ---
+
+    async def create_conversation(self, title: Optional[str] = None) -> str:
+        return await self._write(self.db.create_conversation, title)
+
+    async def add_message_to_conversation(self, conversation_id: str, sender: str, message: str) -> bool:
+        return await self._write(self.db.add_message_to_conversation, conversation_id, sender, message)
+
+    async def add_tool_call_to_conversation(self, conversation_id: str, tool_name: str, tool_args: str,
+                                            tool_result: str, is_error: bool = False) -> bool:
+        return await self._write(self.db.add_tool_call_to_conversation,
+                                 conversation_id, tool_name, tool_args, tool_result, is_error)
+
+    async def save_turn(self, conversation_id: Optional[str], user_message: str, assistant_message: Optional[str] = None,
+                        tool_calls: Optional[List[Dict[str, Any]]] = None, system_prompt: Optional[str] = None,
+                        summary: Optional[str] = None, create: bool = False,
+                        chat_messages: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
+        return await self._write(self.db.save_turn, conversation_id, user_message, assistant_message,
+                                 tool_calls, system_prompt, summary, create, chat_messages)
+
+    async def set_system_prompt(self, conversation_id: str, system_prompt: str) -> bool:
+        return await self._write(self.db.set_system_prompt, conversation_id, system_prompt)
+
+    async def update_conversation_summary(self, conversation_id: str, summary: str) -> bool:
+        return await self._write(self.db.update_conversation_summary, conversation_id, summary)
+
+    async def delete_conversation(self, conversation_id: str) -> bool:
+        return await self._write(self.db.delete_conversation, conversation_id)
+
+    async def reindex_search(self, full: bool = False, batch_size: int = SEARCH_REINDEX_BATCH_SIZE) -> None:
+        """分批补建全文索引，每批单独提交，期间的对话写入不会被长时间阻塞
+
+        Args:
+            full: 是否清空后重建全部消息的索引
+            batch_size: 每批索引的消息数
+        """
+        if full:
+            await self._write(self.db.reset_search_index)
+        while await self._write(self.db.reindex_search, batch_size):
+            pass
+
+    # --- 读操作 ---
+
+    async def get_conversation(self, conversation_id: str, include_tool_results: bool = True) -> Optional[Dict[str, Any]]:
+        return await self._read(self.db.get_conversation, conversation_id, include_tool_results)
+
+    async def get_chat_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        return await self._read(self.db.get_chat_messages, conversation_id)
+
+    async def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read(self.db.get_conversation_info, conversation_id)
+
+    async def get_messages(self, conversation_id: str, after_seq: Optional[int] = None, before_seq: Optional[int] = None,
+                           limit: Optional[int] = None, from_end: bool = False,
+                           include_tool_results: bool = True) -> List[Dict[str, Any]]:
+        return await self._read(self.db.get_messages, conversation_id, after_seq, before_seq,
+                                limit, from_end, include_tool_results)
+
+    async def get_tool_result(self, conversation_id: str, seq: int) -> Optional[str]:
+        return await self._read(self.db.get_tool_result, conversation_id, seq)
+
+    async def get_blob(self, blob_hash: str) -> Optional[str]:
+        return await self._read(self.db.get_blob, blob_hash)
+
+    async def get_recent_conversations(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return await self._read(self.db.get_recent_conversations, limit)
+
+    async def get_conversations_page(self, limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+        return await self._read(self.db.get_conversations_page, limit, cursor)
+
+    async def search_conversations(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        return await self._read(self.db.search_conversations, query, limit)
+
+    async def get_all_conversations(self) -> List[Dict[str, Any]]:
+        return await self._read(self.db.get_all_conversations)
+
+    async def close(self) -> None:
+        """等待已提交的写操作完成，然后关闭线程池"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self._writer.shutdown, wait=True))
+        self._readers.shutdown(wait=False)
+
+
+# 单例模式，提供全局访问点
+_async_db_instance = None
+
+def get_async_db_manager() -> AsyncDatabaseManager:
+    """
+    获取异步数据库管理器实例（单例模式）
+
+    Returns:
+        AsyncDatabaseManager: 异步数据库管理器实例
+    """
+    global _async_db_instance
+    if _async_db_instance is None:
+        _async_db_instance = AsyncDatabaseManager()
+    return _async_db_instance
+
+
+async def close_async_db_manager() -> None:
+    """关闭异步数据库管理器和底层数据库连接（应用关闭时调用）"""
+    global _async_db_instance
+    if _async_db_instance is not None:
+        await _async_db_instance.close()
+        _async_db_instance = None
+    close_db_manager()
@@ -1,24 +1,44 @@
 import os
 import json
+import base64
+import hashlib
+import zlib
 import sqlite3
+import threading
 import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+
+from mini_cursor.core.config import DB_JOURNAL_MODE, DB_SYNCHRONOUS, TOOL_RESULT_BLOB_THRESHOLD
+
+# 当前数据库结构版本（保存在 PRAGMA user_version 中）
+SCHEMA_VERSION = 2
+# 搜索结果摘要的最大词元数（trigram分词下约等于字符数）
+SEARCH_SNIPPET_TOKENS = 16
 
 
 class DatabaseManager:
     """
     SQLite数据库管理类，用于存储和检索对话历史
-    简化版：使用单一表结构，将对话内容以JSON形式存储
+    
+    conversations表保存对话的元数据，messages表按 (conversation_id, seq) 顺序保存每条消息，
+    追加消息只需一次INSERT，不再读写整个对话内容。
+    
+    写操作使用同一个写连接，并通过锁串行执行；读操作使用每个线程独立的只读连接，
+    配合WAL模式，读取不会被写入阻塞。异步代码应通过AsyncDatabaseManager调用。
     """
     
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, journal_mode: str = DB_JOURNAL_MODE,
+                 synchronous: str = DB_SYNCHRONOUS, blob_threshold: int = TOOL_RESULT_BLOB_THRESHOLD):
         """
         初始化数据库管理器
         
         Args:
             db_path: 数据库文件路径，如果为None则使用默认路径
+            journal_mode: SQLite日志模式，默认WAL
+            synchronous: SQLite同步级别，WAL模式下NORMAL只在检查点时fsync
+            blob_threshold: 工具结果达到该字节数时压缩后存入blobs表
         """
         if db_path is None:
             # 使用项目根目录下的数据文件夹
@@ -29,8 +49,15 @@ class DatabaseManager:
         else:
             self.db_path = Path(db_path)
         
-        self.conn = None
-        self.cursor = None
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.blob_threshold = blob_threshold
+        self.search_tokenizer: Optional[str] = None  # 全文索引的分词器，None表示不支持FTS5
+        self.conn = None  # 写连接
+        self._write_lock = threading.RLock()
+        self._local = threading.local()  # 每个线程的只读连接
+        self._read_conns: List[sqlite3.Connection] = []
+        self._read_conns_lock = threading.Lock()
         self.initialize_database()
     
     def initialize_database(self) -> None:
@@ -38,26 +65,46 @@ class DatabaseManager:
         # 检查数据库文件是否存在
         is_new_db = not self.db_path.exists()
         
-        # 连接到数据库
-        self.conn = sqlite3.connect(str(self.db_path))
+        # 连接到数据库（写连接可能在不同线程中使用，由_write_lock保证串行）
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
         self.conn.row_factory = sqlite3.Row  # 使查询结果可以通过列名访问
-        self.cursor = self.conn.cursor()
+        # auto_vacuum只能在建表之前设置；已有数据库由vacuum()在维护时一次性转换
+        if is_new_db:
+            self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL模式下读连接不会被写事务阻塞；synchronous=NORMAL时提交不再fsync，
+        # 进程崩溃不会丢数据，只有断电可能丢失最近提交的事务
+        self.conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+        self.conn.execute(f"PRAGMA synchronous={self.synchronous}")
         
-        # 如果是新数据库，创建表结构
         if is_new_db:
             print(f"Creating new database at {self.db_path}")
-            self._create_tables()
         else:
             print(f"Connected to existing database at {self.db_path}")
+        
+        # 创建表结构，并把旧版本的数据库迁移到当前结构
+        self._create_tables()
+        self._migrate()
+        self._init_search_index()
+    
+    def _read_conn(self) -> sqlite3.Connection:
+        """获取当前线程的只读连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            with self._read_conns_lock:
+                self._read_conns.append(conn)
+        return conn
     
     def _create_tables(self) -> None:
-        """创建数据库表结构 - 简化版"""
-        # 使用单一的对话表
-        self.cursor.execute('''
+        """创建数据库表结构"""
+        # 对话元数据表（content列仅用于兼容旧版本的JSON存储，迁移后为NULL）
+        self.conn.execute('''
         CREATE TABLE IF NOT EXISTS conversations (
             id TEXT PRIMARY KEY,
             title TEXT,
-            content TEXT,         -- 整个对话内容的JSON字符串
+            content TEXT,         -- 旧版本：整个对话内容的JSON字符串
             created_at TIMESTAMP,
             updated_at TIMESTAMP,
             summary TEXT,
@@ -65,8 +112,284 @@ class DatabaseManager:
         )
         ''')
         
+        # 消息表：每条消息一行，seq为对话内的顺序号
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            sender TEXT NOT NULL,  -- user / assistant / tool
+            content TEXT,
+            tool_name TEXT,
+            tool_args TEXT,
+            tool_result TEXT,
+            is_error INTEGER NOT NULL DEFAULT 0,
+            timestamp TEXT,
+            tool_result_hash TEXT  -- 较大的工具结果保存在blobs表中，tool_result为NULL
+        )
+        ''')
+        
+        # 按内容哈希去重、压缩保存的较大工具结果，多个对话中相同的结果只保存一份
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,  -- 原始内容的sha256
+            codec TEXT NOT NULL,    -- 压缩方式
+            size INTEGER NOT NULL,  -- 原始内容字节数
+            data BLOB NOT NULL
+        )
+        ''')
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_conversation_seq ON messages (conversation_id, seq)"
+        )
+        # 发送给模型的原始消息（OpenAI chat completions格式，包含tool_calls和工具结果），
+        # 用于精确恢复对话；较大的content保存在blobs表中
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            conversation_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            message TEXT NOT NULL,  -- 消息JSON，content保存在blobs表中时不含content
+            content_hash TEXT
+        )
+        ''')
+        self.conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_messages_conversation_seq ON chat_messages (conversation_id, seq)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_chat_messages_content_hash ON chat_messages (content_hash) "
+            "WHERE content_hash IS NOT NULL"
+        )
+        # 对话列表按 (updated_at, id) 倒序分页，索引同时提供排序和键集定位
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at, id)"
+        )
+        
         self.conn.commit()
     
+    def _migrate(self) -> None:
+        """按 PRAGMA user_version 逐步迁移数据库结构"""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(conversations)")}
+        message_columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(messages)")}
+        with self.conn:
+            if version < 1:
+                if "system_prompt" not in columns:
+                    self.conn.execute("ALTER TABLE conversations ADD COLUMN system_prompt TEXT")
+                self._migrate_content_blobs()
+            if version < 2:
+                if "tool_result_hash" not in message_columns:
+                    self.conn.execute("ALTER TABLE messages ADD COLUMN tool_result_hash TEXT")
+                self.conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_messages_tool_result_hash ON messages (tool_result_hash) "
+                    "WHERE tool_result_hash IS NOT NULL"
+                )
+                self._migrate_large_tool_results()
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    def _migrate_content_blobs(self) -> None:
+        """将旧版本conversations.content中的JSON消息列表拆分到messages表"""
+        rows = self.conn.execute(
+            "SELECT id, content FROM conversations WHERE content IS NOT NULL"
+        ).fetchall()
+        if not rows:
+            return
+        
+        print(f"Migrating {len(rows)} conversations to the messages table...")
+        for row in rows:
+            try:
+                content = json.loads(row["content"]) or {}
+            except (TypeError, ValueError):
+                print(f"Skipping conversation {row['id']}: invalid content JSON")
+                continue
+            
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO messages (conversation_id, seq, sender, content, tool_name, tool_args, tool_result, is_error, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        row["id"], seq, msg.get("sender", "unknown"), msg.get("content"),
+                        msg.get("tool_name"), msg.get("tool_args"), msg.get("tool_result"),
+                        1 if msg.get("is_error") else 0, msg.get("timestamp")
+                    )
+                    for seq, msg in enumerate(content.get("messages", []), start=1)
+                ]
+            )
+            self.conn.execute(
+                "UPDATE conversations SET system_prompt = ?, content = NULL WHERE id = ?",
+                (content.get("system_prompt", ""), row["id"])
+            )
+    
+    def _migrate_large_tool_results(self) -> None:
+        """将已有的较大工具结果移到blobs表"""
+        rows = self.conn.execute(
+            "SELECT id, tool_result FROM messages WHERE sender = 'tool' AND length(CAST(tool_result AS BLOB)) >= ?",
+            (self.blob_threshold,)
+        ).fetchall()
+        if not rows:
+            return
+        
+        print(f"Moving {len(rows)} large tool results to the blobs table...")
+        for row in rows:
+            self.conn.execute(
+                "UPDATE messages SET tool_result = NULL, tool_result_hash = ? WHERE id = ?",
+                (self._store_blob(row["tool_result"].encode("utf-8")), row["id"])
+            )
+    
+    def _store_blob(self, raw: bytes) -> str:
+        """压缩并保存内容，已存在相同内容时直接复用（调用方需持有_write_lock并负责提交事务）"""
+        blob_hash = hashlib.sha256(raw).hexdigest()
+        exists = self.conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (blob_hash,)).fetchone()
+        if exists is None:
+            self.conn.execute(
+                "INSERT INTO blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)",
+                (blob_hash, "zlib", len(raw), zlib.compress(raw, 6))
+            )
+        return blob_hash
+    
+    @staticmethod
+    def _decode_blob(codec: str, data: bytes) -> str:
+        """解压blobs表中的内容"""
+        if codec == "zlib":
+            return zlib.decompress(data).decode("utf-8")
+        raise ValueError(f"Unknown blob codec: {codec}")
+    
+    def get_blob(self, blob_hash: str) -> Optional[str]:
+        """
+        按内容哈希读取并解压工具结果
+        
+        Args:
+            blob_hash: 内容哈希
+            
+        Returns:
+            Optional[str]: 工具结果，不存在时返回None
+        """
+        row = self._read_conn().execute(
+            "SELECT codec, data FROM blobs WHERE hash = ?",
+            (blob_hash,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self._decode_blob(row["codec"], row["data"])
+    
+    def _init_search_index(self) -> None:
+        """
+        初始化消息全文索引（FTS5）
+        
+        索引用户/助手消息内容以及工具名称和参数，新消息由触发器在同一事务中写入索引。
+        首次创建时已有的消息记录在search_index_state中，由reindex_search分批补建，
+        不会在启动时长时间占用写连接。
+        """
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        if row is None:
+            try:
+                with self.conn:
+                    self._create_search_index()
+            except sqlite3.OperationalError as e:
+                print(f"Full-text search disabled, SQLite FTS5 is not available: {e}")
+                return
+            row = self.conn.execute("SELECT sql FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        self.search_tokenizer = "trigram" if "trigram" in row["sql"] else "unicode61"
+    
+    def _create_search_index(self) -> None:
+        """创建FTS5表、同步触发器和补建进度（调用方负责事务）"""
+        # trigram分词支持中文等不以空格分词的文本的子串搜索（SQLite 3.34+）
+        try:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE messages_fts USING fts5(content, tool_name, tool_args, tokenize='trigram')"
+            )
+        except sqlite3.OperationalError:
+            self.conn.execute(
+                "CREATE VIRTUAL TABLE messages_fts USING fts5(content, tool_name, tool_args, tokenize='unicode61')"
+            )
+        
+        # 索引行的rowid即messages.id；INSERT OR REPLACE使补建和触发器重复写入同一行时不会出错
+        self.conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT OR REPLACE INTO messages_fts (rowid, content, tool_name, tool_args)
+            VALUES (new.id, new.content, new.tool_name, new.tool_args);
+        END
+        ''')
+        self.conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content, tool_name, tool_args ON messages BEGIN
+            INSERT OR REPLACE INTO messages_fts (rowid, content, tool_name, tool_args)
+            VALUES (new.id, new.content, new.tool_name, new.tool_args);
+        END
+        ''')
+        self.conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            DELETE FROM messages_fts WHERE rowid = old.id;
+        END
+        ''')
+        
+        # 补建进度：id在 [next_id, end_id] 范围内的消息尚未索引，之后的消息由触发器索引
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_index_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            next_id INTEGER NOT NULL,
+            end_id INTEGER NOT NULL
+        )
+        ''')
+        self.conn.execute(
+            "INSERT OR REPLACE INTO search_index_state (id, next_id, end_id) "
+            "SELECT 1, COALESCE(MIN(id), 1), COALESCE(MAX(id), 0) FROM messages"
+        )
+    
+    def reindex_search(self, batch_size: int = 500) -> int:
+        """
+        为尚未索引的消息补建一批全文索引
+        
+        Args:
+            batch_size: 本批最多索引的消息数
+            
+        Returns:
+            int: 仍未索引的消息数，0表示索引已完整
+        """
+        if self.search_tokenizer is None:
+            return 0
+        
+        with self._write_lock, self.conn:
+            next_id, end_id = self.conn.execute(
+                "SELECT next_id, end_id FROM search_index_state WHERE id = 1"
+            ).fetchone()
+            if next_id > end_id:
+                return 0
+            
+            last_id = self.conn.execute(
+                "SELECT MAX(id) FROM (SELECT id FROM messages WHERE id BETWEEN ? AND ? ORDER BY id LIMIT ?)",
+                (next_id, end_id, batch_size)
+            ).fetchone()[0]
+            if last_id is None:
+                last_id = end_id
+            self.conn.execute(
+                "INSERT OR REPLACE INTO messages_fts (rowid, content, tool_name, tool_args) "
+                "SELECT id, content, tool_name, tool_args FROM messages WHERE id BETWEEN ? AND ?",
+                (next_id, last_id)
+            )
+            self.conn.execute(
+                "UPDATE search_index_state SET next_id = ? WHERE id = 1",
+                (last_id + 1,)
+            )
+            
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE id BETWEEN ? AND ?",
+                (last_id + 1, end_id)
+            ).fetchone()[0]
+    
+    def reset_search_index(self) -> None:
+        """清空全文索引，随后由reindex_search分批重建全部消息的索引"""
+        if self.search_tokenizer is None:
+            return
+        
+        with self._write_lock, self.conn:
+            self.conn.execute("DELETE FROM messages_fts")
+            self.conn.execute(
+                "UPDATE search_index_state SET next_id = (SELECT COALESCE(MIN(id), 1) FROM messages), "
+                "end_id = (SELECT COALESCE(MAX(id), 0) FROM messages) WHERE id = 1"
+            )
+    
     def create_conversation(self, title: Optional[str] = None) -> str:
         """
         创建新的对话会话
@@ -83,66 +406,191 @@ class DatabaseManager:
         if title is None:
             title = f"对话 {now.strftime('%Y-%m-%d %H:%M:%S')}"
         
-        # 初始化空对话内容
-        content = json.dumps({
-            "messages": [],
-            "system_prompt": ""
-        })
+        with self._write_lock:
+            self.conn.execute(
+                "INSERT INTO conversations (id, title, system_prompt, created_at, updated_at, turns) VALUES (?, ?, ?, ?, ?, ?)",
+                (conversation_id, title, "", now, now, 0)
+            )
+            self.conn.commit()
         
-        self.cursor.execute(
-            "INSERT INTO conversations (id, title, content, created_at, updated_at, turns) VALUES (?, ?, ?, ?, ?, ?)",
-            (conversation_id, title, content, now, now, 0)
+        return conversation_id
+    
+    def _append_messages(self, conversation_id: str, messages: List[Dict[str, Any]], now: datetime,
+                         summary: Optional[str] = None) -> bool:
+        """追加多条消息并更新对话元数据（调用方需持有_write_lock并负责提交事务）"""
+        # 先更新对话，同时确认对话存在；每条用户消息增加一个轮次
+        turns = sum(1 for msg in messages if msg.get("sender") == "user")
+        cursor = self.conn.execute(
+            "UPDATE conversations SET updated_at = ?, turns = COALESCE(turns, 0) + ?, "
+            "summary = CASE WHEN ? IS NOT NULL AND (summary IS NULL OR summary = '') THEN ? ELSE summary END "
+            "WHERE id = ?",
+            (now, turns, summary, summary, conversation_id)
         )
-        self.conn.commit()
+        if cursor.rowcount == 0:
+            return False
         
-        return conversation_id
+        # seq通过 (conversation_id, seq) 索引取最大值，开销与对话长度无关
+        last_seq = self.conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()[0]
+        rows = []
+        for offset, msg in enumerate(messages, start=1):
+            # 较大的工具结果按内容哈希去重压缩保存，消息中只保留哈希
+            tool_result, tool_result_hash = msg.get("tool_result"), None
+            if tool_result is not None:
+                raw = tool_result.encode("utf-8")
+                if len(raw) >= self.blob_threshold:
+                    tool_result, tool_result_hash = None, self._store_blob(raw)
+            rows.append((
+                conversation_id, last_seq + offset, msg["sender"], msg.get("content"),
+                msg.get("tool_name"), msg.get("tool_args"), tool_result, tool_result_hash,
+                1 if msg.get("is_error") else 0, now.isoformat()
+            ))
+        self.conn.executemany(
+            "INSERT INTO messages (conversation_id, seq, sender, content, tool_name, tool_args, tool_result, tool_result_hash, is_error, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        return True
     
-    def add_message_to_conversation(self, conversation_id: str, sender: str, message: str) -> bool:
+    def save_turn(self, conversation_id: Optional[str], user_message: str, assistant_message: Optional[str] = None,
+                  tool_calls: Optional[List[Dict[str, Any]]] = None, system_prompt: Optional[str] = None,
+                  summary: Optional[str] = None, create: bool = False,
+                  chat_messages: Optional[List[Dict[str, Any]]] = None) -> Optional[str]:
         """
-        向对话中添加新消息
+        在一个事务中保存一整轮对话（只需一次提交）
         
         Args:
-            conversation_id: 对话ID
-            sender: 消息发送者（"user" 或 "assistant"）
-            message: 消息内容
+            conversation_id: 对话ID，为None时生成新ID并创建新对话
+            user_message: 用户消息
+            assistant_message: 助手回复
+            tool_calls: 工具调用记录列表，每项包含tool_name、tool_args、tool_result、is_error
+            system_prompt: 系统提示（仅在创建新对话时保存）
+            summary: 对话摘要（仅在对话还没有摘要时保存）
+            create: 是否以conversation_id创建新对话（调用方预先生成ID，例如写后队列）
+            chat_messages: 本轮发送给模型的原始消息（从用户消息开始，包含助手的tool_calls和工具结果）
             
         Returns:
-            bool: 是否成功添加
+            Optional[str]: 对话ID；指定的对话不存在时返回None
         """
         now = datetime.now()
+        messages = [{"sender": "user", "content": user_message}]
+        if assistant_message:
+            messages.append({"sender": "assistant", "content": assistant_message})
+        for tool_call in tool_calls or []:
+            messages.append({
+                "sender": "tool",
+                "tool_name": tool_call["tool_name"],
+                "tool_args": tool_call["tool_args"],
+                "tool_result": tool_call["tool_result"],
+                "is_error": tool_call.get("is_error", False)
+            })
+        
+        with self._write_lock, self.conn:
+            if conversation_id is None:
+                conversation_id = str(uuid.uuid4())
+                create = True
+            if create:
+                self.conn.execute(
+                    "INSERT INTO conversations (id, title, system_prompt, created_at, updated_at, turns) VALUES (?, ?, ?, ?, ?, ?)",
+                    (conversation_id, f"对话 {now.strftime('%Y-%m-%d %H:%M:%S')}", system_prompt or "", now, now, 0)
+                )
+            if not self._append_messages(conversation_id, messages, now, summary):
+                return None
+            if chat_messages:
+                self._append_chat_messages(conversation_id, chat_messages)
         
-        # 获取当前对话内容
-        self.cursor.execute(
-            "SELECT content, turns FROM conversations WHERE id = ?",
+        return conversation_id
+    
+    def _append_chat_messages(self, conversation_id: str, chat_messages: List[Dict[str, Any]]) -> None:
+        """追加原始消息（调用方需持有_write_lock并负责提交事务）"""
+        last_seq = self.conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM chat_messages WHERE conversation_id = ?",
             (conversation_id,)
+        ).fetchone()[0]
+        rows = []
+        for offset, message in enumerate(chat_messages, start=1):
+            content, content_hash = message.get("content"), None
+            if isinstance(content, str):
+                raw = content.encode("utf-8")
+                if len(raw) >= self.blob_threshold:
+                    message = {key: value for key, value in message.items() if key != "content"}
+                    content_hash = self._store_blob(raw)
+            rows.append((conversation_id, last_seq + offset, json.dumps(message, ensure_ascii=False), content_hash))
+        self.conn.executemany(
+            "INSERT INTO chat_messages (conversation_id, seq, message, content_hash) VALUES (?, ?, ?, ?)",
+            rows
         )
-        result = self.cursor.fetchone()
-        
-        if not result:
-            return False
+    
+    def get_chat_messages(self, conversation_id: str, fill_legacy: bool = True) -> List[Dict[str, Any]]:
+        """
+        获取对话中发送给模型的原始消息（不含系统消息），可直接恢复为消息历史
         
-        content = json.loads(result['content'])
-        turns = result['turns']
+        升级前保存的轮次没有原始消息；对话在升级后继续时只有新轮次有原始消息。
+        fill_legacy为True时，缺少原始消息的前面若干轮用messages表中用户和助手的文本补齐。
         
-        # 添加新消息
-        content['messages'].append({
-            "sender": sender,
-            "content": message,
-            "timestamp": now.isoformat()
-        })
+        Args:
+            conversation_id: 对话ID
+            fill_legacy: 是否补齐升级前的轮次
+            
+        Returns:
+            List[Dict[str, Any]]: OpenAI格式的消息列表
+        """
+        conn = self._read_conn()
+        rows = conn.execute(
+            "SELECT cm.message, b.codec, b.data FROM chat_messages cm "
+            "LEFT JOIN blobs b ON b.hash = cm.content_hash "
+            "WHERE cm.conversation_id = ? ORDER BY cm.seq",
+            (conversation_id,)
+        ).fetchall()
         
-        # 如果是用户消息，增加轮次计数
-        if sender == "user":
-            turns += 1
+        messages = []
+        for row in rows:
+            message = json.loads(row["message"])
+            if row["data"] is not None:
+                message["content"] = self._decode_blob(row["codec"], row["data"])
+            messages.append(message)
+        if fill_legacy:
+            messages = self._legacy_turns(conn, conversation_id, messages) + messages
+        return messages
+    
+    @staticmethod
+    def _legacy_turns(conn: sqlite3.Connection, conversation_id: str,
+                      chat_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """用messages表重建chat_messages中缺少的前面若干轮（每轮以一条用户消息开始）"""
+        rows = conn.execute(
+            "SELECT sender, content FROM messages WHERE conversation_id = ? AND sender IN ('user', 'assistant') "
+            "ORDER BY seq",
+            (conversation_id,)
+        ).fetchall()
+        missing_turns = sum(1 for row in rows if row["sender"] == "user") - \
+            sum(1 for message in chat_messages if message.get("role") == "user")
+        legacy = []
+        for row in rows:
+            if row["sender"] == "user":
+                if missing_turns == 0:
+                    break
+                missing_turns -= 1
+            legacy.append({"role": row["sender"], "content": row["content"] or ""})
+        return legacy
+    
+    def add_message_to_conversation(self, conversation_id: str, sender: str, message: str) -> bool:
+        """
+        向对话中添加新消息
         
-        # 更新对话内容
-        self.cursor.execute(
-            "UPDATE conversations SET content = ?, updated_at = ? WHERE id = ?",
-            (json.dumps(content), now, conversation_id)
-        )
-        self.conn.commit()
+        Args:
+            conversation_id: 对话ID
+            sender: 消息发送者（"user" 或 "assistant"）
+            message: 消息内容
+            
+        Returns:
+            bool: 是否成功添加
+        """
+        now = datetime.now()
         
-        return True
+        with self._write_lock, self.conn:
+            return self._append_messages(conversation_id, [{"sender": sender, "content": message}], now)
     
     def add_tool_call_to_conversation(self, conversation_id: str, tool_name: str, tool_args: str, tool_result: str, is_error: bool = False) -> bool:
         """
@@ -160,36 +608,14 @@ class DatabaseManager:
         """
         now = datetime.now()
         
-        # 获取当前对话内容
-        self.cursor.execute(
-            "SELECT content FROM conversations WHERE id = ?",
-            (conversation_id,)
-        )
-        result = self.cursor.fetchone()
-        
-        if not result:
-            return False
-        
-        content = json.loads(result['content'])
-        
-        # 添加工具调用记录
-        content['messages'].append({
-            "sender": "tool",
-            "tool_name": tool_name,
-            "tool_args": tool_args,
-            "tool_result": tool_result,
-            "is_error": is_error,
-            "timestamp": now.isoformat()
-        })
-        
-        # 更新对话内容
-        self.cursor.execute(
-            "UPDATE conversations SET content = ?, updated_at = ? WHERE id = ?",
-            (json.dumps(content), now, conversation_id)
-        )
-        self.conn.commit()
-        
-        return True
+        with self._write_lock, self.conn:
+            return self._append_messages(conversation_id, [{
+                "sender": "tool",
+                "tool_name": tool_name,
+                "tool_args": tool_args,
+                "tool_result": tool_result,
+                "is_error": is_error
+            }], now)
     
     def set_system_prompt(self, conversation_id: str, system_prompt: str) -> bool:
         """
@@ -202,27 +628,13 @@ class DatabaseManager:
         Returns:
             bool: 是否成功设置
         """
-        # 获取当前对话内容
-        self.cursor.execute(
-            "SELECT content FROM conversations WHERE id = ?",
-            (conversation_id,)
-        )
-        result = self.cursor.fetchone()
-        
-        if not result:
-            return False
-        
-        content = json.loads(result['content'])
-        content['system_prompt'] = system_prompt
-        
-        # 更新对话内容
-        self.cursor.execute(
-            "UPDATE conversations SET content = ? WHERE id = ?",
-            (json.dumps(content), conversation_id)
-        )
-        self.conn.commit()
-        
-        return True
+        with self._write_lock:
+            cursor = self.conn.execute(
+                "UPDATE conversations SET system_prompt = ? WHERE id = ?",
+                (system_prompt, conversation_id)
+            )
+            self.conn.commit()
+            return cursor.rowcount > 0
     
     def update_conversation_summary(self, conversation_id: str, summary: str) -> bool:
         """
@@ -235,40 +647,177 @@ class DatabaseManager:
         Returns:
             bool: 是否成功更新
         """
-        self.cursor.execute(
-            "UPDATE conversations SET summary = ? WHERE id = ?",
-            (summary, conversation_id)
-        )
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        with self._write_lock:
+            cursor = self.conn.execute(
+                "UPDATE conversations SET summary = ? WHERE id = ?",
+                (summary, conversation_id)
+            )
+            self.conn.commit()
+            return cursor.rowcount > 0
     
-    def get_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+    def get_conversation(self, conversation_id: str, include_tool_results: bool = True) -> Optional[Dict[str, Any]]:
         """
         获取对话详情
         
         Args:
             conversation_id: 对话ID
+            include_tool_results: 是否读取工具结果；为False时工具消息的tool_result为None，
+                不读取也不解压blobs表，需要时可用get_tool_result按需读取
             
         Returns:
             Dict[str, Any] 或 None: 对话详情
         """
-        self.cursor.execute(
-            "SELECT * FROM conversations WHERE id = ?",
-            (conversation_id,)
-        )
-        result = self.cursor.fetchone()
+        conn = self._read_conn()
+        # 在同一个读事务中读取对话和消息，保证两者一致
+        conn.execute("BEGIN")
+        try:
+            result = conn.execute(
+                "SELECT * FROM conversations WHERE id = ?",
+                (conversation_id,)
+            ).fetchone()
+            
+            if not result:
+                return None
+            
+            rows = conn.execute(
+                self._messages_query(include_tool_results) + " ORDER BY m.seq",
+                (conversation_id,)
+            ).fetchall()
+        finally:
+            conn.rollback()
+        
+        # 转换为字典，content保持旧版本的结构 {"messages": [...], "system_prompt": ...}
+        conversation_dict = dict(result)
+        conversation_dict['content'] = {
+            "messages": [self._message_from_row(row) for row in rows],
+            "system_prompt": conversation_dict.pop('system_prompt', None) or ""
+        }
         
-        if not result:
+        return conversation_dict
+    
+    def get_conversation_info(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        获取对话的元数据（不含消息），last_seq为最后一条消息的序号
+        
+        Args:
+            conversation_id: 对话ID
+            
+        Returns:
+            Dict[str, Any] 或 None: 对话元数据
+        """
+        row = self._read_conn().execute(
+            "SELECT c.id, c.title, c.created_at, c.updated_at, c.summary, c.turns, c.system_prompt, "
+            "(SELECT COALESCE(MAX(seq), 0) FROM messages WHERE conversation_id = c.id) AS last_seq "
+            "FROM conversations c WHERE c.id = ?",
+            (conversation_id,)
+        ).fetchone()
+        if row is None:
             return None
+        info = dict(row)
+        info["system_prompt"] = info["system_prompt"] or ""
+        return info
+    
+    def get_messages(self, conversation_id: str, after_seq: Optional[int] = None, before_seq: Optional[int] = None,
+                     limit: Optional[int] = None, from_end: bool = False,
+                     include_tool_results: bool = True) -> List[Dict[str, Any]]:
+        """
+        按序号范围获取对话中的消息
         
-        # 转换为字典
-        conversation_dict = dict(result)
+        Args:
+            conversation_id: 对话ID
+            after_seq: 只返回序号大于该值的消息
+            before_seq: 只返回序号小于该值的消息
+            limit: 最多返回的消息数
+            from_end: 为True或指定了before_seq时，返回范围内最新的limit条（用于从最新消息开始向前翻页）
+            include_tool_results: 是否读取工具结果，同get_conversation
+            
+        Returns:
+            List[Dict[str, Any]]: 按序号升序排列的消息，每条包含seq
+        """
+        sql = self._messages_query(include_tool_results)
+        params: List[Any] = [conversation_id]
+        if after_seq is not None:
+            sql += " AND m.seq > ?"
+            params.append(after_seq)
+        if before_seq is not None:
+            sql += " AND m.seq < ?"
+            params.append(before_seq)
         
-        # 解析JSON内容
-        if 'content' in conversation_dict:
-            conversation_dict['content'] = json.loads(conversation_dict['content'])
+        # 通过 (conversation_id, seq) 索引按范围读取，开销只与返回的消息数有关
+        descending = from_end or before_seq is not None
+        sql += " ORDER BY m.seq DESC" if descending else " ORDER BY m.seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
         
-        return conversation_dict
+        rows = self._read_conn().execute(sql, params).fetchall()
+        if descending:
+            rows.reverse()
+        return [self._message_from_row(row) for row in rows]
+    
+    def get_tool_result(self, conversation_id: str, seq: int) -> Optional[str]:
+        """
+        读取单条工具消息的结果
+        
+        Args:
+            conversation_id: 对话ID
+            seq: 消息序号
+            
+        Returns:
+            Optional[str]: 工具结果，消息不存在时返回None
+        """
+        row = self._read_conn().execute(
+            "SELECT m.tool_result, b.codec, b.data FROM messages m "
+            "LEFT JOIN blobs b ON b.hash = m.tool_result_hash "
+            "WHERE m.conversation_id = ? AND m.seq = ? AND m.sender = 'tool'",
+            (conversation_id, seq)
+        ).fetchone()
+        if row is None:
+            return None
+        if row["data"] is not None:
+            return self._decode_blob(row["codec"], row["data"])
+        return row["tool_result"]
+    
+    @staticmethod
+    def _messages_query(include_tool_results: bool) -> str:
+        """构造读取某个对话消息的查询，include_tool_results为False时不读取工具结果的内容"""
+        columns = (
+            "m.seq, m.sender, m.content, m.tool_name, m.tool_args, m.is_error, m.timestamp, m.tool_result_hash, "
+            "COALESCE(b.size, length(CAST(m.tool_result AS BLOB))) AS tool_result_size"
+        )
+        if include_tool_results:
+            columns += ", m.tool_result, b.codec AS blob_codec, b.data AS blob_data"
+        return (
+            f"SELECT {columns} FROM messages m LEFT JOIN blobs b ON b.hash = m.tool_result_hash "
+            "WHERE m.conversation_id = ?"
+        )
+    
+    @staticmethod
+    def _message_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+        """将messages表中的一行转换为消息字典"""
+        if row['sender'] == "tool":
+            tool_result = None
+            if 'tool_result' in row.keys():
+                tool_result = row['tool_result']
+                if row['blob_data'] is not None:
+                    tool_result = DatabaseManager._decode_blob(row['blob_codec'], row['blob_data'])
+            return {
+                "sender": "tool",
+                "seq": row['seq'],
+                "tool_name": row['tool_name'],
+                "tool_args": row['tool_args'],
+                "tool_result": tool_result,
+                "tool_result_hash": row['tool_result_hash'],
+                "tool_result_size": row['tool_result_size'] or 0,
+                "is_error": bool(row['is_error']),
+                "timestamp": row['timestamp']
+            }
+        return {
+            "sender": row['sender'],
+            "seq": row['seq'],
+            "content": row['content'],
+            "timestamp": row['timestamp']
+        }
     
     def get_recent_conversations(self, limit: int = 10) -> List[Dict[str, Any]]:
         """
@@ -280,14 +829,111 @@ class DatabaseManager:
         Returns:
             List[Dict[str, Any]]: 对话列表，按更新时间倒序排列
         """
-        self.cursor.execute(
+        results = self._read_conn().execute(
             "SELECT id, title, created_at, updated_at, summary, turns FROM conversations ORDER BY updated_at DESC LIMIT ?",
             (limit,)
-        )
-        results = self.cursor.fetchall()
+        ).fetchall()
         
         return [dict(row) for row in results]
     
+    def get_conversations_page(self, limit: int = 20, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        按更新时间倒序分页获取对话列表（键集分页）
+        
+        每页从上一页最后一条的 (updated_at, id) 之后继续读取，直接沿索引定位，
+        开销只与页大小有关，与对话总数和翻页深度无关。
+        
+        Args:
+            limit: 每页的最大对话数量
+            cursor: 上一页返回的next_cursor，为None时从最新的对话开始
+            
+        Returns:
+            Dict[str, Any]: {"items": 对话列表, "next_cursor": 下一页游标，没有更多时为None}
+            
+        Raises:
+            ValueError: 游标格式无效
+        """
+        sql = "SELECT id, title, created_at, updated_at, summary, turns FROM conversations"
+        params: Tuple[Any, ...] = ()
+        if cursor:
+            sql += " WHERE (updated_at, id) < (?, ?)"
+            params = _decode_cursor(cursor)
+        sql += " ORDER BY updated_at DESC, id DESC LIMIT ?"
+        
+        # 多取一条用于判断是否还有下一页
+        rows = self._read_conn().execute(sql, params + (limit + 1,)).fetchall()
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = _encode_cursor(rows[limit - 1]["updated_at"], rows[limit - 1]["id"])
+        
+        return {"items": items, "next_cursor": next_cursor}
+    
+    def search_conversations(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        在对话历史中全文搜索
+        
+        搜索用户/助手消息内容以及工具名称和参数，多个以空格分隔的关键词需同时出现。
+        
+        Args:
+            query: 搜索关键词
+            limit: 返回的最大命中数
+            
+        Returns:
+            List[Dict[str, Any]]: 命中的消息，按相关度排序，包含所属对话、消息序号和带【】标记的摘要
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        
+        # trigram分词无法匹配少于3个字符的关键词，此时退回到逐行匹配
+        if self.search_tokenizer is None or (
+            self.search_tokenizer == "trigram" and any(len(term) < 3 for term in terms)
+        ):
+            return self._search_conversations_like(terms, limit)
+        
+        # 每个关键词作为一个短语，避免用户输入被解析为FTS5查询语法
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+        rows = self._read_conn().execute(
+            "SELECT m.conversation_id, c.title, c.updated_at, m.seq, m.sender, m.tool_name, "
+            "snippet(messages_fts, -1, '【', '】', '…', ?) AS snippet, bm25(messages_fts) AS score "
+            "FROM messages_fts "
+            "JOIN messages m ON m.id = messages_fts.rowid "
+            "JOIN conversations c ON c.id = m.conversation_id "
+            "WHERE messages_fts MATCH ? ORDER BY score LIMIT ?",
+            (SEARCH_SNIPPET_TOKENS, match, limit)
+        ).fetchall()
+        
+        return [dict(row) for row in rows]
+    
+    def _search_conversations_like(self, terms: List[str], limit: int) -> List[Dict[str, Any]]:
+        """不使用全文索引的搜索，按消息从新到旧逐行匹配"""
+        conditions = []
+        params: List[Any] = []
+        for term in terms:
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            conditions.append(
+                "(m.content LIKE ? ESCAPE '\\' OR m.tool_name LIKE ? ESCAPE '\\' OR m.tool_args LIKE ? ESCAPE '\\')"
+            )
+            params.extend([pattern, pattern, pattern])
+        
+        rows = self._read_conn().execute(
+            "SELECT m.conversation_id, c.title, c.updated_at, m.seq, m.sender, m.tool_name, "
+            "m.content, m.tool_args "
+            "FROM messages m JOIN conversations c ON c.id = m.conversation_id "
+            f"WHERE {' AND '.join(conditions)} ORDER BY m.id DESC LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        
+        results = []
+        for row in rows:
+            result = dict(row)
+            text = " ".join(filter(None, [result.pop("content"), result["tool_name"], result.pop("tool_args")]))
+            result["snippet"] = _make_snippet(text, terms[0])
+            result["score"] = None
+            results.append(result)
+        return results
+    
     def get_all_conversations(self) -> List[Dict[str, Any]]:
         """
         获取所有对话列表
@@ -295,10 +941,9 @@ class DatabaseManager:
         Returns:
             List[Dict[str, Any]]: 所有对话列表，按更新时间倒序排列
         """
-        self.cursor.execute(
+        results = self._read_conn().execute(
             "SELECT id, title, created_at, updated_at, summary, turns FROM conversations ORDER BY updated_at DESC"
-        )
-        results = self.cursor.fetchall()
+        ).fetchall()
         
         return [dict(row) for row in results]
     
@@ -313,22 +958,206 @@ class DatabaseManager:
             bool: 是否成功删除
         """
         try:
-            self.cursor.execute(
-                "DELETE FROM conversations WHERE id = ?",
-                (conversation_id,)
-            )
-            self.conn.commit()
-            return self.cursor.rowcount > 0
+            with self._write_lock, self.conn:
+                return self._delete_conversations([conversation_id]) > 0
         except sqlite3.Error as e:
             print(f"Error deleting conversation: {e}")
             return False
     
+    def delete_conversations(self, conversation_ids: List[str]) -> int:
+        """
+        在一个事务中批量删除对话
+        
+        Args:
+            conversation_ids: 对话ID列表
+            
+        Returns:
+            int: 删除的对话数
+        """
+        with self._write_lock, self.conn:
+            return self._delete_conversations(conversation_ids)
+    
+    def _delete_conversations(self, conversation_ids: List[str]) -> int:
+        """删除对话及其消息，并清理不再被引用的内容（调用方需持有_write_lock并负责提交事务）"""
+        blob_hashes = set()
+        for conversation_id in conversation_ids:
+            blob_hashes.update(
+                row[0] for row in self.conn.execute(
+                    "SELECT tool_result_hash FROM messages WHERE conversation_id = ? AND tool_result_hash IS NOT NULL "
+                    "UNION SELECT content_hash FROM chat_messages WHERE conversation_id = ? AND content_hash IS NOT NULL",
+                    (conversation_id, conversation_id)
+                )
+            )
+        params = [(conversation_id,) for conversation_id in conversation_ids]
+        self.conn.executemany("DELETE FROM messages WHERE conversation_id = ?", params)
+        self.conn.executemany("DELETE FROM chat_messages WHERE conversation_id = ?", params)
+        # 删除不再被任何消息引用的内容
+        self.conn.executemany(
+            "DELETE FROM blobs WHERE hash = ? "
+            "AND NOT EXISTS (SELECT 1 FROM messages WHERE tool_result_hash = ?) "
+            "AND NOT EXISTS (SELECT 1 FROM chat_messages WHERE content_hash = ?)",
+            [(blob_hash, blob_hash, blob_hash) for blob_hash in blob_hashes]
+        )
+        deleted = 0
+        for param in params:
+            deleted += self.conn.execute("DELETE FROM conversations WHERE id = ?", param).rowcount
+        return deleted
+    
+    def get_oldest_conversation_ids(self, limit: int, updated_before: Optional[datetime] = None) -> List[str]:
+        """
+        按更新时间从旧到新获取对话ID（用于归档）
+        
+        Args:
+            limit: 最多返回的数量
+            updated_before: 只返回在该时间之前最后更新的对话
+            
+        Returns:
+            List[str]: 对话ID列表
+        """
+        sql = "SELECT id FROM conversations"
+        params: List[Any] = []
+        if updated_before is not None:
+            sql += " WHERE updated_at < ?"
+            params.append(updated_before)
+        sql += " ORDER BY updated_at, id LIMIT ?"
+        params.append(limit)
+        return [row["id"] for row in self._read_conn().execute(sql, params)]
+    
+    def get_conversation_sizes(self) -> List[Tuple[str, int]]:
+        """
+        按更新时间从旧到新估算每个对话占用的字节数（用于按大小上限归档）
+        
+        包括对话元数据、消息、原始消息和引用的blob（压缩后的大小），不含全文索引和页面开销。
+        
+        Returns:
+            List[Tuple[str, int]]: (对话ID, 估算字节数)
+        """
+        rows = self._read_conn().execute(
+            "SELECT c.id, "
+            "COALESCE(length(CAST(c.title AS BLOB)), 0) + COALESCE(length(CAST(c.summary AS BLOB)), 0) "
+            "+ COALESCE(length(CAST(c.system_prompt AS BLOB)), 0) "
+            "+ COALESCE((SELECT sum(COALESCE(length(CAST(m.content AS BLOB)), 0) + COALESCE(length(CAST(m.tool_args AS BLOB)), 0) "
+            "+ COALESCE(length(CAST(m.tool_result AS BLOB)), 0)) FROM messages m WHERE m.conversation_id = c.id), 0) "
+            "+ COALESCE((SELECT sum(length(CAST(cm.message AS BLOB))) FROM chat_messages cm WHERE cm.conversation_id = c.id), 0) "
+            "+ COALESCE((SELECT sum(length(b.data)) FROM blobs b WHERE b.hash IN ("
+            "SELECT tool_result_hash FROM messages WHERE conversation_id = c.id "
+            "UNION SELECT content_hash FROM chat_messages WHERE conversation_id = c.id)), 0) AS size "
+            "FROM conversations c ORDER BY c.updated_at, c.id"
+        ).fetchall()
+        return [(row["id"], row["size"]) for row in rows]
+    
+    def export_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """
+        导出对话的全部内容（元数据、消息含工具结果、发送给模型的原始消息），用于归档
+        
+        Args:
+            conversation_id: 对话ID
+            
+        Returns:
+            Dict[str, Any] 或 None: 可序列化为JSON的对话内容
+        """
+        conversation = self.get_conversation(conversation_id)
+        if conversation is None:
+            return None
+        conversation["chat_messages"] = self.get_chat_messages(conversation_id, fill_legacy=False)
+        return conversation
+    
+    def get_storage_stats(self) -> Dict[str, int]:
+        """
+        获取数据库文件的空间使用情况
+        
+        Returns:
+            Dict[str, int]: page_size、page_count、freelist_count、file_bytes（主文件大小）、
+                live_bytes（实际使用的大小）、auto_vacuum（0=NONE，1=FULL，2=INCREMENTAL）
+        """
+        with self._write_lock:
+            page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist_count = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            auto_vacuum = self.conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        return {
+            "page_size": page_size,
+            "page_count": page_count,
+            "freelist_count": freelist_count,
+            "file_bytes": page_size * page_count,
+            "live_bytes": page_size * (page_count - freelist_count),
+            "auto_vacuum": auto_vacuum
+        }
+    
+    def optimize_search_index(self) -> None:
+        """合并全文索引的段，删除对话后已删除消息的索引数据才会真正释放"""
+        if self.search_tokenizer is None:
+            return
+        with self._write_lock, self.conn:
+            self.conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('optimize')")
+    
+    def vacuum(self, max_pages: Optional[int] = None) -> int:
+        """
+        释放空闲页并截断WAL文件
+        
+        数据库还未启用auto_vacuum=INCREMENTAL时，先执行一次完整的VACUUM完成转换；
+        之后每次只需incremental_vacuum，把空闲页归还给文件系统，不用重写整个文件。
+        
+        Args:
+            max_pages: 本次最多释放的页数，None表示全部
+            
+        Returns:
+            int: 释放的页数
+        """
+        with self._write_lock:
+            freelist_before = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                self.conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                self.conn.execute("VACUUM")
+            else:
+                # incremental_vacuum每执行一步只释放一页，execute只会执行一步，需用executescript执行到底
+                pages = "" if max_pages is None else f"({int(max_pages)})"
+                self.conn.executescript(f"PRAGMA incremental_vacuum{pages};")
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            freelist_after = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return freelist_before - freelist_after
+    
     def close(self) -> None:
         """关闭数据库连接"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
-            self.cursor = None
+        with self._read_conns_lock:
+            for conn in self._read_conns:
+                conn.close()
+            self._read_conns.clear()
+        self._local = threading.local()
+        with self._write_lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+
+def _make_snippet(text: str, term: str, context: int = SEARCH_SNIPPET_TOKENS) -> str:
+    """截取关键词附近的文本并用【】标记关键词"""
+    position = text.lower().find(term.lower())
+    if position < 0:
+        return text[:context * 2]
+    start = max(0, position - context // 2)
+    end = min(len(text), position + len(term) + context // 2)
+    return (
+        ("…" if start > 0 else "") + text[start:position] + "【" + text[position:position + len(term)] + "】"
+        + text[position + len(term):end] + ("…" if end < len(text) else "")
+    )
+
+
+def _encode_cursor(updated_at: str, conversation_id: str) -> str:
+    """将分页位置编码为不透明的游标字符串"""
+    raw = json.dumps([updated_at, conversation_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    """解析游标字符串，格式无效时抛出ValueError"""
+    try:
+        updated_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (TypeError, ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if not isinstance(updated_at, str) or not isinstance(conversation_id, str):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return updated_at, conversation_id
 
 
 # 单例模式，提供全局访问点
@@ -344,4 +1173,12 @@ def get_db_manager() -> DatabaseManager:
     global _db_instance
     if _db_instance is None:
         _db_instance = DatabaseManager()
-    return _db_instance 
\ No newline at end of file
+    return _db_instance
+
+
+def close_db_manager() -> None:
+    """关闭全局数据库管理器实例，下次获取时会重新连接"""
+    global _db_instance
+    if _db_instance is not None:
+        _db_instance.close()
+        _db_instance = None
@@ -0,0 +1,173 @@
+"""
+对话持久化的fsync基准测试
+
+注册一个包装默认VFS的SQLite VFS（通过ctypes，需要Python的sqlite3模块动态链接libsqlite3），
+统计每个文件的xSync调用以及删除日志文件时的目录同步，对比：
+- 旧方式：每条消息单独提交 vs save_turn：整轮一次提交
+- 日志模式/同步级别：DELETE+FULL、WAL+FULL、WAL+NORMAL
+
+用法: python -m mini_cursor.core.database.fsync_benchmark [轮数]
+"""
+
+import ctypes
+import ctypes.util
+import os
+import sys
+import tempfile
+import time
+
+from mini_cursor.core.database.db_manager import DatabaseManager
+
+VFS_NAME = b"fsync_counter"
+TOOL_CALLS_PER_TURN = 3
+
+_FILE_METHODS_FIELDS = [
+    "xClose", "xRead", "xWrite", "xTruncate", "xSync", "xFileSize", "xLock", "xUnlock",
+    "xCheckReservedLock", "xFileControl", "xSectorSize", "xDeviceCharacteristics",
+    "xShmMap", "xShmLock", "xShmBarrier", "xShmUnmap", "xFetch", "xUnfetch",
+]
+_VFS_METHODS_FIELDS = [
+    "xOpen", "xDelete", "xAccess", "xFullPathname", "xDlOpen", "xDlError", "xDlSym", "xDlClose",
+    "xRandomness", "xSleep", "xCurrentTime", "xGetLastError", "xCurrentTimeInt64",
+    "xSetSystemCall", "xGetSystemCall", "xNextSystemCall",
+]
+
+
+class _IoMethods(ctypes.Structure):
+    _fields_ = [("iVersion", ctypes.c_int)] + [(name, ctypes.c_void_p) for name in _FILE_METHODS_FIELDS]
+
+
+class _File(ctypes.Structure):
+    _fields_ = [("pMethods", ctypes.POINTER(_IoMethods))]
+
+
+class _Vfs(ctypes.Structure):
+    _fields_ = [
+        ("iVersion", ctypes.c_int),
+        ("szOsFile", ctypes.c_int),
+        ("mxPathname", ctypes.c_int),
+        ("pNext", ctypes.c_void_p),
+        ("zName", ctypes.c_char_p),
+        ("pAppData", ctypes.c_void_p),
+    ] + [(name, ctypes.c_void_p) for name in _VFS_METHODS_FIELDS]
+
+
+_XOPEN = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p, ctypes.POINTER(_File),
+                          ctypes.c_int, ctypes.POINTER(ctypes.c_int))
+_XDELETE = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int)
+_XSYNC = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+
+
+class FsyncCounter:
+    """统计SQLite发出的同步调用次数的VFS（注册为默认VFS）"""
+
+    def __init__(self):
+        self.syncs = 0
+        library = ctypes.util.find_library("sqlite3")
+        if library is None:
+            raise RuntimeError("libsqlite3 not found")
+        self._lib = ctypes.CDLL(library)
+        self._lib.sqlite3_vfs_find.restype = ctypes.POINTER(_Vfs)
+        self._lib.sqlite3_vfs_find.argtypes = [ctypes.c_char_p]
+        self._lib.sqlite3_vfs_register.argtypes = [ctypes.POINTER(_Vfs), ctypes.c_int]
+
+        self._base = self._lib.sqlite3_vfs_find(None)
+        base = self._base.contents
+        self._base_open = _XOPEN(base.xOpen)
+        self._base_delete = _XDELETE(base.xDelete)
+        # 按原始方法表缓存替换了xSync的副本
+        self._methods = {}
+        self._base_syncs = {}
+
+        self._open_callback = _XOPEN(self._open)
+        self._delete_callback = _XDELETE(self._delete)
+        self._sync_callback = _XSYNC(self._sync)
+
+        self.vfs = _Vfs()
+        ctypes.pointer(self.vfs)[0] = base
+        self.vfs.zName = VFS_NAME
+        self.vfs.pNext = None
+        self.vfs.xOpen = ctypes.cast(self._open_callback, ctypes.c_void_p).value
+        self.vfs.xDelete = ctypes.cast(self._delete_callback, ctypes.c_void_p).value
+        self._lib.sqlite3_vfs_register(ctypes.byref(self.vfs), 1)
+
+    def _open(self, vfs, name, file, flags, out_flags):
+        rc = self._base_open(ctypes.cast(self._base, ctypes.c_void_p), name, file, flags, out_flags)
+        if rc == 0 and file.contents.pMethods:
+            address = ctypes.addressof(file.contents.pMethods.contents)
+            methods = self._methods.get(address)
+            if methods is None:
+                methods = _IoMethods()
+                ctypes.pointer(methods)[0] = file.contents.pMethods.contents
+                self._base_syncs[ctypes.addressof(methods)] = _XSYNC(methods.xSync)
+                methods.xSync = ctypes.cast(self._sync_callback, ctypes.c_void_p).value
+                self._methods[address] = methods
+            file.contents.pMethods = ctypes.pointer(methods)
+        return rc
+
+    def _sync(self, file, flags):
+        self.syncs += 1
+        methods = ctypes.cast(file, ctypes.POINTER(_File)).contents.pMethods.contents
+        return self._base_syncs[ctypes.addressof(methods)](file, flags)
+
+    def _delete(self, vfs, name, sync_dir):
+        # 删除回滚日志时unix VFS会同步所在目录
+        if sync_dir:
+            self.syncs += 1
+        return self._base_delete(ctypes.cast(self._base, ctypes.c_void_p), name, sync_dir)
+
+
+def _tool_calls(turn: int):
+    return [
+        {"tool_name": "read_file", "tool_args": f'{{"target_file": "file_{turn}_{i}.py"}}',
+         "tool_result": "x" * 2000, "is_error": False}
+        for i in range(TOOL_CALLS_PER_TURN)
+    ]
+
+
+def _persist_per_call(db: DatabaseManager, conversation_id, turn: int):
+    """重构前process_query的保存方式：每个操作单独提交"""
+    if conversation_id is None:
+        conversation_id = db.create_conversation()
+        db.set_system_prompt(conversation_id, "system prompt")
+    db.add_message_to_conversation(conversation_id, "user", f"question {turn}")
+    db.add_message_to_conversation(conversation_id, "assistant", "answer " * 100)
+    for tool_call in _tool_calls(turn):
+        db.add_tool_call_to_conversation(conversation_id, tool_call["tool_name"], tool_call["tool_args"],
+                                         tool_call["tool_result"], tool_call["is_error"])
+    db.update_conversation_summary(conversation_id, "question 0")
+    return conversation_id
+
+
+def _persist_turn(db: DatabaseManager, conversation_id, turn: int):
+    return db.save_turn(conversation_id, f"question {turn}", "answer " * 100, _tool_calls(turn),
+                        system_prompt="system prompt", summary="question 0")
+
+
+def run_benchmark(turns: int = 50) -> None:
+    counter = FsyncCounter()
+    cases = [
+        ("per-call commits", _persist_per_call, "DELETE", "FULL"),
+        ("per-call commits", _persist_per_call, "WAL", "FULL"),
+        ("per-call commits", _persist_per_call, "WAL", "NORMAL"),
+        ("save_turn", _persist_turn, "WAL", "FULL"),
+        ("save_turn", _persist_turn, "WAL", "NORMAL"),
+    ]
+    print(f"turns: {turns}, tool calls per turn: {TOOL_CALLS_PER_TURN}")
+    print(f"{'write path':<18}{'journal':<9}{'sync':<8}{'fsyncs/turn':>12}{'ms/turn':>10}")
+    for label, persist, journal_mode, synchronous in cases:
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DatabaseManager(os.path.join(tmp, "bench.db"), journal_mode=journal_mode, synchronous=synchronous)
+            conversation_id = None
+            counter.syncs = 0
+            start = time.perf_counter()
+            for turn in range(turns):
+                conversation_id = persist(db, conversation_id, turn)
+            elapsed = time.perf_counter() - start
+            syncs = counter.syncs
+            db.close()
+        print(f"{label:<18}{journal_mode:<9}{synchronous:<8}{syncs / turns:>12.2f}{elapsed / turns * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
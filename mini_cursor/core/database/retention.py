@@ -0,0 +1,159 @@
+"""
+对话数据库的保留策略和维护
+
+按策略选出冷对话（超过保留天数未更新，或数据库超过大小上限时最旧的对话），
+先导出到gzip压缩的NDJSON归档文件（每行一个对话），确认写入磁盘后在一个事务中批量删除，
+然后合并全文索引并通过incremental_vacuum把空闲页归还给文件系统，使热数据库保持较小。
+
+按大小上限归档时，删除对话不会立即减少数据库的使用空间（全文索引的删除标记要等合并后才释放），
+因此在归档前按每个对话的估算大小算出需要归档哪些对话，而不是删除后重新测量。
+
+用法: mini-cursor db maintain [--max-age-days N] [--max-size-mb N] [--archive-dir 目录] [--dry-run]
+"""
+
+import gzip
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from mini_cursor.core.config import DB_RETENTION_DAYS, DB_MAX_SIZE_MB, DB_ARCHIVE_DIR
+from mini_cursor.core.database.db_manager import DatabaseManager
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """对话保留策略，max_age_days和max_size_mb为0表示不限制"""
+    max_age_days: int = DB_RETENTION_DAYS
+    max_size_mb: int = DB_MAX_SIZE_MB
+    archive_dir: Optional[str] = DB_ARCHIVE_DIR
+    batch_size: int = 100
+    # 按大小上限归档时至少保留的最近对话数（超过保留天数的对话不受此限制）
+    keep_recent: int = 10
+
+
+@dataclass
+class MaintenanceReport:
+    """一次维护的结果"""
+    archived: int = 0
+    archive_files: List[str] = field(default_factory=list)
+    freed_pages: int = 0
+    size_before: Dict[str, int] = field(default_factory=dict)
+    size_after: Dict[str, int] = field(default_factory=dict)
+
+
+class RetentionManager:
+    """按RetentionPolicy归档并删除冷对话，然后压缩数据库文件"""
+
+    def __init__(self, db: DatabaseManager, policy: Optional[RetentionPolicy] = None):
+        self.db = db
+        self.policy = policy or RetentionPolicy()
+        self.archive_dir = Path(self.policy.archive_dir) if self.policy.archive_dir else db.db_path.parent / "archive"
+
+    def select_expired(self, limit: int) -> List[str]:
+        """超过保留天数未更新的对话，从旧到新"""
+        if not self.policy.max_age_days:
+            return []
+        cutoff = datetime.now() - timedelta(days=self.policy.max_age_days)
+        return self.db.get_oldest_conversation_ids(limit, updated_before=cutoff)
+
+    def select_over_size(self, exclude: Set[str]) -> List[str]:
+        """
+        为使数据库回到大小上限以内需要归档的最旧对话，从旧到新
+
+        每个对话按估算大小在实际使用空间中所占的比例分摊全文索引和页面开销，
+        从最旧的对话开始累计，直到释放的空间足够；最近的keep_recent个对话不会被选中。
+        exclude中的对话（已按保留天数选中）的空间同样计入释放量。
+        """
+        if not self.policy.max_size_mb:
+            return []
+        live_bytes = self.db.get_storage_stats()["live_bytes"]
+        excess = live_bytes - self.policy.max_size_mb * 1024 * 1024
+        if excess <= 0:
+            return []
+        sizes = self.db.get_conversation_sizes()
+        total = sum(size for _, size in sizes)
+        if not total:
+            return []
+        scale = live_bytes / total
+        excess -= sum(size for conversation_id, size in sizes if conversation_id in exclude) * scale
+        selected = []
+        for conversation_id, size in sizes[:max(0, len(sizes) - self.policy.keep_recent)]:
+            if excess <= 0:
+                break
+            if conversation_id in exclude:
+                continue
+            selected.append(conversation_id)
+            excess -= size * scale
+        return selected
+
+    def plan(self) -> List[str]:
+        """本次维护要归档的对话：先按保留天数，再按大小上限，从旧到新"""
+        expired = self.select_expired(limit=-1)
+        return expired + self.select_over_size(set(expired))
+
+    def archive(self, conversation_ids: List[str], archive_path: Path) -> int:
+        """
+        将对话追加到归档文件并同步到磁盘，然后在一个事务中删除
+
+        Returns:
+            int: 归档的对话数
+        """
+        exported = []
+        for conversation_id in conversation_ids:
+            conversation = self.db.export_conversation(conversation_id)
+            if conversation is not None:
+                exported.append(conversation)
+        if not exported:
+            return 0
+
+        # 每批作为一个独立的gzip成员追加，读取时与单个gzip文件一致；写入失败时不会删除任何对话
+        archive_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(archive_path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="ab") as archive_file:
+                for conversation in exported:
+                    line = json.dumps(conversation, ensure_ascii=False, default=str) + "\n"
+                    archive_file.write(line.encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        return self.db.delete_conversations([conversation["id"] for conversation in exported])
+
+    def run(self, dry_run: bool = False, vacuum: bool = True) -> MaintenanceReport:
+        """
+        执行一次维护：按保留天数归档、按大小上限归档、释放空闲页
+
+        Args:
+            dry_run: 只统计将被归档的对话，不写归档文件也不删除
+            vacuum: 是否在归档后释放空闲页
+
+        Returns:
+            MaintenanceReport: 维护结果
+        """
+        report = MaintenanceReport(size_before=self.db.get_storage_stats())
+        archive_path = self.archive_dir / f"conversations-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson.gz"
+
+        conversation_ids = self.plan()
+        if dry_run:
+            report.archived = len(conversation_ids)
+            report.size_after = report.size_before
+            return report
+
+        for start in range(0, len(conversation_ids), self.policy.batch_size):
+            report.archived += self.archive(conversation_ids[start:start + self.policy.batch_size], archive_path)
+
+        if report.archived:
+            report.archive_files.append(str(archive_path))
+            self.db.optimize_search_index()
+        if vacuum:
+            report.freed_pages = self.db.vacuum()
+        report.size_after = self.db.get_storage_stats()
+        return report
+
+
+def read_archive(archive_path: str) -> List[Dict[str, Any]]:
+    """读取归档文件中的全部对话"""
+    with gzip.open(archive_path, "rt", encoding="utf-8") as archive_file:
+        return [json.loads(line) for line in archive_file if line.strip()]
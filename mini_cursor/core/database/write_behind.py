@@ -0,0 +1,123 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from mini_cursor.core.config import Colors, DB_WRITE_QUEUE_SIZE
+from mini_cursor.core.database.async_db import AsyncDatabaseManager, get_async_db_manager
+
+
+class WriteBehindQueue:
+    """
+    对话持久化的写后队列
+
+    process_query只把整轮对话放入有界队列即可返回，由后台任务按入队顺序逐个写入数据库，
+    因此对话轮次的完成时间不再取决于SQLite。队列满时入队会等待，避免无限积压。
+    读取某个对话前调用wait_for，即可读到该对话所有已入队的写入（read-your-writes）。
+    """
+
+    def __init__(self, db: Optional[AsyncDatabaseManager] = None, max_pending: int = DB_WRITE_QUEUE_SIZE):
+        self.db = db or get_async_db_manager()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._worker: Optional[asyncio.Task] = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    async def enqueue_turn(self, conversation_id: str, user_message: str, assistant_message: Optional[str] = None,
+                           tool_calls: Optional[List[Dict[str, Any]]] = None, system_prompt: Optional[str] = None,
+                           summary: Optional[str] = None, create: bool = False,
+                           chat_messages: Optional[List[Dict[str, Any]]] = None) -> asyncio.Future:
+        """
+        将一整轮对话放入写入队列
+
+        Args:
+            conversation_id: 对话ID（新对话由调用方预先生成，并设置create=True）
+            其余参数同DatabaseManager.save_turn
+
+        Returns:
+            asyncio.Future: 写入完成后的结果（对话ID，失败时为None），调用方无需等待
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        job = (conversation_id, future, dict(
+            user_message=user_message, assistant_message=assistant_message, tool_calls=tool_calls,
+            system_prompt=system_prompt, summary=summary, create=create, chat_messages=chat_messages
+        ))
+        await self._queue.put(job)
+        # put返回后写入任务还没有机会运行，这里登记不会错过完成通知
+        self._pending.setdefault(conversation_id, []).append(future)
+        return future
+
+    async def _run(self) -> None:
+        while True:
+            conversation_id, future, kwargs = await self._queue.get()
+            result = None
+            try:
+                result = await self.db.save_turn(conversation_id, **kwargs)
+                if result is None:
+                    print(f"{Colors.RED}Error: Cannot save messages, conversation {conversation_id} does not exist.{Colors.ENDC}")
+            except Exception as e:
+                print(f"{Colors.RED}Error saving conversation to database: {e}{Colors.ENDC}")
+            finally:
+                if not future.done():
+                    future.set_result(result)
+                futures = self._pending.get(conversation_id)
+                if futures is not None:
+                    futures.remove(future)
+                    if not futures:
+                        del self._pending[conversation_id]
+                self._queue.task_done()
+
+    def pending_count(self, conversation_id: Optional[str] = None) -> int:
+        """返回尚未写入的轮次数，指定conversation_id时只统计该对话"""
+        if conversation_id is None:
+            return self._queue.qsize()
+        return len(self._pending.get(conversation_id, ()))
+
+    async def wait_for(self, conversation_id: Optional[str]) -> None:
+        """等待指定对话所有已入队的写入完成"""
+        futures = list(self._pending.get(conversation_id, ())) if conversation_id else []
+        if futures:
+            # asyncio.wait不会在调用方被取消时取消这些future
+            await asyncio.wait(futures)
+
+    async def flush(self) -> None:
+        """等待队列中的所有写入完成"""
+        if self._worker is not None and not self._worker.done():
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """写入所有待保存的轮次，然后停止后台任务"""
+        await self.flush()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+
+# 单例模式，提供全局访问点
+_write_behind_instance = None
+
+def get_write_behind_queue() -> WriteBehindQueue:
+    """
+    获取对话持久化写后队列实例（单例模式）
+
+    Returns:
+        WriteBehindQueue: 写后队列实例
+    """
+    global _write_behind_instance
+    if _write_behind_instance is None:
+        _write_behind_instance = WriteBehindQueue()
+    return _write_behind_instance
+
+
+async def close_write_behind_queue() -> None:
+    """写入队列中剩余的对话并停止后台任务（应用关闭时调用，需在关闭数据库之前）"""
+    global _write_behind_instance
+    if _write_behind_instance is not None:
+        await _write_behind_instance.close()
+        _write_behind_instance = None
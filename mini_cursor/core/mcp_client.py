@@ -1,42 +1,59 @@
 import json
 from openai import AsyncOpenAI
-import os
 import asyncio
 import traceback
+import uuid
 
-from mini_cursor.core.config import Colors,init_config, VERBOSE_LOGGING, TOOL_CALL_TIMEOUT
+from mini_cursor.core.config import Colors, get_config, reload_config, VERBOSE_LOGGING, TOOL_CALL_TIMEOUT, CONCURRENT_TOOL_CALLS
 from mini_cursor.core.tool_manager import ToolManager
+from mini_cursor.core.stream_accumulator import StreamAccumulator
 from mini_cursor.core.message_manager import MessageManager
 from mini_cursor.core.server_manager import ServerManager
 from mini_cursor.core.tool_history_manager import ToolHistoryManager
 from mini_cursor.core.display_utils import display_tool_history, display_servers, display_message_history
-from mini_cursor.core.database import get_db_manager
+from mini_cursor.core.database import get_async_db_manager, get_write_behind_queue
 
 
 class MCPClient:
-    def __init__(self):
-        self.server_manager = ServerManager()
-        self.tool_manager = ToolManager()
+    def __init__(self, server_manager=None, tool_manager=None):
+        # 可传入共享的服务器管理器和工具管理器（例如Web API中的多个会话），
+        # 此时由创建者负责关闭它们
+        self.owns_managers = server_manager is None and tool_manager is None
+        self.server_manager = server_manager or ServerManager()
+        self.tool_manager = tool_manager or ToolManager()
         self.message_manager = MessageManager()
         self.tool_history_manager = ToolHistoryManager()  # 添加工具历史管理器
         self.update_listener = None  # 添加更新监听器字段
         self.tool_history = []  # 初始化工具调用历史
         
         # 初始化数据库管理器
-        self.db_manager = get_db_manager()
+        self.db_manager = get_async_db_manager()
+        self.write_queue = get_write_behind_queue()
         self.current_conversation_id = None
         self.OPENAI_MODEL=""
-        conf=init_config()
-        OPENAI_API_KEY=conf["OPENAI_API_KEY"]
-        OPENAI_BASE_URL=conf["OPENAI_BASE_URL"]
+        # OpenAI客户端只在base_url或api_key变化时才重建
+        self.client = None
+        self._client_key = None
+        self.config = get_config()
+        self._refresh_client(self.config)
+    
+    def _refresh_client(self, conf):
+        """根据配置快照更新OpenAI客户端，凭证未变化时复用现有客户端"""
+        self.config = conf
+        self.OPENAI_MODEL = conf.model
+        client_key = (conf.base_url, conf.api_key)
+        if self.client is not None and client_key == self._client_key:
+            return
+        # 旧客户端可能仍被进行中的流式请求使用，这里不主动关闭
         self.client = AsyncOpenAI(
-            base_url=OPENAI_BASE_URL,
-            api_key=OPENAI_API_KEY,
+            base_url=conf.base_url,
+            api_key=conf.api_key,
         )
-        
-        
-        
-        
+        self._client_key = client_key
+    
+    def update_config(self):
+        """强制重新加载.env配置并按需重建OpenAI客户端"""
+        self._refresh_client(reload_config())
     
     async def _create_chat_completion(self, messages, tools=None, stream=True, temperature=0.3):
         """封装OpenAI聊天完成API调用的通用方法
@@ -50,8 +67,9 @@ class MCPClient:
         Returns:
             OpenAI API的响应对象
         """
-        conf=init_config()
-        self.OPENAI_MODEL=conf["OPENAI_MODEL"]
+        conf = get_config()
+        if conf is not self.config:
+            self._refresh_client(conf)
         # 构建基本参数
         params = {
             "model": self.OPENAI_MODEL,
@@ -85,32 +103,43 @@ class MCPClient:
         if self.current_conversation_id and self.message_manager.message_history:
             is_existing_conversation = True
         
+        # 同步配置，并按当前模型设置上下文token预算
+        conf = get_config()
+        if conf is not self.config:
+            self._refresh_client(conf)
+        self.message_manager.set_model(self.OPENAI_MODEL)
+        
         # 如果提供了对话历史记录，则恢复消息历史
         if conversation_history:
             self.message_manager.restore_history(conversation_history)
         
         # 添加新的用户查询到消息历史
         messages = self.message_manager.add_user_message(query, system_prompt)
+        # 本轮的用户消息；本轮新增的原始消息单独记录，历史被裁剪后仍能完整保存
+        turn_user_message = messages[-1]
+        turn_messages = [turn_user_message]
         
         # 使用工具管理器获取缓存的工具列表（只有在必要时才会重建）
         all_tools = self.tool_manager.get_all_tools()
 
-        # 检查当前模型是否支持显示思考过程（如deepseek-r1）
-        from mini_cursor.core.config import OPENAI_MODEL
-
         final_text = []
         
         # 收集所有对话内容，稍后再一次性存入数据库
         collected_assistant_response = ""
         collected_tool_calls = []
+        early_tool_tasks = {}
+        accumulator = None
         
         try:
             # 初始化 LLM API 调用
             
             # 处理工具调用循环
             while True:
+                # 工具结果可能使上下文超出预算，每次请求前都按预算裁剪（保留本轮的用户消息）
+                self.message_manager.trim_message_history(pinned=turn_user_message)
+                messages = self.message_manager.get_messages()
+                
                 # 获取大模型响应
-
                 stream_response = await self._create_chat_completion(
                     messages=messages,
                     tools=all_tools,
@@ -119,93 +148,53 @@ class MCPClient:
                 )
                 
                 # 初始化收集变量
-                collected_content = ""
-                collected_reasoning = ""
-                tool_calls = []
+                accumulator = StreamAccumulator()
+                reasoning_started = False
+                assembler = accumulator.tool_calls
+                # 在流式生成过程中已提前开始执行的只读工具调用: tool_call_id -> Task
+                early_tool_tasks = {}
                 
                 # 处理流式响应
                 print(f"\n{Colors.BOLD}{Colors.CYAN}Response:{Colors.ENDC} ", end="", flush=True)
                 async for chunk in stream_response:
-                    delta = chunk.choices[0].delta
+                    content_chunk, reasoning_chunk, completed_indices = accumulator.feed(chunk)
                     
                     # 处理内容部分
-                    if delta.content:
-                        print(f"{delta.content}", end="", flush=True)
-                        collected_content += delta.content
+                    if content_chunk:
+                        print(content_chunk, end="", flush=True)
                         # 通知内容更新
-                        self.notify_update('assistant_message', delta.content)
+                        self.notify_update('assistant_message', content_chunk)
                     
-                    # 处理 reasoning_content（思考过程）
-                    reasoning_chunk = None
-                    if hasattr(delta, 'message') and hasattr(delta.message, 'reasoning_content'):
-                        reasoning_chunk = delta.message.reasoning_content
-                    elif hasattr(delta, 'reasoning_content') and delta.reasoning_content:
-                        reasoning_chunk = delta.reasoning_content
-                        
                     # 如果有思考内容，流式显示
                     if reasoning_chunk:
                         # 第一次收到思考内容时显示标题
-                        if not collected_reasoning:
+                        if not reasoning_started:
+                            reasoning_started = True
                             print(f"\n{Colors.BOLD}{Colors.YELLOW}[思考过程]{Colors.ENDC} ", end="", flush=True)
                         # 显示增量思考内容
                         print(f"{Colors.YELLOW}{reasoning_chunk}{Colors.ENDC}", end="", flush=True)
-                        # 累加到收集的思考内容中
-                        collected_reasoning += reasoning_chunk
                         # 通知思考过程更新
                         self.notify_update('thinking', reasoning_chunk)
                     
-                    # 用于诊断的代码 - 仅在VERBOSE_LOGGING为True时才会执行
-                    if VERBOSE_LOGGING and chunk.choices[0] and os.environ.get("DEBUG_CHUNKS", "0") == "1":
-                        try:
-                            # 尝试将delta转换为字典来查看其结构
-                            delta_dict = {}
-                            if hasattr(chunk.choices[0], 'model_dump'):
-                                delta_dict = json.loads(json.dumps(chunk.choices[0].model_dump()))
-                            elif hasattr(chunk.choices[0], 'to_dict'): 
-                                delta_dict = chunk.choices[0].to_dict()
-                            
-                            if delta_dict and 'delta' in delta_dict and delta_dict['delta']:
-                                print(f"\n{Colors.DIM}[DEBUG] Chunk structure: {json.dumps(delta_dict)}{Colors.ENDC}", flush=True)
-                        except Exception as e:
-                            print(f"\n{Colors.DIM}[DEBUG] Failed to dump chunk: {e}{Colors.ENDC}", flush=True)
-                    
-                    # 处理工具调用部分
-                    if delta.tool_calls:
-                        for tool_call_delta in delta.tool_calls:
-                            # 初始化新的工具调用或更新现有的
-                            tool_call_id = tool_call_delta.index
-                            while len(tool_calls) <= tool_call_id:
-                                tool_calls.append({"id": "","type":"function", "function": {"name": "", "arguments": ""}})
-                            
-                            if tool_call_delta.id:
-                                tool_calls[tool_call_id]["id"] = tool_call_delta.id
-                            
-                            if tool_call_delta.function:
-                                if tool_call_delta.function.name:
-                                    tool_calls[tool_call_id]["function"]["name"] = tool_call_delta.function.name
-                                
-                                if tool_call_delta.function.arguments:
-                                    tool_calls[tool_call_id]["function"]["arguments"] += tool_call_delta.function.arguments
-                    
-                    # 完成流式处理，构建最终消息
-                    collected_reasoning_content = ""
-                    
-                    # 用于收集整个流式过程中可能的reasoning_content（针对可能的完整回传情况）
-                    for chunk in stream_response.__dict__.get('_response_data', {}).get('choices', []):
-                        if chunk.get('delta', {}).get('reasoning_content'):
-                            collected_reasoning_content += chunk['delta']['reasoning_content']
-                    
-                    # 如果前面流式过程中没有收集到reasoning_content但最终数据里有，则显示
-                    if not collected_reasoning and collected_reasoning_content:
-                        print(f"\n{Colors.BOLD}{Colors.YELLOW}[思考过程]{Colors.ENDC} {Colors.YELLOW}{collected_reasoning_content}{Colors.ENDC}", flush=True)
-                        collected_reasoning = collected_reasoning_content
-                    
+                    # 已完整的只读工具调用提前执行
+                    for index in completed_indices:
+                        self._maybe_dispatch_early(assembler, index, early_tool_tasks)
+                
+                # 流结束：拼接内容，剩余的工具调用全部视为完整
+                accumulator.finish(stream_response)
+                collected_content = accumulator.content
+                collected_reasoning = accumulator.reasoning
+                
+                # 如果前面流式过程中没有收集到reasoning_content但最终数据里有，则显示
+                if collected_reasoning and not reasoning_started:
+                    print(f"\n{Colors.BOLD}{Colors.YELLOW}[思考过程]{Colors.ENDC} {Colors.YELLOW}{collected_reasoning}{Colors.ENDC}", flush=True)
+                
                 # 构建消息对象
                 message = {
                     'role': 'assistant',
                     'content': collected_content.strip(),
                     'reasoning_content': collected_reasoning if collected_reasoning else None,
-                    'tool_calls': [t for t in tool_calls if t["id"]]
+                    'tool_calls': assembler.get_tool_calls()
                 }
                 
                 # 更新历史和显示结果
@@ -217,6 +206,7 @@ class MCPClient:
                     self.message_manager.add_assistant_message(
                         llm_response=message
                     )
+                    turn_messages.append(message)
                     
                     if collected_content:
                         collected_assistant_response = collected_content
@@ -230,139 +220,20 @@ class MCPClient:
                 print("\n")  # 为工具调用添加一个分隔行
                 # 创建一个集合来存储已处理的工具调用ID，防止重复添加
                 processed_tool_call_ids = set()
-                
-                # 处理每个工具调用
+                pending_tool_calls = []
                 for tool_call in message['tool_calls']:
                     # 跳过已处理的工具调用ID
                     if tool_call["id"] in processed_tool_call_ids:
                         continue
-                    
-                    # 记录这个工具调用ID已被处理
                     processed_tool_call_ids.add(tool_call["id"])
-                    
-                    tool_name = tool_call["function"]["name"]
-                    
-                    # 查找提供该工具的服务器
-                    server_name, tool = self.tool_manager.find_tool_server(tool_name)
-                    if not server_name:
-                        error_msg = f"Tool {tool_name} is not available from any connected MCP server"
-                        print(f"\n{Colors.RED}{error_msg}{Colors.ENDC}")
-                        # 添加一个工具响应
-                        self.message_manager.add_tool_result(tool_call["id"], error_msg)
-                        # 通知工具调用错误
-                        self.notify_update('tool_error', {'name': tool_name, 'error': error_msg})
-                        
-                        # 收集工具调用错误
-                        collected_tool_calls.append({
-                            "tool_name": tool_name,
-                            "tool_args": "{}",
-                            "tool_result": f"Error: {error_msg}",
-                            "is_error": True
-                        })
-                        continue
-                    
-                    # 解析工具参数
-                    tool_args = self.tool_manager.parse_tool_arguments(tool_call["function"]["arguments"])
-                    
-                    # 尝试执行工具
-                    try:
-                        # 记录工具调用到历史管理器
-                        call_id = self.tool_history_manager.record_tool_call(tool_name, tool_args)
-                        
-                        # 通知工具调用开始
-                        self.notify_update('tool_call', {'id': call_id, 'name': tool_name, 'arguments': tool_args})
-                        
-                        # 打印工具调用信息
-                        print(f"\n{Colors.GREEN}Calling tool:{Colors.ENDC} {tool_name}")
-                        
-                        # 执行工具调用，增加额外的超时保护
-                        try:
-                            # 使用asyncio.wait_for添加额外的超时保护
-                            result = await self.server_manager.execute_tool(server_name, tool_name, tool_args)
-                        except Exception as ex:
-                            error_msg = f"Tool call timeout: {tool_name} exceeded {TOOL_CALL_TIMEOUT} seconds"
-                            print(f"\n{Colors.RED}{error_msg}{Colors.ENDC}")
-                            
-                            # 记录工具调用结果
-                            self.tool_history_manager.record_tool_result(call_id, None, error_msg)
-                            
-                            # 添加超时结果到历史记录
-                            self.message_manager.add_tool_result(tool_call["id"], f"Error: {error_msg}")
-                            
-                            # 收集工具调用错误
-                            collected_tool_calls.append({
-                                "tool_name": tool_name,
-                                "tool_args": json.dumps(tool_args),
-                                "tool_result": f"Error: {error_msg}",
-                                "is_error": True
-                            })
-                            
-                            # 通知工具调用超时
-                            self.notify_update('tool_error', {'id': call_id, 'name': tool_name, 'error': error_msg})
-                            continue
-                        
-                        # 记录工具调用结果
-                        self.tool_history_manager.record_tool_result(call_id, result)
-                        
-                        # 添加工具结果到历史记录
-                        self.message_manager.add_tool_result(tool_call["id"], result)
-                        
-                        # 将工具调用和结果添加到历史
-                        self.tool_history.append({
-                            "tool": tool_name,
-                            "args": tool_args,
-                            "result": str(result)
-                        })
-                        
-                        # 收集工具调用结果
-                        collected_tool_calls.append({
-                            "tool_name": tool_name,
-                            "tool_args": json.dumps(tool_args),
-                            "tool_result": str(result),
-                            "is_error": False
-                        })
-                        
-                        # 增加延迟以防止过快执行工具调用
-                        await asyncio.sleep(0.1)
-                        
-                        # 将结果发送给客户端
-                        tool_result_data = {
-                            'id': call_id,
-                            'name': tool_name,
-                            'result': result
-                        }
-                        
-                        # 打印工具结果
-                        print(f"{Colors.GREEN}Tool result:{Colors.ENDC} {result}")
-                        # 通知工具调用结果
-                        self.notify_update('tool_result', tool_result_data)
-                    except Exception as e:
-                        error_msg = f"Error calling tool {tool_name}: {str(e)}"
-                        print(f"\n{Colors.RED}{error_msg}{Colors.ENDC}")
-                        if VERBOSE_LOGGING:
-                            traceback.print_exc()  # 打印详细的错误栈
-                        
-                        # 如果有记录工具调用，记录错误结果
-                        if 'call_id' in locals():
-                            self.tool_history_manager.record_tool_result(call_id, None, error_msg)
-                        
-                        # 添加错误结果到历史记录
-                        self.message_manager.add_tool_result(tool_call["id"], f"Error: {str(e)}")
-                        
-                        # 收集工具调用错误
-                        collected_tool_calls.append({
-                            "tool_name": tool_name,
-                            "tool_args": json.dumps(tool_args) if 'tool_args' in locals() else "{}",
-                            "tool_result": f"Error: {error_msg}",
-                            "is_error": True
-                        })
-                        
-                        # 通知工具调用错误
-                        self.notify_update('tool_error', {
-                            'id': call_id if 'call_id' in locals() else None,
-                            'name': tool_name,
-                            'error': error_msg
-                        })
+                    pending_tool_calls.append(tool_call)
+                
+                # 执行工具调用（只读工具并发执行），结果按原始tool_call_id顺序写入历史
+                outcomes = await self._dispatch_tool_calls(pending_tool_calls, early_tool_tasks)
+                for tool_call, (content, collected) in zip(pending_tool_calls, outcomes):
+                    self.message_manager.add_tool_result(tool_call["id"], content)
+                    turn_messages.append(self.message_manager.get_messages()[-1])
+                    collected_tool_calls.append(collected)
                 
                 # 获取最新的响应消息
                 messages = self.message_manager.get_messages()
@@ -370,43 +241,30 @@ class MCPClient:
                 # 提示再次询问AI
                 print("\n\n再次询问AI以获取回复...\n")
             
-            # 保存会话到数据库
+            # 保存会话到数据库：整轮对话（用户消息、助手回复、工具调用和摘要）放入写后队列，
+            # 在一个事务中提交，本轮无需等待磁盘写入即可结束
             if len(self.message_manager.get_messages()) > 2:  
                 try:
-                    # If it's a new conversation, create the record
+                    # 简单摘要：截取对话中第一条用户消息的前50个字符（仅在对话还没有摘要时保存）
+                    summary = query[:50] + ('...' if len(query) > 50 else '') if query else None
+                    # 新对话的ID在这里预先生成，后续轮次和读取无需等待写入完成
+                    conversation_id = self.current_conversation_id if is_existing_conversation else str(uuid.uuid4())
+                    await self.write_queue.enqueue_turn(
+                        conversation_id,
+                        query,
+                        collected_assistant_response,
+                        collected_tool_calls,
+                        system_prompt=system_prompt,
+                        summary=summary,
+                        create=not is_existing_conversation,
+                        # 本轮新增的原始消息（用户消息、带tool_calls的助手消息和工具结果），用于精确恢复对话
+                        chat_messages=turn_messages
+                    )
                     if not is_existing_conversation:
-                        # Create new conversation in DB
-                        self.current_conversation_id = self.db_manager.create_conversation()
-                        print(f"\n{Colors.YELLOW}Created new conversation with ID: {self.current_conversation_id}{Colors.ENDC}")
-                        # Set system prompt if provided
-                        if system_prompt:
-                            self.db_manager.set_system_prompt(self.current_conversation_id, system_prompt)
-                    
-                    # Ensure we have a conversation ID before proceeding
-                    if not self.current_conversation_id:
-                         print(f"{Colors.RED}Error: Cannot save messages, current_conversation_id is not set.{Colors.ENDC}")
-                         # Potentially raise an error or handle this case appropriately
-                         return "\n".join(final_text) if final_text else "" # Exit early if no ID
-
-                    # Add user query to DB
-                    self.db_manager.add_message_to_conversation(self.current_conversation_id, "user", query)
-                    
-                    # Add assistant response to DB if it exists
-                    if collected_assistant_response:
-                       self.db_manager.add_message_to_conversation(self.current_conversation_id, "assistant", collected_assistant_response)
-                    
-                    # Add all tool calls to DB
-                    for tool_call in collected_tool_calls:
-                        self.db_manager.add_tool_call_to_conversation(
-                            self.current_conversation_id,
-                            tool_call["tool_name"],
-                            tool_call["tool_args"],
-                            tool_call["tool_result"],
-                            tool_call.get("is_error", False) # Pass is_error if available
-                        )
+                        print(f"\n{Colors.YELLOW}Created new conversation with ID: {conversation_id}{Colors.ENDC}")
+                    self.current_conversation_id = conversation_id
                     
-                    # Log successful storage
-                    print(f"\n{Colors.GREEN}Conversation saved/updated successfully in DB, ID: {self.current_conversation_id}{Colors.ENDC}")
+                    print(f"\n{Colors.GREEN}Conversation queued for saving, ID: {self.current_conversation_id}{Colors.ENDC}")
                     
                 except Exception as e:
                     print(f"{Colors.RED}Error saving conversation to database: {e}{Colors.ENDC}")
@@ -417,28 +275,6 @@ class MCPClient:
                  print(f"\n{Colors.YELLOW}Conversation not saved: Insufficient turns (<= 1 turn completed).{Colors.ENDC}")
                  pass # No explicit action needed here for now based on the logic structure
             
-            # 尝试创建对话摘要
-            if self.current_conversation_id:
-                try:
-                    # 尝试获取前两轮对话作为摘要
-                    conversation = self.db_manager.get_conversation(self.current_conversation_id)
-                    if conversation and 'content' in conversation:
-                        messages = conversation['content'].get('messages', [])
-                        if len(messages) >= 2:
-                            # 简单摘要：截取用户第一条消息前50个字符
-                            for msg in messages:
-                                if msg.get('sender') == 'user':
-                                    summary = msg.get('content', '')[:50]
-                                    if summary:
-                                        self.db_manager.update_conversation_summary(
-                                            self.current_conversation_id,
-                                            summary + ('...' if len(msg.get('content', '')) > 50 else '')
-                                        )
-                                    break
-                except Exception as e:
-                    if VERBOSE_LOGGING:
-                        print(f"{Colors.YELLOW}Failed to create conversation summary: {e}{Colors.ENDC}")
-            
             return "\n".join(final_text) if final_text else ""
             
         except Exception as e:
@@ -448,6 +284,170 @@ class MCPClient:
             if VERBOSE_LOGGING:
                 traceback.print_exc()
             return error_message
+        finally:
+            # 流式过程中出错或被取消时关闭录制文件
+            if accumulator is not None:
+                accumulator.close()
+            # 流式过程中出错或被取消时，不再需要提前启动的工具调用
+            for task in early_tool_tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    def _maybe_dispatch_early(self, assembler, index, early_tool_tasks):
+        """在LLM仍在流式生成时提前执行已完整的只读工具调用
+        
+        只有当该工具调用及其之前的所有工具调用都明确是只读工具（见ToolManager.is_read_only_tool）
+        时才提前执行，这样有副作用或未声明只读的工具仍然在流结束后按原始顺序执行，且不会有只读调用越过它们。
+        """
+        if not CONCURRENT_TOOL_CALLS:
+            return
+        for previous in assembler.tool_calls[:index + 1]:
+            if not self.tool_manager.is_read_only_tool(previous["function"]["name"]):
+                return
+        tool_call = assembler.tool_calls[index]
+        if not tool_call["id"] or tool_call["id"] in early_tool_tasks:
+            return
+        early_tool_tasks[tool_call["id"]] = asyncio.create_task(self._execute_tool_call(tool_call))
+    
+    async def _dispatch_tool_calls(self, tool_calls, early_tool_tasks=None):
+        """执行一轮中的所有工具调用
+        
+        连续的只读工具调用（见ToolManager.is_read_only_tool）并发执行；其他工具
+        单独执行，并作为前后批次之间的屏障，保证其相对顺序不变。
+        已在流式生成期间提前启动的调用（early_tool_tasks）直接等待其结果。
+        
+        Returns:
+            与tool_calls顺序一致的 (消息内容, 数据库记录) 列表
+        """
+        early_tool_tasks = early_tool_tasks or {}
+        outcomes = [None] * len(tool_calls)
+        batch = []
+        
+        def start(tool_call):
+            task = early_tool_tasks.get(tool_call["id"])
+            return task if task is not None else self._execute_tool_call(tool_call)
+        
+        async def flush_batch():
+            if not batch:
+                return
+            results = await asyncio.gather(*(start(tool_calls[i]) for i in batch))
+            for i, result in zip(batch, results):
+                outcomes[i] = result
+            batch.clear()
+        
+        for index, tool_call in enumerate(tool_calls):
+            tool_name = tool_call["function"]["name"]
+            if CONCURRENT_TOOL_CALLS and self.tool_manager.is_read_only_tool(tool_name):
+                batch.append(index)
+                continue
+            # 串行工具：先等待之前的并发批次完成，再单独执行
+            await flush_batch()
+            outcomes[index] = await start(tool_call)
+        await flush_batch()
+        
+        return outcomes
+    
+    async def _execute_tool_call(self, tool_call):
+        """执行单个工具调用并发送通知
+        
+        Returns:
+            (写入消息历史的内容, 用于存入数据库的工具调用记录)
+        """
+        tool_name = tool_call["function"]["name"]
+        
+        # 查找提供该工具的服务器
+        server_name, tool = self.tool_manager.find_tool_server(tool_name)
+        if not server_name:
+            error_msg = f"Tool {tool_name} is not available from any connected MCP server"
+            print(f"\n{Colors.RED}{error_msg}{Colors.ENDC}")
+            # 通知工具调用错误
+            self.notify_update('tool_error', {'name': tool_name, 'error': error_msg})
+            return error_msg, {
+                "tool_name": tool_name,
+                "tool_args": "{}",
+                "tool_result": f"Error: {error_msg}",
+                "is_error": True
+            }
+        
+        # 解析工具参数
+        tool_args = self.tool_manager.parse_tool_arguments(tool_call["function"]["arguments"])
+        call_id = None
+        
+        # 尝试执行工具
+        try:
+            # 记录工具调用到历史管理器
+            call_id = self.tool_history_manager.record_tool_call(tool_name, tool_args)
+            
+            # 通知工具调用开始
+            self.notify_update('tool_call', {'id': call_id, 'name': tool_name, 'arguments': tool_args})
+            
+            # 打印工具调用信息
+            print(f"\n{Colors.GREEN}Calling tool:{Colors.ENDC} {tool_name}")
+            
+            try:
+                result = await self.server_manager.execute_tool(server_name, tool_name, tool_args)
+            except Exception:
+                error_msg = f"Tool call timeout: {tool_name} exceeded {TOOL_CALL_TIMEOUT} seconds"
+                print(f"\n{Colors.RED}{error_msg}{Colors.ENDC}")
+                
+                # 记录工具调用结果
+                self.tool_history_manager.record_tool_result(call_id, None, error_msg)
+                
+                # 通知工具调用超时
+                self.notify_update('tool_error', {'id': call_id, 'name': tool_name, 'error': error_msg})
+                return f"Error: {error_msg}", {
+                    "tool_name": tool_name,
+                    "tool_args": json.dumps(tool_args),
+                    "tool_result": f"Error: {error_msg}",
+                    "is_error": True
+                }
+            
+            # 记录工具调用结果
+            self.tool_history_manager.record_tool_result(call_id, result)
+            
+            # 将工具调用和结果添加到历史
+            self.tool_history.append({
+                "tool": tool_name,
+                "args": tool_args,
+                "result": str(result)
+            })
+            
+            # 打印工具结果
+            print(f"{Colors.GREEN}Tool result:{Colors.ENDC} {result}")
+            # 通知工具调用结果
+            self.notify_update('tool_result', {
+                'id': call_id,
+                'name': tool_name,
+                'result': result
+            })
+            return result, {
+                "tool_name": tool_name,
+                "tool_args": json.dumps(tool_args),
+                "tool_result": str(result),
+                "is_error": False
+            }
+        except Exception as e:
+            error_msg = f"Error calling tool {tool_name}: {str(e)}"
+            print(f"\n{Colors.RED}{error_msg}{Colors.ENDC}")
+            if VERBOSE_LOGGING:
+                traceback.print_exc()  # 打印详细的错误栈
+            
+            # 如果有记录工具调用，记录错误结果
+            if call_id:
+                self.tool_history_manager.record_tool_result(call_id, None, error_msg)
+            
+            # 通知工具调用错误
+            self.notify_update('tool_error', {
+                'id': call_id,
+                'name': tool_name,
+                'error': error_msg
+            })
+            return f"Error: {str(e)}", {
+                "tool_name": tool_name,
+                "tool_args": json.dumps(tool_args),
+                "tool_result": f"Error: {error_msg}",
+                "is_error": True
+            }
 
     def display_tool_history(self):
         """显示工具调用历史"""
@@ -497,12 +497,16 @@ class MCPClient:
         print("\n正在优雅地关闭所有连接和资源...")
         
         try:
-            # 1. 首先关闭服务器管理器，这会关闭所有MCP服务器连接
-            await self.server_manager.close()
+            # 等待本对话尚未写入数据库的轮次
+            await self.write_queue.wait_for(self.current_conversation_id)
             
-            # 2. 清理工具管理器中的任何资源
-            if hasattr(self.tool_manager, 'close') and callable(self.tool_manager.close):
-                await self.tool_manager.close()
+            if self.owns_managers:
+                # 1. 首先关闭服务器管理器，这会关闭所有MCP服务器连接
+                await self.server_manager.close()
+                
+                # 2. 清理工具管理器中的任何资源
+                if hasattr(self.tool_manager, 'close') and callable(self.tool_manager.close):
+                    await self.tool_manager.close()
             
             # 3. 关闭OpenAI客户端（如果需要）
             if hasattr(self.client, 'close') and callable(self.client.close):
@@ -1,8 +1,83 @@
-from mini_cursor.core.config import Colors
+import json
+import re
+
+from mini_cursor.core.config import Colors, DEFAULT_CONTEXT_TOKEN_BUDGET, get_context_token_budget
+
+# 每条消息的固定开销（role、分隔符等）
+MESSAGE_TOKEN_OVERHEAD = 4
+# 中日韩字符通常每个字符约占一个token
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+_tiktoken_encoding = None
+_tiktoken_checked = False
+
+
+def estimate_text_tokens(text):
+    """估算文本的token数量，安装了tiktoken时使用精确编码，否则按字符估算"""
+    global _tiktoken_encoding, _tiktoken_checked
+    if not text:
+        return 0
+    if not _tiktoken_checked:
+        _tiktoken_checked = True
+        try:
+            import tiktoken
+            _tiktoken_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _tiktoken_encoding = None
+    if _tiktoken_encoding is not None:
+        return len(_tiktoken_encoding.encode(text, disallowed_special=()))
+    cjk_chars = len(_CJK_PATTERN.findall(text))
+    return cjk_chars + (len(text) - cjk_chars + 3) // 4
+
+
+def estimate_message_tokens(message):
+    """估算单条聊天消息（包括工具调用参数和思考内容）的token数量"""
+    tokens = MESSAGE_TOKEN_OVERHEAD
+    content = message.get("content")
+    if isinstance(content, str):
+        tokens += estimate_text_tokens(content)
+    elif content:
+        tokens += estimate_text_tokens(json.dumps(content, ensure_ascii=False))
+    if message.get("reasoning_content"):
+        tokens += estimate_text_tokens(message["reasoning_content"])
+    for tool_call in message.get("tool_calls") or []:
+        function = tool_call.get("function", {})
+        tokens += MESSAGE_TOKEN_OVERHEAD
+        tokens += estimate_text_tokens(function.get("name", ""))
+        tokens += estimate_text_tokens(function.get("arguments", ""))
+    return tokens
+
 
 class MessageManager:
-    def __init__(self):
+    def __init__(self, model=None, max_context_tokens=None):
         self.message_history = []
+        # 每条消息的token数缓存：id(message) -> (message, tokens)
+        self._token_cache = {}
+        self.model = model
+        self._explicit_token_budget = max_context_tokens
+        self.max_context_tokens = max_context_tokens or get_context_token_budget(model)
+        # 最近一次裁剪的统计信息
+        self.last_trim_stats = {"messages": 0, "tokens": 0}
+    
+    def set_model(self, model):
+        """根据模型更新上下文token预算（显式设置的预算不受影响）"""
+        if model == self.model:
+            return
+        self.model = model
+        if not self._explicit_token_budget:
+            self.max_context_tokens = get_context_token_budget(model)
+    
+    def count_message_tokens(self, message):
+        """获取消息的token数，结果按消息对象缓存"""
+        cached = self._token_cache.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        tokens = estimate_message_tokens(message)
+        self._token_cache[id(message)] = (message, tokens)
+        return tokens
+    
+    def total_tokens(self):
+        """当前消息历史的总token数"""
+        return sum(self.count_message_tokens(message) for message in self.message_history)
         
     def restore_history(self, conversation_history):
         """从提供的对话历史恢复消息历史"""
@@ -14,6 +89,7 @@ class MessageManager:
                 
             # 设置新的消息历史
             self.message_history = conversation_history
+            self._token_cache = {}
             
             # 如果之前有系统消息且新历史没有系统消息，则添加回原系统消息
             if system_message and (not self.message_history or self.message_history[0]["role"] != "system"):
@@ -24,6 +100,19 @@ class MessageManager:
             
         return self.message_history
         
+    def load_history(self, messages, system_prompt=None):
+        """直接载入已保存的消息历史（例如从数据库恢复的对话），不逐条追加也不裁剪
+        
+        Args:
+            messages: OpenAI格式的消息列表（不含系统消息）
+            system_prompt: 系统提示，为空时不添加系统消息
+        """
+        history = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        history.extend(messages)
+        self.message_history = history
+        self._token_cache = {}
+        return self.message_history
+        
     def add_user_message(self, query, system_prompt=None):
         """添加用户消息，可选择更新系统提示"""
         # 创建系统信息
@@ -38,6 +127,8 @@ class MessageManager:
             "content": query
         }
         
+        self.count_message_tokens(user_message)
+        
         # 如果历史为空，添加系统消息；否则保持现有历史并只添加用户消息
         if not self.message_history:
             self.message_history = [system_message, user_message]
@@ -45,6 +136,7 @@ class MessageManager:
             # 检查第一条消息是否为系统消息，如果是则更新它
             if self.message_history[0]["role"] == "system":
                 if system_prompt:
+                    self._token_cache.pop(id(self.message_history[0]), None)
                     self.message_history[0] = system_message
                 self.message_history.append(user_message)
             else:
@@ -63,34 +155,88 @@ class MessageManager:
         if llm_response and "role" not in llm_response:
             llm_response["role"] = "assistant"
         
+        self.count_message_tokens(llm_response)
         self.message_history.append(llm_response)
          
         return self.message_history
     
     def add_tool_result(self, tool_call_id, result_content):
         """添加工具调用结果到历史记录"""
-        self.message_history.append({
+        tool_message = {
             "role": "tool",
             "tool_call_id": tool_call_id,
             "content": str(result_content)
-        })
+        }
+        self.count_message_tokens(tool_message)
+        self.message_history.append(tool_message)
         return self.message_history
     
-    def trim_message_history(self, max_messages=20):
-        """限制消息历史的大小以防止上下文窗口过大"""
-        if len(self.message_history) <= max_messages:
-            return
+    def _group_evictable_units(self, start):
+        """将消息按可整体移除的单元分组
         
-        # 始终保留系统消息（如果存在）
-        if self.message_history and self.message_history[0]["role"] == "system":
-            system_message = self.message_history[0]
-            # 保留最近的消息，但确保总数不超过max_messages
-            self.message_history = [system_message] + self.message_history[-(max_messages-1):]
-        else:
-            # 如果没有系统消息，只保留最近的消息
-            self.message_history = self.message_history[-max_messages:]
+        带tool_calls的助手消息与其后续的tool结果消息属于同一单元，
+        必须一起保留或一起移除，否则API会拒绝请求。
+        """
+        units = []
+        index = start
+        history = self.message_history
+        while index < len(history):
+            unit = [index]
+            if history[index].get("role") == "assistant" and history[index].get("tool_calls"):
+                while index + 1 < len(history) and history[index + 1].get("role") == "tool":
+                    index += 1
+                    unit.append(index)
+            units.append(unit)
+            index += 1
+        return units
+    
+    def trim_message_history(self, max_tokens=None, pinned=None):
+        """按token预算裁剪消息历史，防止上下文窗口过大
         
-        return self.message_history
+        始终保留系统消息和最新的一个消息单元；从最早的消息开始移除，
+        助手的tool_calls消息与对应的tool结果总是一起移除。
+        
+        Args:
+            max_tokens: token预算，默认使用当前模型的预算
+            pinned: 不会被移除的消息（例如工具调用循环中本轮的用户消息）
+            
+        Returns:
+            被移除的token数量
+        """
+        max_tokens = max_tokens or self.max_context_tokens or DEFAULT_CONTEXT_TOKEN_BUDGET
+        self.last_trim_stats = {"messages": 0, "tokens": 0}
+        
+        has_system = bool(self.message_history) and self.message_history[0]["role"] == "system"
+        start = 1 if has_system else 0
+        units = self._group_evictable_units(start)
+        unit_tokens = [sum(self.count_message_tokens(self.message_history[i]) for i in unit) for unit in units]
+        total = sum(unit_tokens)
+        if has_system:
+            total += self.count_message_tokens(self.message_history[0])
+        
+        # 从最早的单元开始移除，跳过固定的消息；开头孤立的tool消息无论预算如何都要移除
+        evicted = set()
+        removed_tokens = 0
+        for unit, tokens in zip(units[:-1], unit_tokens[:-1]):
+            if pinned is not None and any(self.message_history[i] is pinned for i in unit):
+                continue
+            if total - removed_tokens <= max_tokens and self.message_history[unit[0]].get("role") != "tool":
+                break
+            evicted.update(unit)
+            removed_tokens += tokens
+        
+        if not evicted:
+            return 0
+        
+        removed = [message for i, message in enumerate(self.message_history) if i in evicted]
+        self.message_history = [message for i, message in enumerate(self.message_history) if i not in evicted]
+        for message in removed:
+            self._token_cache.pop(id(message), None)
+        
+        self.last_trim_stats = {"messages": len(removed), "tokens": removed_tokens}
+        print(f"{Colors.YELLOW}Context trimmed: removed {len(removed)} messages (~{removed_tokens} tokens), "
+              f"~{total - removed_tokens}/{max_tokens} tokens kept{Colors.ENDC}")
+        return removed_tokens
     
     def clear_message_history(self):
         """清除消息历史记录，只保留系统消息"""
@@ -99,6 +245,7 @@ class MessageManager:
             self.message_history = [self.message_history[0]]
         else:
             self.message_history = []
+        self._token_cache = {}
         print(f"{Colors.GREEN}Message history cleared.{Colors.ENDC}")
         return self.message_history
     
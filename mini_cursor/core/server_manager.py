@@ -10,7 +10,10 @@ import time
 from mcp.client.session import ClientSession
 from mcp.client.stdio import stdio_client, StdioServerParameters
 
-from mini_cursor.core.config import Colors, MCP_CONFIG_FILE, VERBOSE_LOGGING
+from mini_cursor.core.config import (
+    Colors, MCP_CONFIG_FILE, VERBOSE_LOGGING,
+    MAX_CONCURRENT_TOOL_CALLS, MAX_CONCURRENT_TOOL_CALLS_PER_SERVER,
+)
 
 # 设置日志
 logger = logging.getLogger(__name__)
@@ -20,6 +23,17 @@ class ServerManager:
         self.exit_stack = AsyncExitStack()
         self.sessions = {}  # 存储多个MCP server会话
         self.main_loop = None  # 存储主事件循环的引用
+        # 并发限制：全局信号量和每个服务器的信号量
+        self.global_semaphore = asyncio.Semaphore(MAX_CONCURRENT_TOOL_CALLS)
+        self.server_semaphores = {}
+    
+    def _get_server_semaphore(self, server_name):
+        """获取（必要时创建）特定服务器的并发信号量"""
+        semaphore = self.server_semaphores.get(server_name)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(MAX_CONCURRENT_TOOL_CALLS_PER_SERVER)
+            self.server_semaphores[server_name] = semaphore
+        return semaphore
     
     def set_main_loop(self, loop):
         """设置主事件循环的引用，用于在线程中执行工具调用"""
@@ -139,9 +153,10 @@ class ServerManager:
             
             # 执行工具调用
             try:
-                # 直接使用当前会话执行工具调用
-                print(f"{Colors.GREEN}Executing tool {tool_name} on server {server_name}...{Colors.ENDC}")
-                response = await session.call_tool(tool_name, tool_args)
+                # 直接使用当前会话执行工具调用，受全局和服务器级并发限制
+                async with self.global_semaphore, self._get_server_semaphore(server_name):
+                    print(f"{Colors.GREEN}Executing tool {tool_name} on server {server_name}...{Colors.ENDC}")
+                    response = await session.call_tool(tool_name, tool_args)
                 elapsed = time.time() - start_time
                 print(f"Tool {tool_name} executed in {elapsed:.2f}s")
             except Exception as e:
@@ -0,0 +1,124 @@
+import json
+import os
+from typing import List, Optional, Tuple
+
+from mini_cursor.core.config import Colors, VERBOSE_LOGGING
+from mini_cursor.core.tool_call_assembler import ToolCallAssembler
+
+_NO_DELTA = (None, None, ())
+
+
+class StreamAccumulator:
+    """累积一次流式聊天响应中的内容、思考过程和工具调用
+
+    每个chunk的处理开销为O(1)：内容和思考过程先放入列表，在finish()时才拼接；
+    工具调用由ToolCallAssembler增量组装；调试开关和录制文件只在创建时检查一次。
+    """
+
+    def __init__(self, debug_chunks: Optional[bool] = None, record_path: Optional[str] = None):
+        self._content_parts: List[str] = []
+        self._reasoning_parts: List[str] = []
+        self.tool_calls = ToolCallAssembler()
+        self.content = ""
+        self.reasoning = ""
+        self.chunk_count = 0
+        if debug_chunks is None:
+            debug_chunks = VERBOSE_LOGGING and os.environ.get("DEBUG_CHUNKS", "0") == "1"
+        self._debug_chunks = debug_chunks
+        if record_path is None:
+            record_path = os.environ.get("RECORD_CHUNKS") or None
+        self._record_file = open(record_path, "a", encoding="utf-8") if record_path else None
+
+    def feed(self, chunk) -> Tuple[Optional[str], Optional[str], tuple]:
+        """处理一个chunk
+
+        Returns:
+            (内容增量, 思考过程增量, 因本chunk变为完整的工具调用index列表)
+        """
+        self.chunk_count += 1
+        if self._record_file is not None:
+            self._record(chunk)
+        choices = chunk.choices
+        if not choices:
+            return _NO_DELTA
+        delta = choices[0].delta
+        if self._debug_chunks:
+            self._dump_chunk(choices[0])
+
+        content = delta.content
+        if content:
+            self._content_parts.append(content)
+
+        # 不同的OpenAI兼容服务把思考过程放在不同位置
+        reasoning = getattr(delta, "reasoning_content", None)
+        if reasoning is None:
+            message = getattr(delta, "message", None)
+            if message is not None:
+                reasoning = getattr(message, "reasoning_content", None)
+        if reasoning:
+            self._reasoning_parts.append(reasoning)
+
+        completed = ()
+        tool_call_deltas = delta.tool_calls
+        if tool_call_deltas:
+            completed = []
+            for tool_call_delta in tool_call_deltas:
+                completed.extend(self.tool_calls.add_delta(tool_call_delta))
+
+        return content, reasoning, completed
+
+    @property
+    def has_reasoning(self) -> bool:
+        return bool(self._reasoning_parts)
+
+    def finish(self, stream_response=None) -> List[int]:
+        """流结束时调用：拼接内容，补全工具调用，并处理一次性回传的reasoning_content
+
+        Returns:
+            在流结束时才变为完整的工具调用index列表
+        """
+        self.content = "".join(self._content_parts)
+        self.reasoning = "".join(self._reasoning_parts)
+
+        # 某些服务只在最终的响应数据中回传完整的reasoning_content
+        if not self.reasoning and stream_response is not None:
+            response_data = getattr(stream_response, "__dict__", {}).get("_response_data", {})
+            parts = [
+                choice["delta"]["reasoning_content"]
+                for choice in response_data.get("choices", [])
+                if choice.get("delta", {}).get("reasoning_content")
+            ]
+            self.reasoning = "".join(parts)
+
+        self.close()
+        return self.tool_calls.finish()
+
+    def close(self) -> None:
+        """关闭录制文件；流出错或被取消而没有调用finish()时也需要调用"""
+        if self._record_file is not None:
+            self._record_file.close()
+            self._record_file = None
+
+    def __enter__(self) -> "StreamAccumulator":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        self.close()
+
+    def _record(self, chunk) -> None:
+        if hasattr(chunk, "model_dump_json"):
+            self._record_file.write(chunk.model_dump_json(exclude_none=True) + "\n")
+
+    def _dump_chunk(self, choice) -> None:
+        """调试输出chunk结构（仅在VERBOSE_LOGGING且DEBUG_CHUNKS=1时启用）"""
+        try:
+            delta_dict = {}
+            if hasattr(choice, 'model_dump'):
+                delta_dict = json.loads(json.dumps(choice.model_dump()))
+            elif hasattr(choice, 'to_dict'):
+                delta_dict = choice.to_dict()
+
+            if delta_dict and 'delta' in delta_dict and delta_dict['delta']:
+                print(f"\n{Colors.DIM}[DEBUG] Chunk structure: {json.dumps(delta_dict)}{Colors.ENDC}", flush=True)
+        except Exception as e:
+            print(f"\n{Colors.DIM}[DEBUG] Failed to dump chunk: {e}{Colors.ENDC}", flush=True)
@@ -0,0 +1,143 @@
+"""
+流式响应累积的微基准测试
+
+对比StreamAccumulator与重构前process_query中的逐chunk字符串拼接，
+输入可以是合成的chunk流，也可以是用 RECORD_CHUNKS=<文件> 录制的真实流。
+
+用法: python -m mini_cursor.core.stream_benchmark [录制的chunk文件.jsonl | chunk数量]
+"""
+
+import json
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+from mini_cursor.core.config import VERBOSE_LOGGING
+from mini_cursor.core.stream_accumulator import StreamAccumulator
+
+
+def _to_namespace(value):
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(item) for item in value]
+    return value
+
+
+def _make_chunk(content=None, reasoning_content=None, tool_calls=None):
+    delta = {"content": content, "reasoning_content": reasoning_content, "tool_calls": tool_calls}
+    return _to_namespace({"choices": [{"index": 0, "delta": delta}]})
+
+
+def load_recorded_chunks(path: str) -> list:
+    """加载录制的chunk流（RECORD_CHUNKS=<文件> 生成的JSONL文件）"""
+    chunks = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            for choice in data.get("choices", []):
+                delta = choice.setdefault("delta", {})
+                for key in ("content", "reasoning_content", "tool_calls"):
+                    delta.setdefault(key, None)
+                for tool_call in delta["tool_calls"] or []:
+                    tool_call.setdefault("id", None)
+                    function = tool_call.setdefault("function", {})
+                    function.setdefault("name", None)
+                    function.setdefault("arguments", None)
+            chunks.append(_to_namespace(data))
+    return chunks
+
+
+def synthetic_chunks(count: int = 20000) -> list:
+    """生成包含思考过程、内容和多个工具调用片段的合成chunk流"""
+    chunks = []
+    reasoning_count = count // 4
+    tool_count = count // 4
+    for i in range(reasoning_count):
+        chunks.append(_make_chunk(reasoning_content=f"思考{i} "))
+    for i in range(count - reasoning_count - tool_count):
+        chunks.append(_make_chunk(content=f"token{i} "))
+    per_call = max(tool_count // 4, 3)
+    for call in range(4):
+        chunks.append(_make_chunk(tool_calls=[
+            {"index": call, "id": f"call_{call}", "function": {"name": "read_file", "arguments": '{"target_file": "'}}
+        ]))
+        for i in range(per_call - 2):
+            chunks.append(_make_chunk(tool_calls=[
+                {"index": call, "id": None, "function": {"name": None, "arguments": f"a{i}/"}}
+            ]))
+        chunks.append(_make_chunk(tool_calls=[
+            {"index": call, "id": None, "function": {"name": None, "arguments": 'x.py"}'}}
+        ]))
+    return chunks
+
+
+def _legacy_accumulate(chunks) -> None:
+    """重构前process_query中的累积逻辑，用作对照"""
+    stream_response = SimpleNamespace(_response_data={})
+    collected_content = ""
+    collected_reasoning = ""
+    tool_calls = []
+    for chunk in chunks:
+        delta = chunk.choices[0].delta
+        if delta.content:
+            collected_content += delta.content
+        reasoning_chunk = None
+        if hasattr(delta, 'message') and hasattr(delta.message, 'reasoning_content'):
+            reasoning_chunk = delta.message.reasoning_content
+        elif hasattr(delta, 'reasoning_content') and delta.reasoning_content:
+            reasoning_chunk = delta.reasoning_content
+        if reasoning_chunk:
+            collected_reasoning += reasoning_chunk
+        if VERBOSE_LOGGING and chunk.choices[0] and os.environ.get("DEBUG_CHUNKS", "0") == "1":
+            pass
+        if delta.tool_calls:
+            for tool_call_delta in delta.tool_calls:
+                index = tool_call_delta.index
+                while len(tool_calls) <= index:
+                    tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+                if tool_call_delta.id:
+                    tool_calls[index]["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    if tool_call_delta.function.name:
+                        tool_calls[index]["function"]["name"] = tool_call_delta.function.name
+                    if tool_call_delta.function.arguments:
+                        tool_calls[index]["function"]["arguments"] += tool_call_delta.function.arguments
+        for choice in stream_response.__dict__.get('_response_data', {}).get('choices', []):
+            pass
+
+
+def run_benchmark(chunks: list, repeat: int = 5) -> None:
+    def best_of(func):
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def accumulate():
+        accumulator = StreamAccumulator(debug_chunks=False, record_path="")
+        for chunk in chunks:
+            accumulator.feed(chunk)
+        accumulator.finish()
+
+    count = len(chunks)
+    new_time = best_of(accumulate)
+    legacy_time = best_of(lambda: _legacy_accumulate(chunks))
+    print(f"chunks: {count}, best of {repeat}")
+    print(f"StreamAccumulator: {new_time * 1000:.2f} ms total, {new_time / count * 1e6:.3f} us/chunk")
+    print(f"legacy loop:       {legacy_time * 1000:.2f} ms total, {legacy_time / count * 1e6:.3f} us/chunk")
+
+
+if __name__ == "__main__":
+    argument = sys.argv[1] if len(sys.argv) > 1 else "20000"
+    if argument.isdigit():
+        benchmark_chunks = synthetic_chunks(int(argument))
+    else:
+        benchmark_chunks = load_recorded_chunks(argument)
+    run_benchmark(benchmark_chunks)
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+"""
+工具执行代理（tool broker）
+
+在多worker部署中（例如 uvicorn --workers N），每个worker各自连接mcp_config.json中的
+MCP服务器会让子进程数量和内存占用随worker数量成倍增长。工具代理在每台主机上只运行一个实例，
+持有所有MCP会话，worker通过本地unix socket调用工具。
+
+协议：每行一个JSON对象。
+    请求: {"id": 1, "op": "list_tools"}
+          {"id": 2, "op": "call_tool", "server": "...", "tool": "...", "args": {...}}
+          {"id": 3, "op": "reconnect"}
+    响应: {"id": 1, "generation": 7, "result": ...} 或 {"id": 1, "generation": 7, "error": "..."}
+    通知: {"event": "tools_changed", "generation": 8}
+
+generation是代理当前配置的版本号，每次重新加载配置后改变，并通知所有已连接的worker。
+worker发现版本号与自己上次获取工具列表时不同，就重新获取工具列表，
+因此某个worker更新配置后，其他worker也不会继续使用旧的工具列表。
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from typing import Dict, Optional
+
+import mcp.types as types
+
+from mini_cursor.core.config import Colors, VERBOSE_LOGGING, TOOL_BROKER_IDLE_TIMEOUT
+from mini_cursor.core.server_manager import ServerManager
+from mini_cursor.core.tool_manager import ToolManager
+
+# 等待代理进程启动（包括连接所有MCP服务器）的最长时间（秒）
+BROKER_START_TIMEOUT = 60
+# 等待一次工具调用响应的最长时间（秒），超时后放弃等待，代理侧的调用不会被取消
+BROKER_REQUEST_TIMEOUT = 600
+
+
+class BrokerRequestNotSent(ConnectionError):
+    """请求写入socket之前连接已断开，代理一定没有收到该请求，可以安全重试"""
+
+
+class ToolBroker:
+    """在单个进程中持有所有MCP会话，并通过unix socket为多个worker提供工具调用"""
+
+    def __init__(self, socket_path: str, idle_timeout: float = TOOL_BROKER_IDLE_TIMEOUT):
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.server_manager = ServerManager()
+        self.tool_manager = ToolManager()
+        self.server = None
+        self.client_count = 0
+        self.last_disconnect = time.monotonic()
+        self._lock_file = None
+        self.startup_error: Optional[str] = None
+        self._reconnect_requests: asyncio.Queue = asyncio.Queue()
+        # 配置版本号：以启动时间为初值，代理重启后worker也能发现工具列表可能已变化
+        self.generation = time.time_ns()
+        self._connections: Dict[asyncio.StreamWriter, asyncio.Lock] = {}
+
+    def acquire_lock(self) -> bool:
+        """获取主机级的文件锁，保证每台主机只有一个代理实例"""
+        # 代理只在POSIX系统上运行（unix socket），延迟导入使其他平台仍能导入本模块
+        import fcntl
+
+        self._lock_file = open(self.socket_path + ".lock", "w")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    async def serve(self) -> None:
+        """连接MCP服务器并开始监听，直到空闲超时"""
+        try:
+            await self.server_manager.connect_to_servers(self.tool_manager)
+        except Exception as e:
+            # 仍然开始监听，让worker立即收到错误，而不是等待启动超时
+            self.startup_error = str(e)
+
+        # 持有锁时残留的socket文件一定是过期的
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print(f"{Colors.GREEN}Tool broker listening on {self.socket_path}{Colors.ENDC}")
+
+        try:
+            while True:
+                try:
+                    future = await asyncio.wait_for(self._reconnect_requests.get(), timeout=min(self.idle_timeout, 5))
+                except asyncio.TimeoutError:
+                    future = None
+                if future is not None:
+                    await self._reconnect(future)
+                    continue
+                if self.client_count == 0 and time.monotonic() - self.last_disconnect > self.idle_timeout:
+                    print(f"{Colors.YELLOW}Tool broker idle for {self.idle_timeout}s, shutting down{Colors.ENDC}")
+                    break
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        await self.server_manager.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    async def _reconnect(self, future: asyncio.Future) -> None:
+        """重新加载配置并重新连接所有MCP服务器
+
+        MCP会话的上下文必须在同一个任务中进入和退出，因此重连总是在serve()所在的任务中执行。
+        """
+        try:
+            await self.server_manager.close()
+            self.server_manager = ServerManager()
+            self.tool_manager = ToolManager()
+            self.startup_error = None
+            await self.server_manager.connect_to_servers(self.tool_manager)
+        except Exception as e:
+            self.startup_error = str(e)
+            if not future.done():
+                future.set_exception(e)
+            return
+        finally:
+            # 无论成功与否，旧的工具列表都已失效
+            self.generation += 1
+            await self._publish_generation()
+        if not future.done():
+            future.set_result("ok")
+
+    async def _publish_generation(self) -> None:
+        """通知所有已连接的worker配置版本号已改变"""
+        data = json.dumps({"event": "tools_changed", "generation": self.generation}).encode("utf-8") + b"\n"
+        for writer, write_lock in list(self._connections.items()):
+            try:
+                async with write_lock:
+                    writer.write(data)
+                    await writer.drain()
+            except ConnectionError:
+                continue
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.client_count += 1
+        write_lock = asyncio.Lock()
+        self._connections[writer] = write_lock
+        pending = set()
+
+        async def respond(request: Dict) -> None:
+            response = await self._handle_request(request)
+            data = json.dumps(response, ensure_ascii=False, default=str).encode("utf-8") + b"\n"
+            async with write_lock:
+                writer.write(data)
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # 每个请求独立执行，同一连接上的多个工具调用可以并发
+                task = asyncio.create_task(respond(request))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for task in pending:
+                task.cancel()
+            self._connections.pop(writer, None)
+            writer.close()
+            self.client_count -= 1
+            self.last_disconnect = time.monotonic()
+
+    async def _handle_request(self, request: Dict) -> Dict:
+        request_id = request.get("id")
+        try:
+            op = request.get("op")
+            if op == "list_tools":
+                if self.startup_error:
+                    raise RuntimeError(self.startup_error)
+                result = {
+                    server_name: [tool.model_dump(mode="json") for tool in tools.values()]
+                    for server_name, tools in self.tool_manager.server_tools.items()
+                }
+            elif op == "call_tool":
+                result = await self.server_manager.execute_tool(
+                    request["server"], request["tool"], request.get("args") or {}
+                )
+            elif op == "reconnect":
+                future = asyncio.get_running_loop().create_future()
+                await self._reconnect_requests.put(future)
+                result = await future
+            else:
+                raise ValueError(f"Unknown broker operation: {op}")
+            return {"id": request_id, "generation": self.generation, "result": result}
+        except Exception as e:
+            if VERBOSE_LOGGING:
+                traceback.print_exc()
+            return {"id": request_id, "generation": self.generation, "error": str(e)}
+
+
+class BrokerServerManager:
+    """ServerManager的代理实现：通过unix socket把工具调用转发给工具代理
+
+    提供与ServerManager相同的connect_to_servers/execute_tool/close接口，
+    因此MCPClient和API路由无需区分本地连接和代理连接。
+    代理的配置版本号改变时（其他worker更新了配置，或代理重启），在后台重新获取工具列表。
+    """
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.sessions = {}  # 服务器名称 -> None，仅用于与ServerManager保持一致
+        self.main_loop = None
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._next_id = 0
+        self._connect_lock = asyncio.Lock()
+        # 当前工具列表对应的代理配置版本号
+        self.generation: Optional[int] = None
+        self._tool_manager = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    def set_main_loop(self, loop):
+        self.main_loop = loop
+
+    async def _ensure_connected(self) -> None:
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            deadline = time.monotonic() + BROKER_START_TIMEOUT
+            spawned = False
+            while True:
+                try:
+                    self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    # 代理尚未运行：启动一个（如果其他worker已经启动，新进程会因拿不到锁而立即退出）
+                    if not spawned:
+                        spawn_broker(self.socket_path)
+                        spawned = True
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"Tool broker did not start within {BROKER_START_TIMEOUT}s: {self.socket_path}")
+                    await asyncio.sleep(0.2)
+            self._reader_task = asyncio.create_task(self._read_responses(self._reader, self._writer))
+
+    async def _read_responses(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                if response.get("event") == "tools_changed":
+                    self._check_generation(response.get("generation"))
+                    continue
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            # 连接断开：让所有等待中的请求失败，下一次调用时会重新连接（必要时重新启动代理）
+            writer.close()
+            for request_id, future in list(self._pending.items()):
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to tool broker lost"))
+                self._pending.pop(request_id, None)
+
+    async def _request(self, op: str, timeout: float = BROKER_REQUEST_TIMEOUT, **params):
+        response = await self._send(op, timeout, **params)
+        self._check_generation(response.get("generation"))
+        return response.get("result")
+
+    async def _send(self, op: str, timeout: float, **params) -> Dict:
+        """发送请求并返回完整响应，代理返回错误时抛出RuntimeError"""
+        await self._ensure_connected()
+        if self._writer.is_closing():
+            # 连接在_ensure_connected之后被响应读取任务关闭
+            raise BrokerRequestNotSent("Connection to tool broker lost before the request was sent")
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        data = json.dumps({"id": request_id, "op": op, **params}, ensure_ascii=False, default=str)
+        try:
+            self._writer.write(data.encode("utf-8") + b"\n")
+            await self._writer.drain()
+            response = await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Tool broker did not respond to {op} within {timeout}s")
+        finally:
+            self._pending.pop(request_id, None)
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def _check_generation(self, generation: Optional[int]) -> None:
+        """代理的配置版本号与当前工具列表不一致时，在后台重新获取工具列表"""
+        if generation is None or generation == self.generation or self._tool_manager is None:
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.create_task(self._refresh_tools())
+
+    async def _refresh_tools(self) -> None:
+        try:
+            await self.connect_to_servers(self._tool_manager)
+        except Exception as e:
+            print(f"{Colors.YELLOW}Failed to refresh tools from tool broker: {e}{Colors.ENDC}")
+
+    async def connect_to_servers(self, tool_manager):
+        """从代理获取所有服务器的工具列表"""
+        response = await self._send("list_tools", BROKER_START_TIMEOUT)
+        server_tools = response.get("result")
+        if not server_tools:
+            raise Exception("Failed to connect to any MCP servers")
+        self._tool_manager = tool_manager
+        self.sessions = {server_name: None for server_name in server_tools}
+        # 先取到完整列表再替换，替换过程中不会出现空的工具列表
+        tool_manager.server_tools.clear()
+        tool_manager.tool_server_cache.clear()
+        for server_name, tools in server_tools.items():
+            tool_manager.set_server_tools(server_name, [types.Tool.model_validate(tool) for tool in tools])
+        self.generation = response.get("generation")
+        print(f"{Colors.GREEN}Connected to tool broker with {len(server_tools)} MCP servers: {', '.join(server_tools)}{Colors.ENDC}")
+        tool_manager.refresh_tools_cache()
+
+    async def reconnect_servers(self, tool_manager):
+        """让代理重新加载mcp_config.json并重新连接所有MCP服务器"""
+        await self._send("reconnect", BROKER_START_TIMEOUT)
+        await self.connect_to_servers(tool_manager)
+
+    async def execute_tool(self, server_name, tool_name, tool_args):
+        """通过代理执行工具调用"""
+        try:
+            return await self._request("call_tool", server=server_name, tool=tool_name, args=tool_args)
+        except BrokerRequestNotSent:
+            # 代理可能已重启，请求未发出时重试一次；已发出的请求可能已经执行（例如edit_file、terminal_command），不能重试
+            return await self._request("call_tool", server=server_name, tool=tool_name, args=tool_args)
+
+    async def close(self):
+        """断开与代理的连接（代理进程在所有worker断开后空闲超时退出）"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def spawn_broker(socket_path: str) -> None:
+    """在后台启动代理进程"""
+    # 确保子进程能导入mini_cursor包（从源码目录运行时不一定已安装）
+    env = os.environ.copy()
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    subprocess.Popen(
+        [sys.executable, "-m", "mini_cursor.core.tool_broker", socket_path],
+        stdin=subprocess.DEVNULL,
+        env=env,
+        start_new_session=True,
+    )
+
+
+async def run_broker(socket_path: str) -> None:
+    broker = ToolBroker(socket_path)
+    if not broker.acquire_lock():
+        # 其他进程已经在运行代理
+        return
+    await broker.serve()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python -m mini_cursor.core.tool_broker <socket_path>")
+        sys.exit(1)
+    asyncio.run(run_broker(sys.argv[1]))
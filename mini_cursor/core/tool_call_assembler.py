@@ -0,0 +1,85 @@
+import json
+from typing import Dict, List
+
+
+class ToolCallAssembler:
+    """增量组装流式响应中的tool_calls片段
+
+    流式响应中每个工具调用的arguments是分多个片段下发的。组装器在以下任一条件满足时
+    认为某个工具调用已经完整：
+    1. 出现了下一个index的工具调用（模型按顺序生成工具调用）；
+    2. 当前已收到的arguments能够被解析为完整的JSON对象。
+    这样调用方可以在流结束之前就开始执行已完整的工具调用。
+    """
+
+    def __init__(self):
+        self.tool_calls: List[Dict] = []
+        self._argument_parts: List[List[str]] = []
+        self._completed: List[bool] = []
+
+    def _ensure_index(self, index: int) -> None:
+        while len(self.tool_calls) <= index:
+            self.tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
+            self._argument_parts.append([])
+            self._completed.append(False)
+
+    def _mark_completed(self, index: int, completed: List[int]) -> None:
+        if self._completed[index] or not self.tool_calls[index]["function"]["name"]:
+            return
+        self._completed[index] = True
+        self.tool_calls[index]["function"]["arguments"] = "".join(self._argument_parts[index])
+        completed.append(index)
+
+    def add_delta(self, tool_call_delta) -> List[int]:
+        """处理一个tool_call增量片段
+
+        Returns:
+            因本片段而变为完整的工具调用index列表
+        """
+        completed = []
+        index = tool_call_delta.index
+        self._ensure_index(index)
+
+        # 新的index开始，说明之前的工具调用都已经生成完毕
+        for previous in range(index):
+            self._mark_completed(previous, completed)
+
+        tool_call = self.tool_calls[index]
+        if tool_call_delta.id:
+            tool_call["id"] = tool_call_delta.id
+
+        function = tool_call_delta.function
+        if function:
+            if function.name:
+                tool_call["function"]["name"] = function.name
+            if function.arguments:
+                parts = self._argument_parts[index]
+                parts.append(function.arguments)
+                # 只有在片段以"}"结尾时才尝试解析，避免每个片段都做一次完整解析
+                if not self._completed[index] and function.arguments.rstrip().endswith("}"):
+                    try:
+                        json.loads("".join(parts))
+                    except ValueError:
+                        pass
+                    else:
+                        self._mark_completed(index, completed)
+
+        return completed
+
+    def finish(self) -> List[int]:
+        """流结束时调用，将剩余的工具调用全部标记为完整"""
+        completed = []
+        for index in range(len(self.tool_calls)):
+            self._mark_completed(index, completed)
+        # 没有名称的工具调用也需要拼接参数，以便返回完整的列表
+        for index, parts in enumerate(self._argument_parts):
+            if not self._completed[index]:
+                self.tool_calls[index]["function"]["arguments"] = "".join(parts)
+        return completed
+
+    def is_completed(self, index: int) -> bool:
+        return index < len(self._completed) and self._completed[index]
+
+    def get_tool_calls(self) -> List[Dict]:
+        """返回有ID的工具调用列表（应在finish之后调用）"""
+        return [tool_call for tool_call in self.tool_calls if tool_call["id"]]
@@ -4,7 +4,7 @@ import time
 import traceback
 from typing import Dict, Optional, Any, Tuple, List, Set
 
-from mini_cursor.core.config import Colors, TOOL_CALL_TIMEOUT, VERBOSE_LOGGING
+from mini_cursor.core.config import Colors, TOOL_CALL_TIMEOUT, VERBOSE_LOGGING, SERIAL_TOOLS, READ_ONLY_TOOLS
 
 class ToolManager:
     def __init__(self):
@@ -15,6 +15,8 @@ class ToolManager:
         self.disabled_tools = set()  # 禁用的工具名称集合
         self.tool_enablement_mode = "all"  # 默认模式: "all"启用所有, "selective"选择性启用
         self.tool_server_cache = {}  # 工具与服务器映射的缓存
+        self.serial_tools = set(SERIAL_TOOLS)  # 需要串行执行的工具（有副作用）
+        self.read_only_tools = set(READ_ONLY_TOOLS)  # 可以并发执行的只读工具
 
     def set_server_tools(self, server_name, tools):
         """设置特定服务器的工具"""
@@ -98,6 +100,33 @@ class ToolManager:
             # 在"selective"模式下，被明确禁用的工具是禁用的
             return tool_name not in self.disabled_tools
     
+    def is_read_only_tool(self, tool_name: str) -> bool:
+        """检查工具是否只读（可以与其他只读调用并发、在流式生成期间提前执行）
+
+        MCP注解中readOnlyHint默认为False，因此未在只读列表中、也没有声明readOnlyHint=True的工具
+        （例如其他服务器提供的写文件、提交或数据库工具）都按有副作用处理。
+        """
+        if tool_name in self.serial_tools:
+            return False
+        if tool_name in self.read_only_tools:
+            return True
+        _, tool = self.find_tool_server(tool_name)
+        annotations = getattr(tool, "annotations", None)
+        return bool(annotations and getattr(annotations, "readOnlyHint", None) is True)
+    
+    def is_serial_tool(self, tool_name: str) -> bool:
+        """检查工具是否需要串行执行（不是只读的工具不能与其他调用并发）"""
+        return not self.is_read_only_tool(tool_name)
+    
+    def set_tool_serial(self, tool_name: str, serial: bool = True) -> None:
+        """设置工具的串行执行标志"""
+        if serial:
+            self.serial_tools.add(tool_name)
+            self.read_only_tools.discard(tool_name)
+        else:
+            self.serial_tools.discard(tool_name)
+            self.read_only_tools.add(tool_name)
+    
     def disable_tool(self, tool_name: str) -> bool:
         """禁用特定工具"""
         # 验证工具是否存在
@@ -3,6 +3,30 @@
  */
 
 const API = {
+    /**
+     * 获取当前浏览器标签页的会话ID（每个标签页独立，刷新页面后保持不变）
+     * @returns {string} 会话ID
+     */
+    getSessionId: function() {
+        let sessionId = sessionStorage.getItem('mini-cursor-session-id');
+        if (!sessionId) {
+            sessionId = (window.crypto && crypto.randomUUID)
+                ? crypto.randomUUID()
+                : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+            sessionStorage.setItem('mini-cursor-session-id', sessionId);
+        }
+        return sessionId;
+    },
+    
+    /**
+     * 为请求头添加会话ID
+     * @param {Object} [headers] - 其他请求头
+     * @returns {Object} 包含会话ID的请求头
+     */
+    sessionHeaders: function(headers = {}) {
+        return Object.assign({ 'X-Session-ID': this.getSessionId() }, headers);
+    },
+    
     /**
      * 获取API信息
      * @returns {Promise} 返回API信息的Promise
@@ -102,7 +126,7 @@ const API = {
     sendChatRequest: function(query) {
         return fetch('/chat', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: this.sessionHeaders({ 'Content-Type': 'application/json' }),
             body: JSON.stringify({ query })
         });
     },
@@ -162,25 +186,60 @@ const API = {
     },
     
     /**
-     * 获取所有历史对话
-     * @returns {Promise} 返回所有历史对话的Promise
+     * 按页获取历史对话
+     * @param {string|null} cursor - 上一页返回的next_cursor，为空时获取第一页
+     * @param {number} limit - 每页数量
+     * @returns {Promise} 返回 {items, next_cursor} 的Promise
      */
-    getAllConversations: function() {
-        return fetch('/conversations/all')
-            .then(response => response.json())
+    getConversationsPage: function(cursor = null, limit = 50) {
+        const params = new URLSearchParams({ limit });
+        if (cursor) {
+            params.set('cursor', cursor);
+        }
+        return fetch(`/conversations/all?${params.toString()}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`HTTP 错误 ${response.status}`);
+                }
+                return response.json();
+            })
             .catch(error => {
                 console.error('Error fetching conversations:', error);
                 throw error;
             });
     },
     
+    /**
+     * 全文搜索历史对话
+     * @param {string} query - 搜索关键词
+     * @param {number} limit - 最大命中数
+     * @returns {Promise} 返回 {status, results} 的Promise
+     */
+    searchConversations: function(query, limit = 20) {
+        const params = new URLSearchParams({ q: query, limit });
+        return fetch(`/conversations/search?${params.toString()}`)
+            .then(response => response.json())
+            .catch(error => {
+                console.error('Error searching conversations:', error);
+                throw error;
+            });
+    },
+    
     /**
      * 获取对话详情
      * @param {string} conversationId - 对话ID
+     * @param {Object} options - 可选的范围参数：after_seq、before_seq、limit、tail、include_tool_results
      * @returns {Promise} 返回对话详情的Promise
      */
-    getConversationDetail: function(conversationId) {
-        return fetch(`/conversations/detail/${conversationId}`)
+    getConversationDetail: function(conversationId, options = {}) {
+        const params = new URLSearchParams();
+        for (const [key, value] of Object.entries(options)) {
+            if (value !== undefined && value !== null) {
+                params.set(key, value);
+            }
+        }
+        const query = params.toString();
+        return fetch(`/conversations/detail/${conversationId}${query ? `?${query}` : ''}`)
             .then(response => response.json())
             .catch(error => {
                 console.error('Error fetching conversation detail:', error);
@@ -188,6 +247,21 @@ const API = {
             });
     },
     
+    /**
+     * 获取单条工具消息的结果（对话详情中未包含工具结果时按需加载）
+     * @param {string} conversationId - 对话ID
+     * @param {number} seq - 工具消息的序号
+     * @returns {Promise} 返回 {status, tool_result} 的Promise
+     */
+    getToolResult: function(conversationId, seq) {
+        return fetch(`/conversations/detail/${conversationId}/tool_result/${seq}`)
+            .then(response => response.json())
+            .catch(error => {
+                console.error('Error fetching tool result:', error);
+                throw error;
+            });
+    },
+    
     /**
      * 删除指定的历史对话
      * @param {string} conversationId - 要删除的对话ID
@@ -196,7 +270,7 @@ const API = {
     deleteConversation: function(conversationId) {
         return fetch(`/conversations/${conversationId}/delete`, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' }
+            headers: this.sessionHeaders({ 'Content-Type': 'application/json' })
         })
         .then(response => response.json())
         .catch(error => {
@@ -90,20 +90,30 @@ Object.assign(ChatUI, {
     
     /**
      * 加载历史对话列表
+     * @param {string|null} cursor - 下一页的游标，为空时重新加载第一页
      */
-    loadConversationHistory: async function() {
-        this.historyElements.historyList.innerHTML = '';
+    loadConversationHistory: async function(cursor = null) {
+        if (!cursor) {
+            this.historyElements.historyList.innerHTML = '';
+        }
         this.historyElements.historyLoading.style.display = 'block';
         
         try {
-            const data = await API.getAllConversations();
+            const page = await API.getConversationsPage(cursor);
+            const data = page.items;
             this.historyElements.historyLoading.style.display = 'none';
             
-            if (data.length === 0) {
+            if (!cursor && data.length === 0) {
                 this.historyElements.historyList.innerHTML = '<div style="text-align: center; padding: 20px; color: #666;">暂无历史对话</div>';
                 return;
             }
             
+            // 移除上一页末尾的"加载更多"
+            const previousMore = this.historyElements.historyList.querySelector('.history-load-more');
+            if (previousMore) {
+                previousMore.remove();
+            }
+            
             // 显示历史对话列表
             data.forEach(conversation => {
                 const li = document.createElement('li');
@@ -158,6 +168,24 @@ Object.assign(ChatUI, {
                 this.historyElements.historyList.appendChild(li);
             });
             
+            // 还有更多对话时，在末尾显示"加载更多"，点击后按游标获取下一页
+            if (page.next_cursor) {
+                const moreItem = document.createElement('li');
+                moreItem.className = 'history-load-more';
+                moreItem.style.textAlign = 'center';
+                moreItem.style.padding = '10px';
+                
+                const moreButton = document.createElement('button');
+                moreButton.textContent = '加载更多';
+                moreButton.addEventListener('click', () => {
+                    moreButton.disabled = true;
+                    this.loadConversationHistory(page.next_cursor);
+                });
+                
+                moreItem.appendChild(moreButton);
+                this.historyElements.historyList.appendChild(moreItem);
+            }
+            
         } catch (error) {
             console.error('加载历史对话失败:', error);
             this.historyElements.historyLoading.style.display = 'none';
@@ -236,9 +264,9 @@ Object.assign(ChatUI, {
             // 调用API加载对话
             const response = await fetch('/conversations/load', {
                 method: 'POST',
-                headers: {
+                headers: API.sessionHeaders({
                     'Content-Type': 'application/json'
-                },
+                }),
                 body: JSON.stringify({
                     conversation_id: conversationId
                 })
@@ -290,7 +318,12 @@ Object.assign(ChatUI, {
         }
         
         try {
-            const data = await API.getConversationDetail(conversationId);
+            // 先获取最新的一页消息，更早的消息在点击"加载更早的消息"时再获取；工具结果按需加载
+            const data = await API.getConversationDetail(conversationId, {
+                tail: true,
+                limit: this.historyDetailPageSize,
+                include_tool_results: false
+            });
             
             if (data.status !== 'ok' || !data.conversation) {
                 throw new Error(data.message || '获取对话详情失败');
@@ -306,71 +339,20 @@ Object.assign(ChatUI, {
                 this.elements.messagesContainer.appendChild(infoDiv);
             }
             
+            // 还有更早的消息时，在顶部显示"加载更早的消息"
+            if (conversation.has_more) {
+                this.elements.messagesContainer.appendChild(
+                    this.createLoadEarlierButton(conversationId, conversation.messages[0].seq)
+                );
+            }
+            
             // 添加对话消息
             if (conversation.messages && conversation.messages.length > 0) {
                 console.log('渲染对话消息:', conversation.messages.length, '条');
-                
                 conversation.messages.forEach(msg => {
-                    // 调试输出每条消息的内容
-                    console.log('处理消息类型:', msg.type, '内容:', msg);
-                    
-                    if (msg.type === 'user') {
-                        console.log('渲染用户消息');
-                        // 添加用户消息
-                        const container = document.createElement('div');
-                        container.className = 'message-container user';
-                        
-                        const senderLabel = document.createElement('div');
-                        senderLabel.className = 'sender-label';
-                        senderLabel.textContent = '您';
-                        
-                        const message = document.createElement('div');
-                        message.className = 'message';
-                        
-                        // 创建文本容器
-                        const textContainer = document.createElement('pre');
-                        textContainer.className = 'message-text';
-                        textContainer.textContent = msg.content || ''; // 添加空字符串兜底
-                        
-                        message.appendChild(textContainer);
-                        container.appendChild(senderLabel);
-                        container.appendChild(message);
-                        this.elements.messagesContainer.appendChild(container);
-                    } 
-                    else if (msg.type === 'assistant') {
-                        console.log('渲染助手消息');
-                        // 添加助手消息
-                        const container = document.createElement('div');
-                        container.className = 'message-container assistant';
-                        
-                        const senderLabel = document.createElement('div');
-                        senderLabel.className = 'sender-label';
-                        senderLabel.textContent = 'AI助手';
-                        
-                        const message = document.createElement('div');
-                        message.className = 'message';
-                        
-                        // 创建文本容器
-                        const textContainer = document.createElement('pre');
-                        textContainer.className = 'message-text';
-                        textContainer.textContent = msg.content || ''; // 添加空字符串兜底
-                        
-                        message.appendChild(textContainer);
-                        container.appendChild(senderLabel);
-                        container.appendChild(message);
-                        this.elements.messagesContainer.appendChild(container);
-                    } 
-                    else if (msg.type === 'tool') {
-                        console.log('渲染工具消息:', msg.tool_name);
-                        // 添加工具消息
-                        this.renderToolMessage(
-                            msg.tool_name || '未命名工具',
-                            msg.tool_args || '{}',
-                            msg.tool_result || '无结果'
-                        );
-                    }
-                    else {
-                        console.warn('未知消息类型:', msg.type, msg);
+                    const element = this.createHistoryMessageElement(conversationId, msg);
+                    if (element) {
+                        this.elements.messagesContainer.appendChild(element);
                     }
                 });
             } else {
@@ -391,12 +373,124 @@ Object.assign(ChatUI, {
     },
     
     /**
-     * 渲染工具调用消息
+     * 历史对话详情每页的消息数
+     */
+    historyDetailPageSize: 50,
+    
+    /**
+     * 创建"加载更早的消息"按钮，点击后获取beforeSeq之前的一页消息并插入到按钮位置
+     * @param {string} conversationId - 对话ID
+     * @param {number} beforeSeq - 当前已显示的最早消息的序号
+     * @returns {HTMLElement} 按钮容器
+     */
+    createLoadEarlierButton: function(conversationId, beforeSeq) {
+        const wrapper = document.createElement('div');
+        wrapper.className = 'message-info history-load-earlier';
+        
+        const button = document.createElement('button');
+        button.textContent = '加载更早的消息';
+        button.addEventListener('click', async () => {
+            button.disabled = true;
+            button.textContent = '加载中...';
+            try {
+                const data = await API.getConversationDetail(conversationId, {
+                    before_seq: beforeSeq,
+                    limit: this.historyDetailPageSize,
+                    include_tool_results: false
+                });
+                if (data.status !== 'ok' || !data.conversation) {
+                    throw new Error(data.message || '获取对话详情失败');
+                }
+                
+                const conversation = data.conversation;
+                const fragment = document.createDocumentFragment();
+                if (conversation.has_more) {
+                    fragment.appendChild(this.createLoadEarlierButton(conversationId, conversation.messages[0].seq));
+                }
+                conversation.messages.forEach(msg => {
+                    const element = this.createHistoryMessageElement(conversationId, msg);
+                    if (element) {
+                        fragment.appendChild(element);
+                    }
+                });
+                
+                // 在顶部插入后保持当前可见内容的位置不变
+                const container = this.elements.messagesContainer;
+                const previousHeight = container.scrollHeight;
+                wrapper.replaceWith(fragment);
+                container.scrollTop += container.scrollHeight - previousHeight;
+            } catch (error) {
+                console.error('加载更早的消息失败:', error);
+                button.disabled = false;
+                button.textContent = '加载失败，点击重试';
+            }
+        });
+        
+        wrapper.appendChild(button);
+        return wrapper;
+    },
+    
+    /**
+     * 创建单条历史消息的元素
+     * @param {string} conversationId - 对话ID
+     * @param {Object} msg - 对话详情接口返回的消息
+     * @returns {HTMLElement|null} 消息元素，未知类型返回null
+     */
+    createHistoryMessageElement: function(conversationId, msg) {
+        if (msg.type === 'user' || msg.type === 'assistant') {
+            const container = document.createElement('div');
+            container.className = `message-container ${msg.type}`;
+            
+            const senderLabel = document.createElement('div');
+            senderLabel.className = 'sender-label';
+            senderLabel.textContent = msg.type === 'user' ? '您' : 'AI助手';
+            
+            const message = document.createElement('div');
+            message.className = 'message';
+            
+            // 创建文本容器
+            const textContainer = document.createElement('pre');
+            textContainer.className = 'message-text';
+            textContainer.textContent = msg.content || ''; // 添加空字符串兜底
+            
+            message.appendChild(textContainer);
+            container.appendChild(senderLabel);
+            container.appendChild(message);
+            return container;
+        }
+        if (msg.type === 'tool') {
+            // 未包含工具结果时，点击后再从服务端获取
+            const loadResult = msg.tool_result === undefined
+                ? async () => {
+                    const data = await API.getToolResult(conversationId, msg.seq);
+                    if (data.status !== 'ok') {
+                        throw new Error(data.message || '获取工具结果失败');
+                    }
+                    return data.tool_result;
+                }
+                : null;
+            return this.renderToolMessage(
+                msg.tool_name || '未命名工具',
+                msg.tool_args || '{}',
+                loadResult ? null : (msg.tool_result || '无结果'),
+                loadResult,
+                msg.tool_result_size
+            );
+        }
+        console.warn('未知消息类型:', msg.type, msg);
+        return null;
+    },
+    
+    /**
+     * 创建工具调用消息元素
      * @param {string} toolName - 工具名称
      * @param {string|object} toolArgs - 工具参数（字符串或对象）
      * @param {string|object} toolResult - 工具结果（字符串或对象）
+     * @param {Function} [loadResult] - 未包含工具结果时，获取结果的异步函数
+     * @param {number} [resultSize] - 工具结果的字节数
+     * @returns {HTMLElement} 工具消息元素
      */
-    renderToolMessage: function(toolName, toolArgs, toolResult) {
+    renderToolMessage: function(toolName, toolArgs, toolResult, loadResult, resultSize) {
         console.log('渲染工具消息:', toolName);
         
         // 创建工具消息容器
@@ -470,28 +564,49 @@ Object.assign(ChatUI, {
         resultValue.className = 'tool-result-value';
         
         // 尝试解析和格式化结果
-        try {
-            let formattedResult;
-            if (typeof toolResult === 'string') {
-                // 尝试将字符串解析为JSON对象
-                try {
-                    const parsedResult = JSON.parse(toolResult);
-                    formattedResult = JSON.stringify(parsedResult, null, 2);
-                } catch (e) {
-                    // 如果不是有效的JSON，则原样显示
-                    formattedResult = toolResult;
+        const showResult = (value) => {
+            try {
+                let formattedResult;
+                if (typeof value === 'string') {
+                    // 尝试将字符串解析为JSON对象
+                    try {
+                        const parsedResult = JSON.parse(value);
+                        formattedResult = JSON.stringify(parsedResult, null, 2);
+                    } catch (e) {
+                        // 如果不是有效的JSON，则原样显示
+                        formattedResult = value;
+                    }
+                } else if (typeof value === 'object') {
+                    // 如果已经是对象，则格式化为JSON字符串
+                    formattedResult = JSON.stringify(value, null, 2);
+                } else {
+                    // 其他情况
+                    formattedResult = String(value || '');
                 }
-            } else if (typeof toolResult === 'object') {
-                // 如果已经是对象，则格式化为JSON字符串
-                formattedResult = JSON.stringify(toolResult, null, 2);
-            } else {
-                // 其他情况
-                formattedResult = String(toolResult || '');
+                resultValue.textContent = formattedResult;
+            } catch (error) {
+                console.error('格式化工具结果失败:', error);
+                resultValue.textContent = '无法显示结果';
             }
-            resultValue.textContent = formattedResult;
-        } catch (error) {
-            console.error('格式化工具结果失败:', error);
-            resultValue.textContent = '无法显示结果';
+        };
+        
+        if (loadResult) {
+            // 结果未随对话详情返回，点击后再加载
+            const loadButton = document.createElement('button');
+            loadButton.textContent = resultSize ? `显示结果（${resultSize} 字节）` : '显示结果';
+            loadButton.addEventListener('click', async () => {
+                loadButton.disabled = true;
+                try {
+                    showResult(await loadResult());
+                } catch (error) {
+                    console.error('加载工具结果失败:', error);
+                    resultValue.textContent = `加载工具结果失败: ${error.message}`;
+                }
+                loadButton.remove();
+            });
+            resultContainer.appendChild(loadButton);
+        } else {
+            showResult(toolResult);
         }
         
         resultContainer.appendChild(resultValue);
@@ -501,8 +616,7 @@ Object.assign(ChatUI, {
         container.appendChild(toolHeader);
         container.appendChild(toolContent);
         
-        // 添加到消息容器
-        this.elements.messagesContainer.appendChild(container);
+        return container;
     },
     
     /**
@@ -101,7 +101,7 @@ Object.assign(ChatUI, {
      */
     getToolCallDetail: async function(callId) {
         try {
-            const response = await fetch(`/tools/history/${callId}`);
+            const response = await fetch(`/tools/history/${callId}`, { headers: API.sessionHeaders() });
             if (!response.ok) {
                 throw new Error(`HTTP error ${response.status}`);
             }
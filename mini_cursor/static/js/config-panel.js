@@ -99,7 +99,8 @@ const ConfigPanel = {
         
         // 发送请求，清除当前会话历史
         fetch('/conversations/clear', {
-            method: 'POST'
+            method: 'POST',
+            headers: API.sessionHeaders()
         })
         .then(response => response.json())
         .then(data => {
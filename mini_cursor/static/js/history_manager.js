@@ -10,6 +10,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const historyList = document.getElementById('history-list');
     const historyLoading = document.getElementById('history-loading');
     const messagesContainer = document.getElementById('messages');
+    const historySearch = document.getElementById('history-search');
     
     if (!historyBtn || !historyDialog || !historyOverlay || !historyClose || !historyList || !historyLoading || !messagesContainer) {
         console.error('历史对话管理所需DOM元素不完整，无法初始化');
@@ -21,6 +22,9 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log('打开历史对话管理弹窗');
         historyDialog.style.display = 'flex';
         historyOverlay.style.display = 'block';
+        if (historySearch) {
+            historySearch.value = '';
+        }
         loadConversationHistory();
     });
     
@@ -36,73 +40,45 @@ document.addEventListener('DOMContentLoaded', function() {
         historyOverlay.style.display = 'none';
     });
     
-    // 加载历史对话列表
+    // 搜索框：输入停止300ms后在服务端全文搜索，清空时恢复分页列表
+    let searchTimer = null;
+    if (historySearch) {
+        historySearch.addEventListener('input', function() {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => {
+                const query = historySearch.value.trim();
+                if (query) {
+                    searchConversationHistory(query);
+                } else {
+                    loadConversationHistory();
+                }
+            }, 300);
+        });
+    }
+    
+    // 历史对话分页状态：nextCursor为null表示已经加载到最后一页
+    const HISTORY_PAGE_SIZE = 50;
+    let nextCursor = null;
+    let loadingPage = false;
+    
+    // 加载历史对话列表（从第一页开始）
     async function loadConversationHistory() {
         console.log('加载历史对话列表...');
         historyList.innerHTML = '';
+        nextCursor = null;
         historyLoading.style.display = 'block';
         
         try {
-            const data = await API.getAllConversations();
-            console.log('获取到历史对话数据:', data.length, '条记录');
+            const page = await API.getConversationsPage(null, HISTORY_PAGE_SIZE);
+            console.log('获取到历史对话数据:', page.items.length, '条记录');
             historyLoading.style.display = 'none';
             
-            if (data.length === 0) {
+            if (page.items.length === 0) {
                 historyList.innerHTML = '<div style="text-align: center; padding: 20px; color: #666;">暂无历史对话</div>';
                 return;
             }
             
-            // 显示历史对话列表
-            data.forEach(conversation => {
-                const li = document.createElement('li');
-                li.className = 'history-item';
-                li.dataset.id = conversation.id;
-                
-                const contentDiv = document.createElement('div');
-                contentDiv.className = 'history-item-content';
-
-                const title = document.createElement('div');
-                title.className = 'history-item-title';
-                title.textContent = conversation.title || `对话 ${conversation.id}`; // 添加后备标题
-                
-                const info = document.createElement('div');
-                info.className = 'history-item-info';
-                
-                const date = document.createElement('span');
-                date.className = 'history-item-date';
-                date.textContent = formatDate(conversation.updated_at);
-                
-                const turns = document.createElement('span');
-                turns.className = 'history-item-turns';
-                turns.textContent = `${conversation.turns} 轮对话`;
-                
-                info.appendChild(date);
-                info.appendChild(turns);
-                
-                contentDiv.appendChild(title);
-                contentDiv.appendChild(info);
-
-                // 删除按钮
-                const deleteBtn = document.createElement('button');
-                deleteBtn.className = 'history-item-delete';
-                deleteBtn.innerHTML = '&times;';
-                deleteBtn.title = '删除此对话';
-                deleteBtn.addEventListener('click', (event) => {
-                    event.stopPropagation(); // 防止触发加载对话的事件
-                    deleteConversation(conversation.id, conversation.title || `对话 ${conversation.id}`, li);
-                });
-
-                li.appendChild(contentDiv);
-                li.appendChild(deleteBtn);
-                
-                // 点击加载对话 (绑定到 contentDiv)
-                contentDiv.addEventListener('click', function() {
-                    console.log('加载对话:', conversation.id, conversation.title);
-                    loadConversation(conversation.id, conversation.title || `对话 ${conversation.id}`);
-                });
-                
-                historyList.appendChild(li);
-            });
+            appendConversationPage(page);
             
         } catch (error) {
             console.error('加载历史对话失败:', error);
@@ -111,6 +87,152 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // 加载下一页历史对话
+    async function loadMoreConversations(moreButton) {
+        if (loadingPage || !nextCursor) {
+            return;
+        }
+        loadingPage = true;
+        moreButton.disabled = true;
+        moreButton.textContent = '加载中...';
+        
+        try {
+            const page = await API.getConversationsPage(nextCursor, HISTORY_PAGE_SIZE);
+            moreButton.parentElement.remove();
+            appendConversationPage(page);
+        } catch (error) {
+            console.error('加载更多历史对话失败:', error);
+            moreButton.disabled = false;
+            moreButton.textContent = '加载失败，点击重试';
+        } finally {
+            loadingPage = false;
+        }
+    }
+    
+    // 将一页历史对话追加到列表末尾，还有更多时在末尾显示"加载更多"
+    function appendConversationPage(page) {
+        page.items.forEach(conversation => {
+            historyList.appendChild(createConversationItem(conversation));
+        });
+        
+        nextCursor = page.next_cursor;
+        if (nextCursor) {
+            const moreItem = document.createElement('li');
+            moreItem.className = 'history-load-more';
+            moreItem.style.textAlign = 'center';
+            moreItem.style.padding = '10px';
+            
+            const moreButton = document.createElement('button');
+            moreButton.textContent = '加载更多';
+            moreButton.addEventListener('click', () => loadMoreConversations(moreButton));
+            
+            moreItem.appendChild(moreButton);
+            historyList.appendChild(moreItem);
+        }
+    }
+    
+    // 搜索历史对话，每个对话只显示相关度最高的一条命中
+    async function searchConversationHistory(query) {
+        historyList.innerHTML = '';
+        nextCursor = null;
+        historyLoading.style.display = 'block';
+        
+        try {
+            const data = await API.searchConversations(query);
+            // 结果返回前输入已变化时丢弃
+            if (historySearch && historySearch.value.trim() !== query) {
+                return;
+            }
+            historyLoading.style.display = 'none';
+            
+            if (data.status !== 'ok') {
+                throw new Error(data.message || '搜索失败');
+            }
+            if (data.results.length === 0) {
+                historyList.innerHTML = '<div style="text-align: center; padding: 20px; color: #666;">没有找到匹配的对话</div>';
+                return;
+            }
+            
+            const seen = new Set();
+            data.results.forEach(hit => {
+                if (seen.has(hit.conversation_id)) {
+                    return;
+                }
+                seen.add(hit.conversation_id);
+                historyList.appendChild(createConversationItem({
+                    id: hit.conversation_id,
+                    title: hit.title,
+                    updated_at: hit.updated_at
+                }, hit.snippet));
+            });
+            
+        } catch (error) {
+            console.error('搜索历史对话失败:', error);
+            historyLoading.style.display = 'none';
+            historyList.innerHTML = `<div style="text-align: center; padding: 20px; color: #c0392b;">搜索失败: ${error.message}</div>`;
+        }
+    }
+    
+    // 创建单条历史对话列表项，snippet为搜索命中的摘要（可选）
+    function createConversationItem(conversation, snippet) {
+        const li = document.createElement('li');
+        li.className = 'history-item';
+        li.dataset.id = conversation.id;
+        
+        const contentDiv = document.createElement('div');
+        contentDiv.className = 'history-item-content';
+
+        const title = document.createElement('div');
+        title.className = 'history-item-title';
+        title.textContent = conversation.title || `对话 ${conversation.id}`; // 添加后备标题
+        
+        const info = document.createElement('div');
+        info.className = 'history-item-info';
+        
+        const date = document.createElement('span');
+        date.className = 'history-item-date';
+        date.textContent = formatDate(conversation.updated_at);
+        
+        info.appendChild(date);
+        if (conversation.turns !== undefined) {
+            const turns = document.createElement('span');
+            turns.className = 'history-item-turns';
+            turns.textContent = `${conversation.turns} 轮对话`;
+            info.appendChild(turns);
+        }
+        
+        contentDiv.appendChild(title);
+        contentDiv.appendChild(info);
+        
+        if (snippet) {
+            const snippetDiv = document.createElement('div');
+            snippetDiv.className = 'history-item-snippet';
+            snippetDiv.textContent = snippet;
+            contentDiv.appendChild(snippetDiv);
+        }
+
+        // 删除按钮
+        const deleteBtn = document.createElement('button');
+        deleteBtn.className = 'history-item-delete';
+        deleteBtn.innerHTML = '&times;';
+        deleteBtn.title = '删除此对话';
+        deleteBtn.addEventListener('click', (event) => {
+            event.stopPropagation(); // 防止触发加载对话的事件
+            deleteConversation(conversation.id, conversation.title || `对话 ${conversation.id}`, li);
+        });
+
+        li.appendChild(contentDiv);
+        li.appendChild(deleteBtn);
+        
+        // 点击加载对话 (绑定到 contentDiv)
+        contentDiv.addEventListener('click', function() {
+            console.log('加载对话:', conversation.id, conversation.title);
+            loadConversation(conversation.id, conversation.title || `对话 ${conversation.id}`);
+        });
+        
+        return li;
+    }
+    
     // 加载特定对话
     async function loadConversation(conversationId, title) {
         console.log('开始加载对话:', conversationId, title);
@@ -127,9 +249,9 @@ document.addEventListener('DOMContentLoaded', function() {
             // 调用API加载对话到后端状态
             const response = await fetch('/conversations/load', {
                 method: 'POST',
-                headers: {
+                headers: API.sessionHeaders({
                     'Content-Type': 'application/json'
-                },
+                }),
                 body: JSON.stringify({
                     conversation_id: conversationId
                 })
@@ -170,6 +292,7 @@ document.addEventListener('DOMContentLoaded', function() {
             try {
                 response = await fetch(`/conversations/${conversationId}/delete`, {
                     method: 'POST',
+                    headers: API.sessionHeaders()
                 });
             } catch (e) {
                 // 如果新API路径失败，尝试旧API路径
@@ -196,7 +319,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 // 从列表中移除该项
                 listItemElement.remove();
                 // 检查列表是否为空
-                if (historyList.children.length === 0) {
+                if (!historyList.querySelector('.history-item') && !nextCursor) {
                    historyList.innerHTML = '<div style="text-align: center; padding: 20px; color: #666;">暂无历史对话</div>';
                 }
                 // 可选：如果删除的是当前加载的对话，可以清空聊天界面或加载默认对话
@@ -215,7 +338,8 @@ document.addEventListener('DOMContentLoaded', function() {
     async function loadConversationDetail(conversationId) {
         console.log('获取对话详情:', conversationId);
         try {
-            const data = await API.getConversationDetail(conversationId);
+            // 这里只渲染用户和助手消息，不需要工具结果内容
+            const data = await API.getConversationDetail(conversationId, { include_tool_results: false });
             console.log('获取到对话详情:', data);
             
             if (data.status !== 'ok' || !data.conversation) {
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from mini_cursor.api.admission import AdmissionController
+
+
+def test_turns_without_workspace_are_not_limited_per_workspace():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=8, max_queued=8, max_per_workspace=2, queue_timeout=1)
+        tickets = [await controller.acquire() for _ in range(3)]
+        assert controller.active == 3
+        for ticket in tickets:
+            ticket.release()
+        assert controller.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_turns_over_workspace_limit_are_rejected_with_retry_after():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=8, max_queued=8, max_per_workspace=2, queue_timeout=1)
+        tickets = [await controller.acquire("/repo"), await controller.acquire("/repo")]
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire("/repo")
+        assert error.value.status_code == 429
+        assert int(error.value.headers["Retry-After"]) >= 1
+        assert controller.rejected_workspace == 1
+
+        tickets[0].release()
+        tickets.append(await controller.acquire("/repo"))
+        for ticket in tickets:
+            ticket.release()
+        assert controller.workspace_turns == {}
+
+    asyncio.run(scenario())
+
+
+def test_second_request_in_same_session_is_rejected_while_first_runs():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=8, max_queued=8, max_per_workspace=2, queue_timeout=1)
+        session_lock = asyncio.Lock()
+        ticket = await controller.acquire(session_lock=session_lock)
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire(session_lock=session_lock)
+        assert error.value.status_code == 429
+        assert "Retry-After" in error.value.headers
+        assert controller.queued == 0
+
+        ticket.release()
+        assert not session_lock.locked()
+        (await controller.acquire(session_lock=session_lock)).release()
+
+    asyncio.run(scenario())
+
+
+def test_request_queued_behind_full_server_holds_its_session():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queued=8, max_per_workspace=2, queue_timeout=1)
+        running = await controller.acquire(session_lock=asyncio.Lock())
+        session_lock = asyncio.Lock()
+        queued = asyncio.create_task(controller.acquire(session_lock=session_lock))
+        await asyncio.sleep(0.01)
+        assert controller.queued == 1
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire(session_lock=session_lock)
+        assert error.value.status_code == 429
+
+        running.release()
+        (await queued).release()
+        assert not session_lock.locked()
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_releases_workspace_and_session():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queued=8, max_per_workspace=2, queue_timeout=0.05)
+        ticket = await controller.acquire("/repo")
+        session_lock = asyncio.Lock()
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire("/repo", session_lock)
+        assert error.value.status_code == 503
+        assert controller.workspace_turns["/repo"] == 1
+        assert not session_lock.locked()
+        ticket.release()
+        assert controller.workspace_turns == {}
+        assert controller.queued == 0
+
+    asyncio.run(scenario())
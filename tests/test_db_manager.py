@@ -0,0 +1,163 @@
+import json
+import sqlite3
+
+import pytest
+
+from mini_cursor.core.database.db_manager import SCHEMA_VERSION, DatabaseManager
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / "conversations.db"))
+    yield manager
+    manager.close()
+
+
+def test_resumed_legacy_conversation_keeps_pre_upgrade_turns(db):
+    # 升级前保存的轮次只有messages表中的文本
+    conversation_id = db.save_turn(None, "first question", "first answer")
+    db.save_turn(conversation_id, "second question", "second answer")
+    # 升级后继续对话，只有新轮次有原始消息
+    db.save_turn(conversation_id, "third question", "third answer", chat_messages=[
+        {"role": "user", "content": "third question"},
+        {"role": "assistant", "content": "third answer"},
+    ])
+
+    messages = db.get_chat_messages(conversation_id)
+
+    assert [message["content"] for message in messages] == [
+        "first question", "first answer", "second question", "second answer", "third question", "third answer",
+    ]
+    assert len(db.get_chat_messages(conversation_id, fill_legacy=False)) == 2
+
+
+def test_chat_messages_without_legacy_gap_are_returned_as_saved(db):
+    tool_round = [
+        {"role": "user", "content": "read a.py"},
+        {"role": "assistant", "content": "", "tool_calls": [
+            {"id": "call_0", "type": "function", "function": {"name": "read_file", "arguments": "{}"}},
+        ]},
+        {"role": "tool", "tool_call_id": "call_0", "content": "print('a')"},
+        {"role": "assistant", "content": "done"},
+    ]
+    conversation_id = db.save_turn(None, "read a.py", "done", chat_messages=tool_round)
+
+    assert db.get_chat_messages(conversation_id) == tool_round
+
+
+def _create_legacy_database(db_path, conversations):
+    """升级前的数据库：整个对话保存为conversations.content中的JSON"""
+    conn = sqlite3.connect(str(db_path))
+    conn.execute(
+        "CREATE TABLE conversations (id TEXT PRIMARY KEY, title TEXT, content TEXT, created_at TIMESTAMP, "
+        "updated_at TIMESTAMP, summary TEXT, turns INTEGER)"
+    )
+    conn.executemany(
+        "INSERT INTO conversations (id, title, content, created_at, updated_at, summary, turns) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(conversation_id, "legacy", json.dumps(content), "2024-01-01 00:00:00", "2024-01-01 00:00:00", "", 1)
+         for conversation_id, content in conversations.items()]
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_migrates_json_content_to_message_rows(tmp_path):
+    db_path = tmp_path / "conversations.db"
+    _create_legacy_database(db_path, {
+        "c1": {"system_prompt": "be helpful", "messages": [
+            {"sender": "user", "content": "hi", "timestamp": "t1"},
+            {"sender": "assistant", "content": "hello", "timestamp": "t2"},
+            {"sender": "tool", "tool_name": "read_file", "tool_args": "{}", "tool_result": "ok", "is_error": False},
+        ]},
+        "broken": None,
+    })
+    with sqlite3.connect(str(db_path)) as conn:
+        conn.execute("UPDATE conversations SET content = 'not json' WHERE id = 'broken'")
+
+    db = DatabaseManager(str(db_path))
+    try:
+        conversation = db.get_conversation("c1")
+        messages = conversation["content"]["messages"]
+        assert [(message["seq"], message["sender"]) for message in messages] == [(1, "user"), (2, "assistant"), (3, "tool")]
+        assert messages[2]["tool_result"] == "ok"
+        assert conversation["content"]["system_prompt"] == "be helpful"
+        assert db.conn.execute("SELECT content FROM conversations WHERE id = 'c1'").fetchone()[0] is None
+        assert db.conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    finally:
+        db.close()
+
+    # 再次打开时不会重复迁移
+    db = DatabaseManager(str(db_path))
+    try:
+        assert len(db.get_conversation("c1")["content"]["messages"]) == 3
+    finally:
+        db.close()
+
+
+def test_migrates_large_tool_results_to_blobs(tmp_path):
+    db_path = tmp_path / "conversations.db"
+    large_result = "line of output\n" * 1000
+    # 版本1的数据库：messages表还没有tool_result_hash列
+    conn = sqlite3.connect(str(db_path))
+    conn.execute(
+        "CREATE TABLE conversations (id TEXT PRIMARY KEY, title TEXT, content TEXT, created_at TIMESTAMP, "
+        "updated_at TIMESTAMP, summary TEXT, turns INTEGER, system_prompt TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, conversation_id TEXT NOT NULL, seq INTEGER NOT NULL, "
+        "sender TEXT NOT NULL, content TEXT, tool_name TEXT, tool_args TEXT, tool_result TEXT, "
+        "is_error INTEGER NOT NULL DEFAULT 0, timestamp TEXT)"
+    )
+    conn.execute("INSERT INTO conversations (id, title, turns) VALUES ('c1', 'v1', 1)")
+    conn.executemany(
+        "INSERT INTO messages (conversation_id, seq, sender, tool_name, tool_args, tool_result) VALUES ('c1', ?, 'tool', 'run', '{}', ?)",
+        [(1, large_result), (2, "small"), (3, large_result)]
+    )
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(str(db_path), blob_threshold=1024)
+    try:
+        rows = db.conn.execute("SELECT tool_result, tool_result_hash FROM messages ORDER BY seq").fetchall()
+        assert rows[0]["tool_result"] is None and rows[0]["tool_result_hash"] is not None
+        assert tuple(rows[1]) == ("small", None)
+        # 相同内容只保存一份
+        assert rows[0]["tool_result_hash"] == rows[2]["tool_result_hash"]
+        assert db.conn.execute("SELECT count(*) FROM blobs").fetchone()[0] == 1
+
+        messages = db.get_conversation("c1")["content"]["messages"]
+        assert [message["tool_result"] for message in messages] == [large_result, "small", large_result]
+        assert db.get_tool_result("c1", 3) == large_result
+    finally:
+        db.close()
+
+
+def test_keyset_pagination_walks_every_conversation_once(db):
+    conversation_ids = [db.create_conversation(f"c{index}") for index in range(7)]
+    # 相同的updated_at按id排序，不会在翻页时重复或遗漏
+    with db.conn:
+        db.conn.executemany(
+            "UPDATE conversations SET updated_at = ? WHERE id = ?",
+            [("2024-01-01 00:00:00" if index < 4 else f"2024-01-0{index} 00:00:00", conversation_id)
+             for index, conversation_id in enumerate(conversation_ids)]
+        )
+
+    pages, cursor = [], None
+    while True:
+        page = db.get_conversations_page(limit=3, cursor=cursor)
+        pages.append([item["id"] for item in page["items"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    seen = [conversation_id for page in pages for conversation_id in page]
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sorted(seen) == sorted(conversation_ids)
+    assert seen[:3] == conversation_ids[6:3:-1]
+    assert seen[3:] == sorted(conversation_ids[:4], reverse=True)
+
+
+def test_invalid_pagination_cursor_raises_value_error(db):
+    with pytest.raises(ValueError):
+        db.get_conversations_page(limit=3, cursor="not-a-cursor")
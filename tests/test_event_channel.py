@@ -0,0 +1,62 @@
+import asyncio
+
+from mini_cursor.api.event_channel import ChannelOverflowError, EventChannel
+
+
+async def _drain(channel):
+    return [event async for event in channel]
+
+
+def test_coalesces_deltas_when_event_limit_is_reached():
+    async def scenario():
+        channel = EventChannel(max_size=2, policy="coalesce")
+        for index in range(5):
+            channel.put("assistant_message", str(index))
+        channel.close()
+        return await _drain(channel)
+
+    events = asyncio.run(scenario())
+    assert [event["data"] for event in events] == ["0", "1234"]
+
+
+def test_coalesced_tail_is_bounded_by_bytes():
+    async def scenario():
+        cancelled = []
+        channel = EventChannel(max_size=1, policy="coalesce", max_bytes=100, on_overflow=lambda: cancelled.append(True))
+        for _ in range(20):
+            channel.put("assistant_message", "x" * 10)
+        events = await _drain(channel)
+        return channel, events, cancelled
+
+    channel, events, cancelled = asyncio.run(scenario())
+    assert cancelled == [True]
+    assert isinstance(channel.error, ChannelOverflowError)
+    assert sum(len(event["data"]) for event in events) <= 100
+
+
+def test_control_events_count_against_limits():
+    async def scenario():
+        cancelled = []
+        channel = EventChannel(max_size=2, policy="cancel", on_overflow=lambda: cancelled.append(True))
+        channel.put("tool_call", {"id": "call_0", "name": "read_file"})
+        channel.put("tool_result", {"id": "call_0", "result": "ok"})
+        channel.put("tool_call", {"id": "call_1", "name": "read_file"})
+        events = await _drain(channel)
+        return channel, events, cancelled
+
+    channel, events, cancelled = asyncio.run(scenario())
+    assert cancelled == [True]
+    assert len(events) == 2
+
+
+def test_drop_thinking_keeps_control_events_within_byte_limit():
+    async def scenario():
+        channel = EventChannel(max_size=100, policy="drop_thinking", max_bytes=60)
+        channel.put("thinking", "t" * 40)
+        channel.put("thinking", "t" * 40)
+        channel.put("tool_call", {"id": "call_0"})
+        channel.close()
+        return await _drain(channel)
+
+    events = asyncio.run(scenario())
+    assert [event["type"] for event in events] == ["thinking", "tool_call"]
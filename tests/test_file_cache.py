@@ -0,0 +1,66 @@
+from array import array
+
+from mini_cursor.core.cursor_mcp_all import NON_TEXT_ENTRY_BYTES, FileCache, FileText, get_file_content
+
+
+def _text(size):
+    return FileText("unused", b"x" * size, array("I", [0, size]))
+
+
+def test_lru_evicts_least_recently_used_and_tracks_bytes():
+    first, second, third = _text(400), _text(400), _text(400)
+    cache = FileCache(max_bytes=first.nbytes * 2 + 10)
+    cache.store("a", (1, 400, 1), first)
+    cache.store("b", (1, 400, 2), second)
+    assert cache.lookup("a", (1, 400, 1)) == (True, first)
+
+    cache.store("c", (1, 400, 3), third)
+
+    assert cache.lookup("b", (1, 400, 2)) == (False, None)
+    assert cache.lookup("a", (1, 400, 1))[0]
+    assert cache.current_bytes == first.nbytes + third.nbytes
+    assert cache.stats()["evictions"] == 1
+
+
+def test_replacing_and_invalidating_entries_keep_byte_count():
+    cache = FileCache(max_bytes=10 ** 6)
+    cache.store("a", (1, 10, 1), _text(10))
+    cache.store("a", (2, 500, 1), _text(500))
+    assert cache.current_bytes == _text(500).nbytes
+
+    cache.store("binary", (1, 10, 2), None)
+    assert cache.current_bytes == _text(500).nbytes + NON_TEXT_ENTRY_BYTES
+
+    cache.invalidate("a")
+    cache.invalidate("missing")
+    assert cache.current_bytes == NON_TEXT_ENTRY_BYTES
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_signature_mismatch_drops_entry():
+    cache = FileCache(max_bytes=10 ** 6)
+    cache.store("a", (1, 10, 1), _text(10))
+
+    assert cache.lookup("a", (2, 10, 1)) == (False, None)
+    assert cache.current_bytes == 0
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_entry_larger_than_cache_is_not_stored():
+    cache = FileCache(max_bytes=100)
+    cache.store("big", (1, 1000, 1), _text(1000))
+
+    assert cache.current_bytes == 0
+    assert cache.stats()["entries"] == 0
+
+
+def test_get_file_content_reloads_modified_file(tmp_path):
+    file_path = tmp_path / "a.py"
+    file_path.write_text("one\n")
+    cache = FileCache()
+    assert get_file_content(str(file_path), cache)[0] == "one\n"
+
+    file_path.write_text("one\ntwo\n")
+
+    assert list(get_file_content(str(file_path), cache)) == ["one\n", "two\n"]
+    assert cache.stats()["hits"] == 0
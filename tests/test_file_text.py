@@ -0,0 +1,82 @@
+import pytest
+
+from mini_cursor.core import cursor_mcp_all
+from mini_cursor.core.cursor_mcp_all import FileText
+
+
+def _load(tmp_path, data, inline_max_bytes=cursor_mcp_all.FILE_INLINE_MAX_BYTES):
+    file_path = tmp_path / "sample.txt"
+    file_path.write_bytes(data)
+    return FileText.load(str(file_path), inline_max_bytes=inline_max_bytes)
+
+
+@pytest.mark.parametrize("inline_max_bytes", [cursor_mcp_all.FILE_INLINE_MAX_BYTES, 0])
+def test_lines_match_readlines(tmp_path, inline_max_bytes):
+    data = b"first\r\nsecond\n\nlast without newline"
+    text = _load(tmp_path, data, inline_max_bytes)
+
+    with open(tmp_path / "sample.txt", "r", encoding="utf-8", newline=None) as f:
+        expected = f.readlines()
+    assert len(text) == 4
+    assert list(text) == expected
+    assert text[1:3] == expected[1:3]
+    assert text[-1] == "last without newline"
+    assert text.read_lines(0, 2) == "first\nsecond\n"
+    assert (text.data is None) == (inline_max_bytes == 0)
+
+
+def test_trailing_newline_does_not_add_a_line(tmp_path):
+    text = _load(tmp_path, b"a\nb\n")
+
+    assert len(text) == 2
+    assert list(text.offsets) == [0, 2, 4]
+
+
+def test_empty_file(tmp_path):
+    text = _load(tmp_path, b"")
+
+    assert len(text) == 0
+    assert list(text) == []
+
+
+def test_line_offsets_across_index_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(cursor_mcp_all, "LINE_INDEX_CHUNK_BYTES", 4)
+    lines = [b"alpha\n", b"b\n", b"\n", b"gamma-longer-than-a-chunk\n", b"tail"]
+    text = _load(tmp_path, b"".join(lines), inline_max_bytes=0)
+
+    assert len(text) == len(lines)
+    assert [line.encode() for line in text] == lines
+    assert text.read_bytes(3, 5) == b"gamma-longer-than-a-chunk\ntail"
+
+
+def test_out_of_range_access(tmp_path):
+    text = _load(tmp_path, b"only\n")
+
+    assert text.read_lines(5, 10) == ""
+    with pytest.raises(IndexError):
+        text[1]
+
+
+def test_crlf_split_across_index_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(cursor_mcp_all, "LINE_INDEX_CHUNK_BYTES", 3)
+    text = _load(tmp_path, b"ab\r\ncd\r\n", inline_max_bytes=0)
+
+    assert list(text) == ["ab\n", "cd\n"]
+
+
+@pytest.mark.parametrize("inline_max_bytes", [cursor_mcp_all.FILE_INLINE_MAX_BYTES, 0])
+def test_lone_carriage_return_is_a_line_break(tmp_path, inline_max_bytes):
+    text = _load(tmp_path, b"a\rb\nc\r\nd\n", inline_max_bytes)
+
+    with open(tmp_path / "sample.txt", "r", encoding="utf-8", newline=None) as f:
+        expected = f.readlines()
+    assert len(text) == 4
+    assert list(text) == expected
+    assert text.read_lines(0, 2) == "a\nb\n"
+
+
+def test_lone_carriage_returns_across_index_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(cursor_mcp_all, "LINE_INDEX_CHUNK_BYTES", 2)
+    text = _load(tmp_path, b"a\r\rb\r\n\r", inline_max_bytes=0)
+
+    assert list(text) == ["a\n", "\n", "b\n", "\n"]
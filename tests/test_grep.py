@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+from mini_cursor.core.cursor_mcp_all import calculate_match_score, compile_keyword_patterns, grep_files
+
+
+def _grep(tmp_path, text, keywords, top_k=10):
+    file_path = tmp_path / "sample.txt"
+    file_path.write_text(text, encoding="utf-8")
+    heap, truncated = grep_files([str(file_path)], keywords, top_k, 0, time.time() + 10)
+    assert not truncated
+    return sorted(((-negative_line, line, score) for score, _, negative_line, _, line in heap))
+
+
+@pytest.mark.parametrize("keywords, line", [
+    (["foo", "foobar"], "call foobar here"),
+    (["ab", "ba"], "abababa"),
+    (["handle", "request"], "Handle the REQUEST, then handle the next request"),
+    (["äpfel"], "ÄPFEL und Äpfel"),
+])
+def test_scores_match_per_keyword_baseline(tmp_path, keywords, line):
+    results = _grep(tmp_path, f"unrelated\n{line}\n", keywords)
+
+    assert results == [(2, line, calculate_match_score(line, compile_keyword_patterns(keywords)))]
+
+
+def test_prefix_keywords_score_like_baseline(tmp_path):
+    [(_, _, score)] = _grep(tmp_path, "call foobar here", ["foo", "foobar"])
+    assert score == 4
+
+
+def test_line_numbers_across_lines_and_last_line_without_newline(tmp_path):
+    text = "needle one\nnothing\n\nsecond NEEDLE\nlast needle"
+    results = _grep(tmp_path, text, ["needle"])
+    assert [(line_number, line) for line_number, line, _ in results] == [
+        (1, "needle one"), (4, "second NEEDLE"), (5, "last needle"),
+    ]
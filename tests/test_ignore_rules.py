@@ -0,0 +1,64 @@
+import os
+
+from mini_cursor.core.cursor_mcp_all import IgnoreRules, iter_workspace_files
+
+
+def test_unanchored_pattern_matches_at_any_depth():
+    rules = IgnoreRules(["*.log", "cache/"])
+
+    assert rules.match("debug.log", False) is True
+    assert rules.match("src/app/debug.log", False) is True
+    assert rules.match("src/cache", True) is True
+    assert rules.match("src/cache", False) is None
+    assert rules.match("src/app.py", False) is None
+
+
+def test_anchored_pattern_and_double_star():
+    rules = IgnoreRules(["/build", "docs/**/*.tmp", "a/**/b"])
+
+    assert rules.match("build", True) is True
+    assert rules.match("src/build", True) is None
+    assert rules.match("docs/x.tmp", False) is True
+    assert rules.match("docs/deep/nested/x.tmp", False) is True
+    assert rules.match("a/b", True) is True
+    assert rules.match("a/x/y/b", True) is True
+
+
+def test_negation_last_rule_wins():
+    rules = IgnoreRules(["*.env", "!example.env", "# comment", "", "secret/example.env"])
+
+    assert rules.match("prod.env", False) is True
+    assert rules.match("example.env", False) is False
+    assert rules.match("secret/example.env", False) is True
+
+
+def test_character_classes_and_escapes():
+    rules = IgnoreRules(["file[0-9].txt", "[!a]b", r"\#literal"])
+
+    assert rules.match("file3.txt", False) is True
+    assert rules.match("filex.txt", False) is None
+    assert rules.match("cb", False) is True
+    assert rules.match("ab", False) is None
+    assert rules.match("#literal", False) is True
+
+
+def test_walk_applies_nested_gitignore_and_reinclusion(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.log\nnode_modules/\n")
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / ".gitignore").write_text("!keep.log\ngenerated/\n")
+    (tmp_path / "src" / "app.py").write_text("")
+    (tmp_path / "src" / "keep.log").write_text("")
+    (tmp_path / "src" / "drop.log").write_text("")
+    (tmp_path / "src" / "generated").mkdir()
+    (tmp_path / "src" / "generated" / "out.py").write_text("")
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "dep.js").write_text("")
+    (tmp_path / "venv").mkdir()
+    (tmp_path / "env").mkdir()
+    (tmp_path / "env" / "pyvenv.cfg").write_text("")
+    (tmp_path / "env" / "lib.py").write_text("")
+
+    files = sorted(os.path.relpath(path, tmp_path) for path in iter_workspace_files(str(tmp_path)))
+
+    assert files == [".gitignore", os.path.join("src", ".gitignore"), os.path.join("src", "app.py"),
+                     os.path.join("src", "keep.log")]
@@ -0,0 +1,64 @@
+from mini_cursor.core.message_manager import MessageManager
+
+
+def _tool_round(call_id, result):
+    assistant = {
+        "role": "assistant",
+        "content": "",
+        "tool_calls": [{"id": call_id, "type": "function", "function": {"name": "read_file", "arguments": "{}"}}],
+    }
+    tool = {"role": "tool", "tool_call_id": call_id, "content": result}
+    return assistant, tool
+
+
+def test_trim_keeps_system_message_and_latest_unit():
+    manager = MessageManager(max_context_tokens=50)
+    manager.add_user_message("old question " * 40, "system")
+    manager.add_assistant_message({"role": "assistant", "content": "old answer " * 40})
+    manager.add_user_message("new question", "system")
+
+    history = manager.get_messages()
+    assert history[0]["role"] == "system"
+    assert history[-1]["content"] == "new question"
+    assert all("old" not in message["content"] for message in history[1:])
+
+
+def test_trim_removes_tool_calls_together_with_results():
+    manager = MessageManager(max_context_tokens=10 ** 6)
+    manager.add_user_message("question", "system")
+    for index in range(3):
+        assistant, tool = _tool_round(f"call_{index}", "x" * 400)
+        manager.add_assistant_message(assistant)
+        manager.add_tool_result(tool["tool_call_id"], tool["content"])
+
+    manager.trim_message_history(max_tokens=250)
+
+    history = manager.get_messages()
+    for index, message in enumerate(history):
+        if message["role"] == "tool":
+            previous = history[index - 1]
+            assert previous["role"] in ("assistant", "tool")
+            if previous["role"] == "assistant":
+                assert previous["tool_calls"][0]["id"] == message["tool_call_id"]
+    assert history[1]["role"] != "tool"
+
+
+def test_trim_inside_tool_loop_keeps_pinned_user_message():
+    manager = MessageManager(max_context_tokens=10 ** 6)
+    manager.add_user_message("earlier turn " * 50, "system")
+    manager.add_assistant_message({"role": "assistant", "content": "earlier answer " * 50})
+    history = manager.add_user_message("current task", "system")
+    user_message = history[-1]
+    for index in range(4):
+        assistant, tool = _tool_round(f"call_{index}", "y" * 2000)
+        manager.add_assistant_message(assistant)
+        manager.add_tool_result(tool["tool_call_id"], tool["content"])
+
+    removed = manager.trim_message_history(max_tokens=1200, pinned=user_message)
+
+    history = manager.get_messages()
+    assert removed > 0
+    assert any(message is user_message for message in history)
+    assert history[-1]["tool_call_id"] == "call_3"
+    assert manager.total_tokens() <= 1200
+    assert all("earlier" not in (message.get("content") or "") for message in history)
@@ -0,0 +1,112 @@
+import base64
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from mini_cursor.core.database import retention
+from mini_cursor.core.database.db_manager import DatabaseManager
+from mini_cursor.core.database.retention import RetentionManager, RetentionPolicy, read_archive
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / "conversations.db"), blob_threshold=64)
+    yield manager
+    manager.close()
+
+
+def _age(db, conversation_id, days):
+    with db.conn:
+        db.conn.execute(
+            "UPDATE conversations SET updated_at = ? WHERE id = ?",
+            (datetime.now() - timedelta(days=days), conversation_id)
+        )
+
+
+def _save(db, text):
+    return db.save_turn(None, text, "answer", tool_calls=[
+        {"tool_name": "run", "tool_args": "{}", "tool_result": text * 50},
+    ], chat_messages=[{"role": "user", "content": text}])
+
+
+def test_archives_expired_conversations_then_deletes_them(db, tmp_path):
+    old_id, recent_id = _save(db, "old question"), _save(db, "recent question")
+    _age(db, old_id, 40)
+    policy = RetentionPolicy(max_age_days=30, max_size_mb=0, archive_dir=str(tmp_path / "archive"))
+
+    report = RetentionManager(db, policy).run()
+
+    assert report.archived == 1
+    [archived] = read_archive(report.archive_files[0])
+    assert archived["id"] == old_id
+    assert archived["content"]["messages"][2]["tool_result"] == "old question" * 50
+    assert archived["chat_messages"] == [{"role": "user", "content": "old question"}]
+    assert db.get_conversation(old_id) is None
+    assert db.get_conversation(recent_id) is not None
+    # 只被已删除对话引用的blob一起删除
+    assert db.conn.execute("SELECT count(*) FROM blobs").fetchone()[0] == 1
+
+
+def test_dry_run_does_not_write_or_delete(db, tmp_path):
+    old_id = _save(db, "old question")
+    _age(db, old_id, 40)
+    policy = RetentionPolicy(max_age_days=30, max_size_mb=0, archive_dir=str(tmp_path / "archive"))
+
+    report = RetentionManager(db, policy).run(dry_run=True)
+
+    assert report.archived == 1
+    assert report.archive_files == []
+    assert not (tmp_path / "archive").exists()
+    assert db.get_conversation(old_id) is not None
+
+
+def test_failed_archive_write_keeps_conversations(db, tmp_path, monkeypatch):
+    old_id = _save(db, "old question")
+    _age(db, old_id, 40)
+    policy = RetentionPolicy(max_age_days=30, max_size_mb=0, archive_dir=str(tmp_path / "archive"))
+
+    def fail_fsync(fd):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(retention.os, "fsync", fail_fsync)
+    with pytest.raises(OSError):
+        RetentionManager(db, policy).run()
+
+    assert db.get_conversation(old_id) is not None
+
+
+def _save_incompressible(db, index):
+    text = base64.b64encode(os.urandom(30000)).decode()
+    conversation_id = db.save_turn(None, text, "answer", tool_calls=[
+        {"tool_name": "run", "tool_args": "{}", "tool_result": base64.b64encode(os.urandom(20000)).decode()},
+    ], chat_messages=[{"role": "user", "content": text}])
+    _age(db, conversation_id, 100 - index)
+    return conversation_id
+
+
+def test_size_limit_archives_only_part_of_history(db, tmp_path):
+    conversation_ids = [_save_incompressible(db, index) for index in range(30)]
+    live_mb = db.get_storage_stats()["live_bytes"] / 1024 / 1024
+    policy = RetentionPolicy(max_age_days=0, max_size_mb=int(live_mb / 2), archive_dir=str(tmp_path / "archive"))
+    manager = RetentionManager(db, policy)
+
+    planned = manager.run(dry_run=True).archived
+    report = manager.run()
+
+    assert report.archived == planned
+    assert 0 < report.archived < len(conversation_ids)
+    assert report.size_after["live_bytes"] <= policy.max_size_mb * 1024 * 1024
+    archived_ids = [conversation["id"] for conversation in read_archive(report.archive_files[0])]
+    assert archived_ids == conversation_ids[:report.archived]
+
+
+def test_size_limit_keeps_recent_conversations(db, tmp_path, monkeypatch):
+    conversation_ids = [_save(db, f"question {index}") for index in range(12)]
+    for index, conversation_id in enumerate(conversation_ids):
+        _age(db, conversation_id, 100 - index)
+    policy = RetentionPolicy(max_age_days=0, max_size_mb=1, archive_dir=str(tmp_path / "archive"), keep_recent=10)
+    # 上限远小于数据库时也至少保留最近的keep_recent个对话
+    monkeypatch.setattr(db, "get_storage_stats", lambda: {"live_bytes": 10 ** 9})
+
+    assert RetentionManager(db, policy).select_over_size(set()) == conversation_ids[:2]
@@ -0,0 +1,36 @@
+import asyncio
+
+from mini_cursor.api.session_manager import ChatSession, SessionManager
+
+
+class FakeClient:
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.closed = False
+
+    async def close(self):
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.closed = True
+
+
+def test_close_all_waits_for_evicted_sessions():
+    async def scenario():
+        manager = SessionManager(max_sessions=1, idle_timeout=3600)
+        evicted = FakeClient(delay=0.05)
+        failing = FakeClient(delay=0.01, error=RuntimeError("boom"))
+        manager.sessions["old"] = ChatSession(session_id="old", client=evicted)
+        manager.sessions["older"] = ChatSession(session_id="older", client=failing)
+        manager.sessions["new"] = ChatSession(session_id="new", client=FakeClient())
+
+        manager._evict(keep="new")
+        assert list(manager.sessions) == ["new"]
+        assert len(manager._closing) == 2
+
+        await manager.close_all()
+        assert evicted.closed
+        assert not manager._closing
+
+    asyncio.run(scenario())
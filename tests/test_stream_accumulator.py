@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from mini_cursor.core.stream_accumulator import StreamAccumulator
+
+
+def _chunk(content=None, tool_calls=None):
+    delta = SimpleNamespace(content=content, reasoning_content=None, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta)])
+
+
+def _tool_delta(index, call_id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def test_accumulates_content_and_tool_calls():
+    accumulator = StreamAccumulator(debug_chunks=False, record_path="")
+    for chunk in [
+        _chunk(content="Hello, "),
+        _chunk(content="world"),
+        _chunk(tool_calls=[_tool_delta(0, "call_0", "read_file", '{"target_file": ')]),
+        _chunk(tool_calls=[_tool_delta(0, arguments='"a.py"}')]),
+    ]:
+        accumulator.feed(chunk)
+    accumulator.finish()
+
+    assert accumulator.content == "Hello, world"
+    tool_calls = accumulator.tool_calls.get_tool_calls()
+    assert tool_calls[0]["id"] == "call_0"
+    assert tool_calls[0]["function"]["arguments"] == '{"target_file": "a.py"}'
+
+
+def test_record_file_closed_when_stream_fails(tmp_path):
+    record_path = tmp_path / "chunks.jsonl"
+
+    with pytest.raises(RuntimeError):
+        with StreamAccumulator(debug_chunks=False, record_path=str(record_path)) as accumulator:
+            accumulator.feed(_chunk(content="partial"))
+            raise RuntimeError("stream interrupted")
+
+    assert accumulator._record_file is None
+
+
+def test_close_is_idempotent_after_finish(tmp_path):
+    accumulator = StreamAccumulator(debug_chunks=False, record_path=str(tmp_path / "chunks.jsonl"))
+    accumulator.finish()
+    accumulator.close()
+    assert accumulator._record_file is None
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from mini_cursor.core import config, tool_broker
+from mini_cursor.core.tool_broker import BrokerServerManager
+from mini_cursor.core.tool_manager import ToolManager
+
+
+async def _start_fake_broker(socket_path, handle_request):
+    """只记录请求的代理：handle_request返回响应字典，返回None时不响应，返回"close"时断开连接"""
+    received = []
+
+    async def handle_connection(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            request = json.loads(line)
+            received.append(request)
+            response = handle_request(request)
+            if response == "close":
+                writer.close()
+                return
+            if response is not None:
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+
+    server = await asyncio.start_unix_server(handle_connection, path=socket_path)
+    return server, received
+
+
+def test_call_tool_not_retried_after_request_was_sent(tmp_path):
+    async def scenario():
+        socket_path = str(tmp_path / "broker.sock")
+        server, received = await _start_fake_broker(socket_path, lambda request: "close")
+        manager = BrokerServerManager(socket_path)
+        try:
+            with pytest.raises(ConnectionError):
+                await manager.execute_tool("files", "edit_file", {"target_file": "a.py"})
+        finally:
+            await manager.close()
+            server.close()
+        assert [request["tool"] for request in received] == ["edit_file"]
+
+    asyncio.run(scenario())
+
+
+def test_request_times_out_and_forgets_pending_future(tmp_path):
+    async def scenario():
+        socket_path = str(tmp_path / "broker.sock")
+        server, received = await _start_fake_broker(socket_path, lambda request: None)
+        manager = BrokerServerManager(socket_path)
+        try:
+            with pytest.raises(RuntimeError, match="did not respond"):
+                await manager._request("call_tool", timeout=0.05, server="files", tool="read_file", args={})
+            assert manager._pending == {}
+        finally:
+            await manager.close()
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_call_tool_returns_broker_result(tmp_path):
+    async def scenario():
+        socket_path = str(tmp_path / "broker.sock")
+        server, _ = await _start_fake_broker(socket_path, lambda request: {"id": request["id"], "result": "ok"})
+        manager = BrokerServerManager(socket_path)
+        try:
+            assert await manager.execute_tool("files", "read_file", {}) == "ok"
+        finally:
+            await manager.close()
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def _tool(name):
+    return {"name": name, "inputSchema": {"type": "object"}}
+
+
+def test_tools_relisted_when_broker_generation_changes(tmp_path):
+    async def scenario():
+        socket_path = str(tmp_path / "broker.sock")
+        state = {"generation": 1, "tools": [_tool("read_file")]}
+
+        def handle(request):
+            result = {"files": state["tools"]} if request["op"] == "list_tools" else "ok"
+            return {"id": request["id"], "generation": state["generation"], "result": result}
+
+        server, received = await _start_fake_broker(socket_path, handle)
+        manager = BrokerServerManager(socket_path)
+        tool_manager = ToolManager()
+        try:
+            await manager.connect_to_servers(tool_manager)
+            await manager.execute_tool("files", "read_file", {})
+            assert [request["op"] for request in received] == ["list_tools", "call_tool"]
+
+            # 另一个worker更新了配置
+            state.update(generation=2, tools=[_tool("read_file"), _tool("grep_search")])
+            await manager.execute_tool("files", "read_file", {})
+            await manager._refresh_task
+            assert set(tool_manager.server_tools["files"]) == {"read_file", "grep_search"}
+            assert manager.generation == 2
+        finally:
+            await manager.close()
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_tools_relisted_on_broker_notification(tmp_path):
+    async def scenario():
+        socket_path = str(tmp_path / "broker.sock")
+        state = {"generation": 1, "tools": [_tool("read_file")]}
+        connections = []
+
+        async def handle_connection(reader, writer):
+            connections.append(writer)
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                response = {"id": request["id"], "generation": state["generation"], "result": {"files": state["tools"]}}
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        server = await asyncio.start_unix_server(handle_connection, path=socket_path)
+        manager = BrokerServerManager(socket_path)
+        tool_manager = ToolManager()
+        try:
+            await manager.connect_to_servers(tool_manager)
+            state.update(generation=2, tools=[_tool("list_dir")])
+            connections[0].write(json.dumps({"event": "tools_changed", "generation": 2}).encode("utf-8") + b"\n")
+            for _ in range(100):
+                if manager.generation == 2:
+                    break
+                await asyncio.sleep(0.01)
+            assert list(tool_manager.server_tools["files"]) == ["list_dir"]
+            assert tool_manager.find_tool_server("read_file") == (None, None)
+        finally:
+            await manager.close()
+            server.close()
+
+    asyncio.run(scenario())
+
+
+def test_default_socket_depends_on_config_path(monkeypatch):
+    monkeypatch.setattr(config, "MCP_CONFIG_FILE", "/opt/a/mcp_config.json")
+    first = config.default_tool_broker_socket()
+    monkeypatch.setattr(config, "MCP_CONFIG_FILE", "/opt/b/mcp_config.json")
+    second = config.default_tool_broker_socket()
+
+    assert first != second
+    assert os.path.basename(first).startswith(f"mini-cursor-tools-{os.getuid()}-")
+
+
+def test_broker_reconnect_changes_generation_even_on_failure(monkeypatch, tmp_path):
+    class FailingServerManager:
+        async def connect_to_servers(self, tool_manager):
+            raise RuntimeError("bad config")
+
+        async def close(self):
+            pass
+
+    async def scenario():
+        monkeypatch.setattr(tool_broker, "ServerManager", FailingServerManager)
+        broker = tool_broker.ToolBroker(str(tmp_path / "broker.sock"))
+        before = broker.generation
+        future = asyncio.get_running_loop().create_future()
+        await broker._reconnect(future)
+
+        assert broker.generation != before
+        assert isinstance(future.exception(), RuntimeError)
+        response = await broker._handle_request({"id": 1, "op": "list_tools"})
+        assert response == {"id": 1, "generation": broker.generation, "error": "bad config"}
+
+    asyncio.run(scenario())
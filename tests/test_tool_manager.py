@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+import mcp.types as types
+
+from mini_cursor.core.mcp_client import MCPClient
+from mini_cursor.core.tool_manager import ToolManager
+
+
+def _tool(name, annotations=None):
+    return types.Tool(name=name, description=name, inputSchema={"type": "object"}, annotations=annotations)
+
+
+def _manager():
+    manager = ToolManager()
+    manager.set_server_tools("files", [_tool("read_file"), _tool("edit_file")])
+    manager.set_server_tools("other", [
+        _tool("write_file"),
+        _tool("move_file", types.ToolAnnotations(destructiveHint=False)),
+        _tool("query_db", types.ToolAnnotations(readOnlyHint=True)),
+    ])
+    return manager
+
+
+def test_only_allowlisted_or_annotated_read_only_tools_run_concurrently():
+    manager = _manager()
+
+    assert manager.is_read_only_tool("read_file")
+    assert manager.is_read_only_tool("query_db")
+    assert not manager.is_read_only_tool("edit_file")
+    # 没有注解、或只声明destructiveHint=False的第三方工具仍然串行
+    assert manager.is_serial_tool("write_file")
+    assert manager.is_serial_tool("move_file")
+    assert manager.is_serial_tool("unknown_tool")
+
+
+def test_set_tool_serial_overrides_annotations():
+    manager = _manager()
+
+    manager.set_tool_serial("query_db")
+    assert manager.is_serial_tool("query_db")
+    manager.set_tool_serial("write_file", serial=False)
+    assert manager.is_read_only_tool("write_file")
+
+
+def test_unannotated_tools_keep_their_order():
+    events = []
+
+    async def execute(tool_call):
+        name = tool_call["function"]["name"]
+        events.append(("start", name))
+        await asyncio.sleep(0.01)
+        events.append(("end", name))
+        return name, {}
+
+    client = SimpleNamespace(tool_manager=_manager(), _execute_tool_call=execute)
+    tool_calls = [{"id": f"call_{index}", "function": {"name": name, "arguments": "{}"}}
+                  for index, name in enumerate(["write_file", "move_file"])]
+
+    outcomes = asyncio.run(MCPClient._dispatch_tool_calls(client, tool_calls))
+
+    assert [outcome[0] for outcome in outcomes] == ["write_file", "move_file"]
+    assert events == [("start", "write_file"), ("end", "write_file"), ("start", "move_file"), ("end", "move_file")]
+
+
+def test_only_read_only_tools_start_while_streaming():
+    async def scenario():
+        started = []
+
+        async def execute(tool_call):
+            started.append(tool_call["function"]["name"])
+            return "", {}
+
+        client = SimpleNamespace(tool_manager=_manager(), _execute_tool_call=execute)
+        assembler = SimpleNamespace(tool_calls=[
+            {"id": "call_0", "function": {"name": "read_file", "arguments": "{}"}},
+            {"id": "call_1", "function": {"name": "write_file", "arguments": "{}"}},
+            {"id": "call_2", "function": {"name": "query_db", "arguments": "{}"}},
+        ])
+        early_tool_tasks = {}
+        for index in range(3):
+            MCPClient._maybe_dispatch_early(client, assembler, index, early_tool_tasks)
+        await asyncio.gather(*early_tool_tasks.values())
+        return started
+
+    # write_file未声明只读，它和之后的调用都等到流结束后按顺序执行
+    assert asyncio.run(scenario()) == ["read_file"]
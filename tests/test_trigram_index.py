@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+
+import pytest
+
+from mini_cursor.core import cursor_mcp_all
+from mini_cursor.core.cursor_mcp_all import TrigramIndex
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    root = tmp_path / "workspace"
+    (root / "src").mkdir(parents=True)
+    (root / "src" / "app.py").write_text("def handle_request():\n    pass\n")
+    (root / "README.md").write_text("project readme\n")
+    return root
+
+
+@pytest.fixture
+def index(workspace, tmp_path):
+    index = TrigramIndex(str(workspace), index_dir=str(tmp_path / "index"))
+    yield index
+    if index._refresh_thread is not None:
+        index._refresh_thread.join()
+    index.conn.close()
+
+
+def _rel(index, paths):
+    return sorted(os.path.relpath(path, index.root) for path in paths)
+
+
+def test_refresh_indexes_paths_and_content(index):
+    assert index.search_paths("app.py") == [os.path.join("src", "app.py")]
+    assert _rel(index, index.candidate_files(["handle_request"])) == [os.path.join("src", "app.py")]
+
+
+def test_file_created_outside_edit_file_is_found_immediately(index, workspace):
+    index.ensure_fresh()
+    (workspace / "src" / "worker.py").write_text("def handle_job():\n    pass\n")
+
+    assert _rel(index, index.candidate_files(["handle_job"])) == [os.path.join("src", "worker.py")]
+
+
+def test_deleted_file_is_removed_from_index(index, workspace):
+    index.ensure_fresh()
+    (workspace / "src" / "app.py").unlink()
+
+    assert index.candidate_files(["handle_request"]) == []
+    assert index.search_paths("app.py") == []
+
+
+def test_in_place_modification_is_picked_up_after_mark_stale(index, workspace):
+    index.ensure_fresh()
+    with open(workspace / "README.md", "a") as readme:
+        readme.write("install instructions\n")
+    index.mark_stale()
+
+    assert _rel(index, index.candidate_files(["install instructions"])) == ["README.md"]
+
+
+def test_candidates_filtered_by_directory(index, workspace):
+    (workspace / "docs").mkdir()
+    (workspace / "docs" / "guide.md").write_text("handle_request is documented here\n")
+
+    assert _rel(index, index.candidate_files(["handle_request"], str(workspace / "src"))) == [os.path.join("src", "app.py")]
+    assert len(index.candidate_files(["handle_request"], str(workspace))) == 2
+
+
+def test_subdirectory_search_reuses_enclosing_index(index, workspace, monkeypatch):
+    monkeypatch.setattr(cursor_mcp_all.app_context, "indexes", {index.root: index})
+
+    assert cursor_mcp_all.find_workspace_index(str(workspace / "src")) is index
+    assert list(cursor_mcp_all.app_context.indexes) == [index.root]
+
+
+def _block_refresh(index, monkeypatch):
+    """让后续的刷新阻塞，直到返回的事件被设置"""
+    release = threading.Event()
+    refresh = index.refresh
+
+    def slow_refresh():
+        release.wait()
+        refresh()
+
+    monkeypatch.setattr(index, "refresh", slow_refresh)
+    return release
+
+
+def test_queries_scan_directories_until_first_build_finishes(index, workspace, monkeypatch):
+    monkeypatch.setattr(cursor_mcp_all, "INDEX_REFRESH_WAIT", 0.05)
+    release = _block_refresh(index, monkeypatch)
+
+    assert index.candidate_files(["handle_request"]) is None
+    assert index.search_paths("app.py") is None
+    candidates = cursor_mcp_all.get_search_candidates(str(workspace), ["handle_request"], cursor_mcp_all.FileCache(), index)
+    assert _rel(index, candidates) == ["README.md", os.path.join("src", "app.py")]
+
+    release.set()
+    index._refresh_thread.join()
+    assert index.search_paths("app.py") == [os.path.join("src", "app.py")]
+
+
+def test_stale_query_answers_from_old_index_without_waiting_for_refresh(index, workspace, monkeypatch):
+    index.ensure_fresh()
+    monkeypatch.setattr(cursor_mcp_all, "INDEX_REFRESH_WAIT", 0.05)
+    release = _block_refresh(index, monkeypatch)
+    (workspace / "src" / "worker.py").write_text("def handle_request_later():\n    pass\n")
+
+    started = time.monotonic()
+    assert _rel(index, index.candidate_files(["handle_request"])) == [os.path.join("src", "app.py")]
+    assert time.monotonic() - started < 1
+
+    release.set()
+    index._refresh_thread.join()
+    assert len(index.candidate_files(["handle_request"])) == 2
+
+
+def test_mark_stale_during_refresh_triggers_another_refresh(index, workspace, monkeypatch):
+    index.ensure_fresh()
+    monkeypatch.setattr(cursor_mcp_all, "INDEX_REFRESH_WAIT", 0.05)
+    # 在扫描开始之后阻塞
+    release = threading.Event()
+    index_batch = index._index_batch
+    monkeypatch.setattr(index, "_index_batch", lambda batch: release.wait() and index_batch(batch))
+    index.mark_stale()
+    index.ensure_fresh()
+
+    index.mark_stale()
+    release.set()
+    index._refresh_thread.join()
+    assert index.is_stale()